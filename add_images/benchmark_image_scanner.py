@@ -0,0 +1,72 @@
+"""
+Benchmark of image_scanner.scan on a synthetic images/ tree
+
+Builds <files> empty pictures in a temporary directory, spread over
+1000 users with two levels of tag directories, then times a scan with
+each worker count. The gain from more workers depends on the latency of
+the disk: on a local disk with a warm cache a single thread is fastest,
+as every directory read returns at once and the threads only add
+overhead. latency_ms adds a sleep to every directory read to mimic a
+network filesystem, where the workers overlap the waits.
+Run from add_images/: python benchmark_image_scanner.py [files] [latency_ms]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import image_scanner
+
+DEFAULT_FILES = 1_000_000
+DEFAULT_WORKERS = (1, 4, 16, 32)
+USERS = 1000
+TAGS = ('cat', 'dog', 'beach', 'city', 'food')
+
+
+def build_tree(root, files):
+    """
+    Creates files empty .png files under root/<user>/<tag>/<tag>/
+    """
+    per_user = max(files // USERS, 1)
+    for user in range(USERS):
+        for number in range(per_user):
+            tag_dir = os.path.join(root, f'user{user:04d}', TAGS[number % 5], TAGS[number // 5 % 5])
+            if number < 25:
+                os.makedirs(tag_dir, exist_ok=True)
+            picture_id = str(user * per_user + number + 1).zfill(10)
+            with open(os.path.join(tag_dir, picture_id + '.png'), 'wb'):
+                pass
+
+
+def with_latency(scan_directory, latency):
+    """
+    Wraps scan_directory to sleep latency seconds before each listing
+    """
+    def slow_scan_directory(user_id, path):
+        time.sleep(latency)
+        return scan_directory(user_id, path)
+    return slow_scan_directory
+
+
+def main(files, latency_ms):
+    """
+    Builds the tree and prints the scan time for each worker count
+    """
+    list_directory = image_scanner.scan_directory
+    if latency_ms:
+        list_directory = with_latency(list_directory, latency_ms / 1000)
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        build_tree(root, files)
+        print(f'Built {files:,} files in {time.perf_counter() - start:.1f}s')
+        for workers in DEFAULT_WORKERS:
+            start = time.perf_counter()
+            count = sum(1 for _ in image_scanner.scan(root, workers, list_directory=list_directory))
+            elapsed = time.perf_counter() - start
+            print(f'{workers:>3} workers: {count:,} pictures in {elapsed:.2f}s '
+                  f'({count / elapsed:,.0f} pictures/s)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
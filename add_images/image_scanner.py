@@ -0,0 +1,79 @@
+'''
+Parallel scan of the images/ tree
+
+Pictures are stored as images/<user_id>/<tag>/.../<picture_id>.png. Each
+directory is listed with os.scandir, by default one after the other in
+the calling thread. On network or slow disks, pass workers > 1 to list
+them with a pool of threads, so many directory reads wait on I/O at
+once; on a local disk the directory reads return at once and the
+threads only add overhead (see benchmark_image_scanner.py).
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+
+DEFAULT_WORKERS = 1
+SUFFIX = '.png'
+
+
+def scan_directory(user_id, path):
+    '''
+    Lists one directory of user_id
+
+    Returns the (user_id, picture_id, path) of its .png files and the
+    paths of its subdirectories. venv folders are skipped.
+    '''
+    pictures = []
+    subdirectories = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if 'venv' not in entry.name:
+                    subdirectories.append(entry.path)
+            elif entry.name.endswith(SUFFIX):
+                pictures.append((user_id, entry.name[:-len(SUFFIX)], entry.path))
+    return pictures, subdirectories
+
+
+def scan(root, workers=DEFAULT_WORKERS, user_ids=None, list_directory=scan_directory):
+    '''
+    Generator over the (user_id, picture_id, path) of every picture
+    under root, in no particular order
+
+    Only the directories of user_ids are scanned when it is given, and
+    users without a directory are skipped. workers is the number of
+    threads listing directories; with 1, the tree is scanned in the
+    calling thread. list_directory(user_id, path) lists one directory
+    in the way of scan_directory.
+    '''
+    if user_ids is None:
+        try:
+            with os.scandir(root) as entries:
+                user_ids = [entry.name for entry in entries if entry.is_dir()]
+        except FileNotFoundError:
+            return
+    directories = [(user_id, os.path.join(root, user_id)) for user_id in user_ids]
+    directories = [(user_id, path) for user_id, path in directories if os.path.isdir(path)]
+    if workers <= 1:
+        while directories:
+            user_id, path = directories.pop()
+            pictures, subdirectories = list_directory(user_id, path)
+            yield from pictures
+            directories.extend((user_id, subdirectory) for subdirectory in subdirectories)
+        return
+    results = SimpleQueue()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(user_id, path):
+            pool.submit(list_directory, user_id, path).add_done_callback(
+                lambda future: results.put((user_id, future)))
+        for user_id, path in directories:
+            submit(user_id, path)
+        outstanding = len(directories)
+        while outstanding:
+            user_id, future = results.get()
+            outstanding -= 1
+            pictures, subdirectories = future.result()
+            for subdirectory in subdirectories:
+                submit(user_id, subdirectory)
+            outstanding += len(subdirectories)
+            yield from pictures
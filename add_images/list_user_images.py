@@ -1,8 +1,10 @@
 import logging
 from datetime import datetime
 from pathlib import Path
-from peewee import IntegrityError
-from socialnetwork_model import picturetable, differences_table
+from peewee import IntegrityError, fn
+from socialnetwork_model import picturetable, picture_tags, picture_changes, differences_table
+
+PICTURE_ID_WIDTH = 10
 
 
 logger = logging.getLogger(__name__)
@@ -27,12 +29,10 @@ def add_picture(picture_id, user_id, tags):
     Adds a new user to the collection
     """
     try:
-        tags_formatted = ''
-
-        for i in tags:
-            tags_formatted = tags_formatted + '#' + i + ' '
-
-        picturetable.insert(picture_id=picture_id, user_id=user_id, tags=tags_formatted)
+        with picturetable.model_class._meta.database.atomic():  # pylint: disable=W0212
+            picturetable.insert(picture_id=picture_id, user_id=user_id, tags=format_tags(tags))
+            insert_tags(picture_id, tags)
+            picture_changes.insert(picture_id=picture_id, user_id=user_id)
         print('Picture added')
         logger.info('New picture added')
         add_to_dir(picture_id, user_id, tags)
@@ -44,6 +44,55 @@ def add_picture(picture_id, user_id, tags):
         return False
 
 
+def format_tags(tags):
+    """
+    Returns the tags column of a picture: '#tag ' for each tag
+    """
+    return ''.join(f'#{tag} ' for tag in tags)
+
+
+def insert_tags(picture_id, tags):
+    """
+    Adds one PictureTag row per distinct tag of a picture
+    """
+    rows = [{'picture_id': picture_id, 'tag': tag} for tag in dict.fromkeys(tags)]
+    if rows:
+        picture_tags.model_class.insert_many(rows).execute()
+
+
+def add_new_picture(user_id, tags, retries=5):
+    """
+    Adds a picture under the next free picture_id and returns that id
+
+    The id is one past MAX(picture_id), read through the primary key
+    index and inserted in the same IMMEDIATE transaction, which holds
+    the SQLite write lock: processes adding pictures at once queue up
+    instead of picking the same id. If an insert still fails, it is
+    retried up to retries times. Returns False if it never succeeds.
+    The picture is also written to the picturechange feed read by
+    reconcile_images.
+    """
+    model = picturetable.model_class
+    database = model._meta.database  # pylint: disable=W0212
+    for _ in range(retries):
+        try:
+            with database.atomic(lock_type='IMMEDIATE'):
+                last_id = model.select(fn.MAX(model.picture_id)).scalar()
+                picture_id = str(int(last_id or 0) + 1).zfill(PICTURE_ID_WIDTH)
+                picturetable.insert(picture_id=picture_id, user_id=user_id, tags=format_tags(tags))
+                insert_tags(picture_id, tags)
+                picture_changes.insert(picture_id=picture_id, user_id=user_id)
+        except IntegrityError:
+            logger.warning('Picture id taken, retrying')
+            continue
+        print('Picture added')
+        logger.info('New picture added')
+        add_to_dir(picture_id, user_id, tags)
+        return picture_id
+    logger.error('An error occurred')
+    return False
+
+
 def add_to_dir(picture_id, user_id, tags):
     try:
         # path = Path('/') / 'Users' / 'Emeka' / 'assignment_09-sirRockIII' / str(user_id)
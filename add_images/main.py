@@ -2,12 +2,16 @@
 main driver for a simple social network project.
 reconciles pictures in disk vs. database and adds to differencetable.
 '''
+import os
 from csv import DictReader
 from pathlib import Path
+from peewee import chunked
 import users
 import user_status
+import image_scanner
 import list_user_images
-from socialnetwork_model import ds
+import picture_manifest
+from socialnetwork_model import ds, DifferenceTable, PictureTable, PictureTag
 from log_decorator import log_function
 
 
@@ -200,28 +204,65 @@ def add_picture(user_id, tags):
             print('ERROR: Only letters, # and _ characters are allowed'
                   ' for the tags')
             return False
-    space_delete = tags.replace(" ", "")
-    x = space_delete.split('#')
-    if '' in x:
-        x.remove('')
+    x = parse_tags(tags)
     try:
         person = users.search_user(user_id)
         if person is None:
             print("ERROR: User does not exist.")
             return False
-        num = 1
-        while True:
-            num_format = str(num).zfill(10)
-            if find_picture(num_format) is False:
-                picture_id = num_format
-                break
-            num += 1
-        list_user_images.add_picture(picture_id, user_id, x)
-        return True
+        return list_user_images.add_new_picture(user_id, x) is not False
     except AttributeError:
         return False
 
 
+def parse_tags(tags):
+    """
+    Returns the list of tags in a '#tag1 #tag2' string
+    """
+    return [tag for tag in tags.replace(" ", "").split('#') if tag]
+
+
+def rebuild_picture_tags():
+    """
+    Rebuilds PictureTag from the tags column of PictureTable and returns
+    the number of tag rows
+
+    Run once on a database whose pictures were added before PictureTag
+    existed; pictures added since are indexed by add_new_picture.
+    """
+    rows = [{'picture_id': picture_id, 'tag': tag}
+            for picture_id, tags in PictureTable.select(PictureTable.picture_id, PictureTable.tags).tuples()
+            for tag in dict.fromkeys(parse_tags(tags))]
+    with PictureTag._meta.database.atomic():  # pylint: disable=W0212
+        PictureTag.delete().execute()
+        for chunk in chunked(rows, picture_manifest.ROW_CHUNK):
+            PictureTag.insert_many(chunk).execute()
+    return len(rows)
+
+
+def search_pictures_by_tags(tags, match="all"):
+    """
+    Returns the sorted picture_ids of the pictures tagged with tags
+
+    tags is a '#tag1 #tag2' string or an iterable of tags. With match
+    "all" a picture must have every tag, with "any" at least one. Each
+    tag is looked up on the (tag, picture_id) index of PictureTag and
+    the lookups are combined with INTERSECT or UNION in one query.
+    """
+    if isinstance(tags, str):
+        tags = parse_tags(tags)
+    if match not in ("all", "any"):
+        raise ValueError(f'match must be "all" or "any", not {match!r}')
+    lookups = [PictureTag.select(PictureTag.picture_id).where(PictureTag.tag == tag)
+               for tag in dict.fromkeys(tags)]
+    if not lookups:
+        return []
+    query = lookups[0]
+    for lookup in lookups[1:]:
+        query = query & lookup if match == "all" else query | lookup
+    return sorted(picture_id for (picture_id,) in query.tuples())
+
+
 def find_picture(picture_id):
     q = ds['picturetable'].find_one(picture_id=picture_id)
     if isinstance(q, dict):
@@ -229,73 +270,69 @@ def find_picture(picture_id):
     return False
 
 @log_function
-def list_images(user_id, reconcile=False):
-    disk_pics = []
-    try:
-        def list_user_image(_path):
-            if _path.is_file():
-                # Print out only python files
-                if _path.suffix == '.png':
-
-                    path_form = str(_path.absolute()).split('\\')
-                    if not reconcile:
-                        print((user_id, _path.absolute(), path_form[-1]))
-                    if reconcile:
-                        # disk_pics.append(path_form[-1].strip('.png'))
-                        disk_pics.append(_path.name.strip('.png'))
-            elif 'venv' in str(_path.absolute()):
-                # Skip the venv folders
-                pass
-            else:
-                # Since it's a directory, let's recurse into them
-                for i in _path.iterdir():
-                    list_user_image(i)
-
-        # Let's list files in our project folder
-        # path = Path('/') / 'Users' / 'Emeka' / 'assignment_09-sirRockIII' / str(user_id)
-        path = Path.cwd() / 'images' / str(user_id)
-        list_user_image(path)
-        if reconcile:
-            return {user_id: disk_pics}
-        return True
-    except FileNotFoundError:
+def list_images(user_id, reconcile=False, workers=image_scanner.DEFAULT_WORKERS):
+    """
+    Prints the (user_id, path, file name) of every picture of user_id on
+    disk, or with reconcile=True returns {user_id: [picture_id, ...]}
+
+    The user's tag directories are listed by image_scanner, in parallel
+    with workers threads if workers > 1 (for network disks). Returns
+    False if the user has no directory.
+    """
+    path = Path.cwd() / 'images' / str(user_id)
+    if not path.is_dir():
         print('ERROR: File not found')
         return False
+    disk_pics = []
+    for _, picture_id, picture_path in image_scanner.scan(path.parent, workers, [str(user_id)]):
+        if reconcile:
+            disk_pics.append(picture_id)
+        else:
+            print((user_id, picture_path, os.path.basename(picture_path)))
+    if reconcile:
+        return {user_id: disk_pics}
+    return True
 
 
-def reconcile_images():
-    all_users_db = []
-    u = list(ds['usertable'].all())
-    picture = []
-    all_user_pics_db = {}
-    all_user_pics_disk = {}
-    for i in u:
-        all_users_db.append(i['user_id'])
-    for user in all_users_db:
-        p = list(ds['picturetable'].find(user_id=user))
-        for pic in p:
-            picture.append(pic['picture_id'])
-        all_user_pics_db[user] = picture
-        try:
-            print(f'list images of {user}')
-            all_user_pics_disk.update(list_images(user, reconcile=True))
-        except:
-            print(f'FAIL DURING list images of {user}')
-            pass
-    pic_discrepancy = []
-    for user in all_users_db:
-        for i in all_user_pics_disk.get(user):
-            if i not in all_user_pics_db.get(user):
-                pic_discrepancy.append(i)
-        for i in all_user_pics_db.get(user):
-            if i not in all_user_pics_disk.get(user):
-                pic_discrepancy.append(i)
-    print(f'ATTENTION: {len(pic_discrepancy)} discrepancy when comparing disk to database records')
-    if len(pic_discrepancy) > 0:
-        for i in pic_discrepancy:
-            print(i)
-    for picture_id in pic_discrepancy:
-        get_user_id = ds['picturetable'].find_one(picture_id=picture_id)
-        print(get_user_id['user_id'])
-        list_user_images.add_to_diff(picture_id, get_user_id['user_id'])
+def reconcile_images(root=None, workers=image_scanner.DEFAULT_WORKERS, full=False):
+    """
+    Compares the pictures in the database with the .png files under
+    images/ and records every discrepancy in differencetable
+
+    The directories of the users in the database are checked against
+    the manifest of the last run by picture_manifest, with workers
+    threads on network disks, and only those whose mtime changed are listed again. Only
+    the pictures of those directories and of the picturechange feed are
+    compared with picturetable, so a run costs one stat per directory
+    plus time in proportion to the churn. With full=True, or on the
+    first run, the manifest is rebuilt and every picture is compared.
+    Discrepancies are recorded in batches of picture_manifest.ROW_CHUNK
+    rows, and the recorded ones that are resolved are removed.
+    """
+    root = Path.cwd() / 'images' if root is None else Path(root)
+    user_ids = {user_id for (user_id,) in ds.query('SELECT user_id FROM usertable')}
+    full = full or picture_manifest.is_empty()
+    last_change = picture_manifest.last_change()
+    if full:
+        picture_manifest.clear()
+    touched = picture_manifest.refresh(root, user_ids, workers)
+    picture_ids = None
+    if not full:
+        picture_ids = {picture_id for _, picture_id in touched | picture_manifest.changes(last_change)}
+    missing_on_disk, missing_in_db = picture_manifest.compare(picture_ids)
+    print(f'ATTENTION: {len(missing_on_disk) + len(missing_in_db)} discrepancy when comparing '
+          f'disk to database records: {len(missing_on_disk)} missing on disk, '
+          f'{len(missing_in_db)} missing in the database')
+    rows = [{'missing_picture_in_disk': picture_id, 'user_id': user_id}
+            for user_id, picture_id in sorted(missing_on_disk | missing_in_db)]
+    with DifferenceTable._meta.database.atomic():  # pylint: disable=W0212
+        if full:
+            DifferenceTable.delete().execute()
+        else:
+            resolved = picture_ids - {row['missing_picture_in_disk'] for row in rows}
+            for chunk in chunked(resolved, picture_manifest.KEY_CHUNK):
+                DifferenceTable.delete().where(DifferenceTable.missing_picture_in_disk.in_(chunk)).execute()
+        for chunk in chunked(rows, picture_manifest.ROW_CHUNK):
+            DifferenceTable.insert_many(chunk).on_conflict_ignore().execute()
+    picture_manifest.drop_changes(last_change)
     return True
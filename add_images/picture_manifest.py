@@ -0,0 +1,144 @@
+'''
+Persisted manifest of the images/ tree for incremental reconciles
+
+DirectoryManifest holds the mtime and the subdirectory names of every
+directory listed by the last reconcile, and DiskPicture the pictures
+found in each one. refresh() stats the known directories and lists again
+only those whose mtime changed, so the files of unchanged directories
+are never read. The pictures of the changed directories and of the
+picturechange feed are the only ones compared with picturetable.
+'''
+import os
+import time
+from peewee import chunked
+import image_scanner
+from socialnetwork_model import DirectoryManifest, DiskPicture, PictureChange, PictureTable
+
+# keys per "IN (...)" lookup and rows per insert, below SQLite's limit
+# on query parameters
+KEY_CHUNK = 500
+ROW_CHUNK = 100
+# a directory listed less than this long after it was modified may
+# change again within the same mtime tick, so its mtime is not trusted
+RACY_NS = 2_000_000_000
+SEPARATOR = '/'
+
+
+def is_empty():
+    '''
+    Returns True if no directory has been recorded yet
+    '''
+    return not DirectoryManifest.select().exists()
+
+
+def clear():
+    '''
+    Forgets every recorded directory and picture
+    '''
+    DiskPicture.delete().execute()
+    DirectoryManifest.delete().execute()
+
+
+def last_change():
+    '''
+    Returns the id of the newest row of the change feed, or 0
+    '''
+    return PictureChange.select(PictureChange.id).order_by(PictureChange.id.desc()).scalar() or 0
+
+
+def changes(last_id):
+    '''
+    Returns the (user_id, picture_id) pairs of the change feed up to last_id
+    '''
+    return set(PictureChange.select(PictureChange.user_id, PictureChange.picture_id)
+               .where(PictureChange.id <= last_id).tuples())
+
+
+def drop_changes(last_id):
+    '''
+    Removes the rows of the change feed up to last_id
+    '''
+    PictureChange.delete().where(PictureChange.id <= last_id).execute()
+
+
+def refresh(root, user_ids, workers=image_scanner.DEFAULT_WORKERS):
+    '''
+    Brings the manifest of the directories of user_ids under root up to
+    date and returns the (user_id, picture_id) pairs that were added to
+    or removed from a directory since the last refresh
+
+    Every known directory is stat-ed; its recorded subdirectories are
+    followed when its mtime is unchanged, and it is listed again with
+    image_scanner.scan_directory otherwise. Directories that are gone,
+    or belong to users not in user_ids, are dropped.
+    '''
+    started = time.time_ns()
+    known = dict(DirectoryManifest.select(DirectoryManifest.path, DirectoryManifest.mtime_ns).tuples())
+    subdirectories_of = {}
+    seen = set()
+    listed = {}
+
+    def list_directory(user_id, path):
+        relative = os.path.relpath(path, root)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return [], []
+        seen.add(relative)
+        if known.get(relative) == mtime_ns:
+            return [], [os.path.join(path, name) for name in subdirectories_of[relative]]
+        pictures, subdirectories = image_scanner.scan_directory(user_id, path)
+        if mtime_ns > started - RACY_NS:
+            mtime_ns = 0
+        listed[relative] = (user_id, mtime_ns, pictures, subdirectories)
+        return pictures, subdirectories
+
+    for path, names in DirectoryManifest.select(DirectoryManifest.path, DirectoryManifest.subdirectories).tuples():
+        subdirectories_of[path] = names.split(SEPARATOR) if names else []
+    for _ in image_scanner.scan(root, workers, user_ids, list_directory):
+        pass
+    changed = list(listed) + list(known.keys() - seen)
+    touched = set()
+    for chunk in chunked(changed, KEY_CHUNK):
+        touched.update(DiskPicture.select(DiskPicture.user_id, DiskPicture.picture_id)
+                       .where(DiskPicture.directory.in_(chunk)).tuples())
+    pictures = [{'directory': relative, 'picture_id': picture_id, 'user_id': user_id}
+                for relative, (_, _, found, _) in listed.items() for user_id, picture_id, _ in found]
+    directories = [{'path': relative, 'user_id': user_id, 'mtime_ns': mtime_ns,
+                    'subdirectories': SEPARATOR.join(os.path.basename(path) for path in subdirectories)}
+                   for relative, (user_id, mtime_ns, _, subdirectories) in listed.items()]
+    with DirectoryManifest._meta.database.atomic():  # pylint: disable=W0212
+        for chunk in chunked(changed, KEY_CHUNK):
+            DiskPicture.delete().where(DiskPicture.directory.in_(chunk)).execute()
+            DirectoryManifest.delete().where(DirectoryManifest.path.in_(chunk)).execute()
+        for chunk in chunked(pictures, ROW_CHUNK):
+            DiskPicture.insert_many(chunk).execute()
+        for chunk in chunked(directories, ROW_CHUNK):
+            DirectoryManifest.insert_many(chunk).execute()
+    touched.update((row['user_id'], row['picture_id']) for row in pictures)
+    return touched
+
+
+def lookup(model, picture_ids=None):
+    '''
+    Returns the (user_id, picture_id) pairs of model, a PictureTable or
+    DiskPicture, for picture_ids, or for every picture if it is None
+    '''
+    query = model.select(model.user_id, model.picture_id)
+    if picture_ids is None:
+        return set(query.tuples())
+    found = set()
+    for chunk in chunked(picture_ids, KEY_CHUNK):
+        found.update(query.where(model.picture_id.in_(chunk)).tuples())
+    return found
+
+
+def compare(picture_ids=None):
+    '''
+    Returns the (user_id, picture_id) pairs of picture_ids, or of every
+    picture if it is None, that are missing on disk and those that are
+    missing in the database
+    '''
+    in_database = lookup(PictureTable, picture_ids)
+    on_disk = lookup(DiskPicture, picture_ids)
+    return in_database - on_disk, on_disk - in_database
@@ -1,6 +1,7 @@
 from pathlib import Path
 
-from peewee import IntegrityError, SqliteDatabase, DoubleField, CharField, Model, ForeignKeyField
+from peewee import IntegrityError, SqliteDatabase, DoubleField, CharField, Model, ForeignKeyField, CompositeKey, \
+    IntegerField, TextField
 from playhouse.dataset import DataSet
 
 
@@ -50,6 +51,19 @@ class PictureTable(Model):
     user_id = ForeignKeyField(UserTable, backref="UserTable", on_delete="CASCADE")
     tags = CharField(max_length=100)
 
+class PictureTag(Model):
+    """
+    One row per tag of a picture; the (tag, picture_id) index answers
+    "pictures with tag X" without scanning PictureTable.tags
+    """
+    class Meta:
+        database = DataTables().__enter__().database
+        primary_key = CompositeKey('picture_id', 'tag')
+        indexes = ((('tag', 'picture_id'), True),)
+
+    picture_id = ForeignKeyField(PictureTable, backref="PictureTag", on_delete="CASCADE")
+    tag = CharField(max_length=100)
+
 class DifferenceTable(Model):
     class Meta:
         database = DataTables().__enter__().database
@@ -57,9 +71,49 @@ class DifferenceTable(Model):
     missing_picture_in_disk = CharField(primary_key=True, max_length=32)
     user_id = ForeignKeyField(UserTable, backref="UserTable", on_delete="CASCADE")
 
+# one connection for the manifest tables, which are written in one transaction
+manifest_database = DataTables().__enter__().database
+
+class DirectoryManifest(Model):
+    """
+    One row per directory under images/ listed by the last reconcile:
+    its mtime and the names of its subdirectories, '/' separated
+    """
+    class Meta:
+        database = manifest_database
+
+    path = CharField(primary_key=True)
+    user_id = CharField(max_length=30)
+    mtime_ns = IntegerField()
+    subdirectories = TextField()
+
+class DiskPicture(Model):
+    """
+    One row per .png file found in a directory of DirectoryManifest
+    """
+    class Meta:
+        database = manifest_database
+        primary_key = CompositeKey('directory', 'picture_id')
+        indexes = ((('picture_id',), False),)
+
+    directory = CharField()
+    picture_id = CharField(max_length=32)
+    user_id = CharField(max_length=30)
+
+class PictureChange(Model):
+    """
+    Change feed: one row per picture added since the last reconcile
+    """
+    class Meta:
+        database = DataTables().__enter__().database
+
+    picture_id = CharField(max_length=32)
+    user_id = CharField(max_length=30)
+
 
 with DataTables('user.db') as dt:
-    dt.database.create_tables(([UserTable, StatusTable, PictureTable, DifferenceTable]))
+    dt.database.create_tables(([UserTable, StatusTable, PictureTable, PictureTag, DifferenceTable,
+                               DirectoryManifest, DiskPicture, PictureChange]))
     ds = DataSet(dt.database)
     userstable = ds["usertable"]
     #userstable.delete()
@@ -67,7 +121,9 @@ with DataTables('user.db') as dt:
     #statustable.delete()
     picturetable = ds["picturetable"]
     #picturetable.delete()
+    picture_tags = ds["picturetag"]
     differences_table = ds["differencetable"]
+    picture_changes = ds["picturechange"]
     #differences_table.delete()
     # dt.database.close()
 
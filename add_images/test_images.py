@@ -0,0 +1,313 @@
+'''
+Tests for the pictures of add_images
+
+Importing the model opens user.db, and the loggers their log file, in
+the current directory, so the module first moves to a temporary one.
+Each test then points every database of the model at a fresh file and
+works in its own directory. Run from add_images/.
+'''
+# pylint: disable=C0413,W0212
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+from multiprocessing import get_context
+from unittest import TestCase
+from unittest.mock import patch
+
+# mtime given to the directories of the tests, so unchanged ones are skipped
+PAST = 1_000_000_000
+WORK_DIR = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(WORK_DIR.name)
+# the modules import social_network_model as socialnetwork_model
+sys.modules.setdefault('socialnetwork_model', importlib.import_module('social_network_model'))
+
+from peewee import IntegrityError
+import image_scanner
+import list_user_images
+import main
+import picture_manifest
+import social_network_model as model
+import users
+
+MODELS = [model.UserTable, model.StatusTable, model.PictureTable, model.PictureTag, model.DifferenceTable,
+          model.DirectoryManifest, model.DiskPicture, model.PictureChange]
+
+
+def use_database(directory):
+    '''
+    Moves to directory and points every database of the model at its
+    user.db, creating the tables
+    '''
+    os.chdir(directory)
+    filename = os.path.join(directory, 'user.db')
+    for database in {table._meta.database for table in MODELS} | {model.ds._database}:
+        database.close()
+        database.init(filename, pragmas={'foreign_keys': 1})
+    model.ds._database.create_tables(MODELS)
+
+
+def add_pictures(directory, count):
+    '''
+    Adds count pictures of ale314 from a new process and returns their ids
+    '''
+    use_database(directory)
+    with patch('sys.stdout', new_callable=io.StringIO):
+        return [list_user_images.add_new_picture('ale314', ['cat']) for _ in range(count)]
+
+
+class PictureTest(TestCase):
+    '''
+    Base class running each test on a fresh database and images/ tree
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(os.chdir, WORK_DIR.name)
+        use_database(self.tmp_dir.name)
+        os.mkdir('images')
+        stdout = patch('sys.stdout', new_callable=io.StringIO)
+        stdout.start()
+        self.addCleanup(stdout.stop)
+        users.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        users.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+
+    def picture_ids(self):
+        '''
+        Returns the sorted picture_ids of picturetable
+        '''
+        return sorted(row['picture_id'] for row in model.picturetable.all())
+
+
+class AddNewPictureTest(PictureTest):
+    '''
+    Unittests for allocating picture_ids
+    '''
+    def test_sequential_ids(self):
+        self.assertEqual(list_user_images.add_new_picture('ale314', ['cat', 'dog']), '0000000001')
+        self.assertEqual(list_user_images.add_new_picture('bryce05', []), '0000000002')
+        self.assertEqual(list_user_images.add_new_picture('ale314', ['cat']), '0000000003')
+        self.assertEqual(self.picture_ids(), ['0000000001', '0000000002', '0000000003'])
+        self.assertEqual(model.picturetable.find_one(picture_id='0000000001')['tags'], '#cat #dog ')
+        self.assertTrue(os.path.isfile(os.path.join('images', 'ale314', 'cat', 'dog', '0000000001.png')))
+
+    def test_retry_after_integrity_error(self):
+        insert = model.picturetable.insert
+        attempts = []
+
+        def insert_taken_once(**row):
+            attempts.append(row['picture_id'])
+            if len(attempts) == 1:
+                raise IntegrityError('UNIQUE constraint failed: picturetable.picture_id')
+            return insert(**row)
+
+        with patch.object(model.picturetable, 'insert', side_effect=insert_taken_once), \
+                self.assertLogs(list_user_images.logger, 'WARNING'):
+            self.assertEqual(list_user_images.add_new_picture('ale314', ['cat']), '0000000001')
+        self.assertEqual(attempts, ['0000000001', '0000000001'])
+        self.assertEqual(self.picture_ids(), ['0000000001'])
+
+    def test_gives_up_after_retries(self):
+        with patch.object(model.picturetable, 'insert', side_effect=IntegrityError('taken')) as insert, \
+                self.assertLogs(list_user_images.logger, 'WARNING'):
+            self.assertFalse(list_user_images.add_new_picture('ale314', ['cat'], retries=3))
+        self.assertEqual(insert.call_count, 3)
+        self.assertEqual(self.picture_ids(), [])
+
+    def test_processes_get_distinct_ids(self):
+        with get_context('spawn').Pool(4) as pool:
+            results = pool.starmap(add_pictures, [(self.tmp_dir.name, 10)] * 4)
+        picture_ids = [picture_id for result in results for picture_id in result]
+        self.assertEqual(sorted(picture_ids), [str(number).zfill(10) for number in range(1, 41)])
+        self.assertEqual(self.picture_ids(), sorted(picture_ids))
+
+    def test_add_picture(self):
+        self.assertTrue(main.add_picture('ale314', '#cat #dog'))
+        self.assertFalse(main.add_picture('ale314', '#cat-dog'))
+        self.assertFalse(main.add_picture('gru88', '#cat'))
+        self.assertEqual(self.picture_ids(), ['0000000001'])
+
+
+class TagSearchTest(PictureTest):
+    '''
+    Unittests for searching pictures by tag
+    '''
+    def setUp(self):
+        super().setUp()
+        for user_id, tags in (('ale314', ['cat', 'dog']), ('ale314', ['cat']),
+                              ('bryce05', ['dog', 'beach']), ('bryce05', ['cat', 'cat'])):
+            list_user_images.add_new_picture(user_id, tags)
+
+    def test_match_all(self):
+        self.assertEqual(main.search_pictures_by_tags('#cat #dog'), ['0000000001'])
+        self.assertEqual(main.search_pictures_by_tags(['cat']), ['0000000001', '0000000002', '0000000004'])
+        self.assertEqual(main.search_pictures_by_tags('#cat #beach'), [])
+
+    def test_match_any(self):
+        self.assertEqual(main.search_pictures_by_tags('#beach #dog', match='any'), ['0000000001', '0000000003'])
+        self.assertEqual(main.search_pictures_by_tags(['cat', 'beach'], match='any'),
+                         ['0000000001', '0000000002', '0000000003', '0000000004'])
+
+    def test_duplicate_tags(self):
+        self.assertEqual(main.search_pictures_by_tags('#cat #cat'), ['0000000001', '0000000002', '0000000004'])
+        self.assertEqual(main.search_pictures_by_tags('#dog #dog', match='any'), ['0000000001', '0000000003'])
+        self.assertEqual(model.PictureTag.select().where(model.PictureTag.picture_id == '0000000004').count(), 1)
+
+    def test_empty_and_unknown_tags(self):
+        self.assertEqual(main.search_pictures_by_tags(''), [])
+        self.assertEqual(main.search_pictures_by_tags([], match='any'), [])
+        self.assertEqual(main.search_pictures_by_tags('#bird'), [])
+        self.assertEqual(main.search_pictures_by_tags('#cat #bird'), [])
+        self.assertEqual(main.search_pictures_by_tags('#bird #beach', match='any'), ['0000000003'])
+        with self.assertRaises(ValueError):
+            main.search_pictures_by_tags('#cat', match='some')
+
+    def test_rebuild_picture_tags(self):
+        # pictures added before PictureTag existed have no tag rows
+        model.PictureTag.delete().execute()
+        model.PictureTable.insert(picture_id='0000000005', user_id='bryce05', tags='#beach #cat #beach ').execute()
+        self.assertEqual(main.search_pictures_by_tags('#cat'), [])
+        self.assertEqual(main.rebuild_picture_tags(), 8)
+        self.assertEqual(main.search_pictures_by_tags('#cat'),
+                         ['0000000001', '0000000002', '0000000004', '0000000005'])
+        self.assertEqual(main.search_pictures_by_tags('#beach #cat'), ['0000000005'])
+        self.assertEqual(main.rebuild_picture_tags(), 8)
+
+
+def backdate(root):
+    '''
+    Sets the mtime of every directory under root to PAST, old enough for
+    the manifest to trust it
+    '''
+    for path, _, _ in os.walk(root):
+        os.utime(path, (PAST, PAST))
+
+
+class ReconcileTest(PictureTest):
+    '''
+    Unittests for the incremental reconcile of images/ with picturetable
+    '''
+    def setUp(self):
+        super().setUp()
+        for user_id, tags in (('ale314', ['cat']), ('ale314', ['cat']), ('bryce05', ['dog', 'beach'])):
+            list_user_images.add_new_picture(user_id, tags)
+        backdate('images')
+        self.assertTrue(main.reconcile_images())
+
+    def differences(self):
+        '''
+        Returns the sorted (user_id, picture_id) rows of differencetable
+        '''
+        return sorted((row['user_id'], row['missing_picture_in_disk'])
+                      for row in model.differences_table.all())
+
+    def reconcile(self, **kwargs):
+        '''
+        Runs reconcile_images and returns the directories it listed
+        '''
+        with patch.object(image_scanner, 'scan_directory', wraps=image_scanner.scan_directory) as listing:
+            self.assertTrue(main.reconcile_images(**kwargs))
+        return sorted(os.path.relpath(call.args[1], 'images') for call in listing.call_args_list)
+
+    def test_first_run_builds_manifest(self):
+        self.assertEqual(self.differences(), [])
+        self.assertEqual(model.DiskPicture.select().count(), 3)
+        self.assertEqual(sorted(path for (path,) in model.DirectoryManifest.select(
+            model.DirectoryManifest.path).tuples()),
+            ['ale314', 'ale314/cat', 'bryce05', 'bryce05/dog', 'bryce05/dog/beach'])
+        self.assertEqual(model.PictureChange.select().count(), 0)
+
+    def test_unchanged_directories_are_not_listed(self):
+        self.assertEqual(self.reconcile(), [])
+        self.assertEqual(self.differences(), [])
+
+    def test_recently_changed_directory_is_listed_again(self):
+        os.remove(os.path.join('images', 'ale314', 'cat', '0000000002.png'))
+        self.assertEqual(self.reconcile(), ['ale314/cat'])
+        self.assertEqual(self.reconcile(), ['ale314/cat'])
+        backdate('images')
+        self.assertEqual(self.reconcile(), ['ale314/cat'])
+        self.assertEqual(self.reconcile(), [])
+
+    def test_file_removed(self):
+        os.remove(os.path.join('images', 'ale314', 'cat', '0000000002.png'))
+        self.assertEqual(self.reconcile(), ['ale314/cat'])
+        self.assertEqual(self.differences(), [('ale314', '0000000002')])
+
+    def test_differences_in_several_chunks(self):
+        moved = [os.path.join('images', 'ale314', 'cat', f'000000000{number}.png') for number in (1, 2)]
+        for name in moved:
+            os.rename(name, name + '.bak')
+        with patch.object(picture_manifest, 'ROW_CHUNK', 1), patch.object(picture_manifest, 'KEY_CHUNK', 1):
+            self.reconcile()
+            self.assertEqual(self.differences(), [('ale314', '0000000001'), ('ale314', '0000000002')])
+            for name in moved:
+                os.rename(name + '.bak', name)
+            self.reconcile()
+        self.assertEqual(self.differences(), [])
+
+    def test_file_added(self):
+        open(os.path.join('images', 'bryce05', 'dog', '0000000099.png'), 'wb').close()
+        self.assertEqual(self.reconcile(), ['bryce05/dog'])
+        self.assertEqual(self.differences(), [('bryce05', '0000000099')])
+
+    def test_directory_removed(self):
+        shutil.rmtree(os.path.join('images', 'bryce05', 'dog'))
+        self.assertEqual(self.reconcile(), ['bryce05'])
+        self.assertEqual(self.differences(), [('bryce05', '0000000003')])
+        self.assertEqual(model.DirectoryManifest.select().where(
+            model.DirectoryManifest.path.startswith('bryce05/')).count(), 0)
+        self.assertEqual(model.DiskPicture.select().where(model.DiskPicture.user_id == 'bryce05').count(), 0)
+
+    def test_picture_added_through_add_new_picture(self):
+        list_user_images.add_new_picture('bryce05', ['dog', 'beach'])
+        self.assertEqual(model.PictureChange.select().count(), 1)
+        self.assertEqual(self.reconcile(), ['bryce05/dog/beach'])
+        self.assertEqual(self.differences(), [])
+        self.assertEqual(model.PictureChange.select().count(), 0)
+
+    def test_change_feed_finds_pictures_missing_on_disk(self):
+        with patch.object(list_user_images, 'add_to_dir'):
+            picture_id = list_user_images.add_new_picture('ale314', ['cat'])
+        self.assertEqual(self.reconcile(), [])
+        self.assertEqual(self.differences(), [('ale314', picture_id)])
+        self.assertEqual(model.PictureChange.select().count(), 0)
+
+    def test_change_feed_keeps_changes_made_during_a_run(self):
+        refresh = picture_manifest.refresh
+
+        def refresh_while_adding(*args):
+            list_user_images.add_new_picture('ale314', ['cat'])
+            return refresh(*args)
+
+        with patch.object(picture_manifest, 'refresh', side_effect=refresh_while_adding):
+            self.assertTrue(main.reconcile_images())
+        self.assertEqual([row['picture_id'] for row in model.picture_changes.all()], ['0000000004'])
+
+    def test_resolved_discrepancy_is_cleared(self):
+        path = os.path.join('images', 'ale314', 'cat', '0000000001.png')
+        os.remove(path)
+        self.reconcile()
+        self.assertEqual(self.differences(), [('ale314', '0000000001')])
+        open(path, 'wb').close()
+        self.reconcile()
+        self.assertEqual(self.differences(), [])
+
+    def test_full(self):
+        model.differences_table.insert(missing_picture_in_disk='0000000001', user_id='ale314')
+        os.remove(os.path.join('images', 'bryce05', 'dog', 'beach', '0000000003.png'))
+        backdate('images')
+        self.assertEqual(self.reconcile(), [])
+        self.assertEqual(self.differences(), [('ale314', '0000000001')])
+        self.assertEqual(self.reconcile(full=True),
+                         ['ale314', 'ale314/cat', 'bryce05', 'bryce05/dog', 'bryce05/dog/beach'])
+        self.assertEqual(self.differences(), [('bryce05', '0000000003')])
+
+    def test_parallel_scan_matches_serial(self):
+        open(os.path.join('images', 'bryce05', '0000000099.png'), 'wb').close()
+        self.assertEqual(sorted(image_scanner.scan('images', workers=4)), sorted(image_scanner.scan('images')))
+        self.reconcile(full=True, workers=4)
+        self.assertEqual(self.differences(), [('bryce05', '0000000099')])
@@ -0,0 +1,15 @@
+'''
+Result type shared by the bulk mutation methods of the collections
+'''
+from collections import namedtuple
+
+BulkResult = namedtuple('BulkResult', ['count', 'rejected'])
+BulkResult.__doc__ = '''
+Outcome of a bulk mutation: count is the number of rows applied and
+rejected is a list of (key, reason) pairs for the rows that were not
+'''
+
+ALREADY_EXISTS = 'already exists'
+DOES_NOT_EXIST = 'does not exist'
+EMAIL_TAKEN = 'email already exists'
+UNKNOWN_USER = 'user does not exist'
@@ -0,0 +1,122 @@
+"""
+Parallel parsing of large CSV files
+
+The file is split into byte ranges that start and end on record
+boundaries. A newline only ends a record when it is preceded by an even
+number of quote characters, so newlines inside quoted fields never split
+a record. Each range is then parsed in a process pool.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from csv import reader as read_csv
+
+import validation
+
+BLOCK_SIZE = 1 << 20
+
+
+def record_boundaries(filename, start, targets):
+    '''
+    Returns the offset of the first record boundary at or after each of
+    the sorted byte offsets in targets, scanning from start.
+
+    start must itself be a record boundary. Targets past the last record
+    map to the file size.
+    '''
+    boundaries = []
+    targets = iter(targets)
+    target = next(targets, None)
+    parity = 0
+    pos = start
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        while target is not None and (block := file.read(BLOCK_SIZE)):
+            offset = 0
+            while target is not None:
+                newline = block.find(b'\n', max(target - pos - 1, offset))
+                if newline == -1:
+                    break
+                parity ^= block.count(b'"', offset, newline) & 1
+                offset = newline + 1
+                if not parity:
+                    boundaries.append(pos + offset)
+                    target = next(targets, None)
+            parity ^= block.count(b'"', offset) & 1
+            pos += len(block)
+    size = os.path.getsize(filename)
+    while target is not None:
+        boundaries.append(size)
+        target = next(targets, None)
+    return boundaries
+
+
+def read_header(filename):
+    '''
+    Returns the header row of a CSV file and the offset of the first
+    data record
+    '''
+    data_start = record_boundaries(filename, 0, [1])[0]
+    with open(filename, 'rb') as file:
+        text = file.read(data_start).decode('utf-8')
+    return next(read_csv(io.StringIO(text, newline='')), []), data_start
+
+
+def split(filename, shard_count):
+    '''
+    Returns the header row and a list of (start, end) byte ranges that
+    cover every data record of the file
+    '''
+    header, data_start = read_header(filename)
+    size = os.path.getsize(filename)
+    step = max((size - data_start) // shard_count, 1)
+    targets = range(data_start + step, size, step)
+    edges = [data_start, *record_boundaries(filename, data_start, targets), size]
+    shards = [(begin, end) for begin, end in zip(edges, edges[1:]) if begin < end]
+    return header, shards
+
+
+def parse_shard(filename, begin, end, validator, stop_at_error):
+    '''
+    Parses the records in [begin, end) of filename with a compiled
+    validation.RowValidator
+
+    Returns the list of valid value tuples, the list of (line, errors,
+    row) for the invalid rows, with lines counted from the start of the
+    range, and the number of lines in the range. With stop_at_error,
+    parsing stops at the first invalid row.
+    '''
+    with open(filename, 'rb') as file:
+        file.seek(begin)
+        data = file.read(end - begin)
+    report = validation.ValidationReport()
+    rows = validation.iter_rows(io.StringIO(data.decode('utf-8'), newline=''), validator, report)
+    values = []
+    for value in rows:
+        if stop_at_error and report.errors:
+            break
+        values.append(value)
+    return values, report.errors[:1] if stop_at_error else report.errors, data.count(b'\n')
+
+
+def parse(filename, schema, workers=None, shard_count=None, stop_at_error=True):
+    '''
+    Generator yielding (values, errors) for every shard of filename, in
+    file order, from a pool of workers processes. Rows are checked
+    against schema, a validation.Schema; errors lists (line, errors, row)
+    for the invalid rows of the shard.
+
+    Raises KeyError if the header lacks one of the schema columns.
+    '''
+    workers = workers or os.cpu_count() or 1
+    header, shards = split(filename, shard_count or workers * 4)
+    validator = schema.compile(header)
+    with open(filename, 'rb') as file:
+        lines_before = file.read(shards[0][0] if shards else 0).count(b'\n')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_shard, filename, begin, end, validator, stop_at_error)
+                   for begin, end in shards]
+        for future in futures:
+            values, errors, line_count = future.result()
+            yield values, [(lines_before + line, messages, row) for line, messages, row in errors]
+            lines_before += line_count
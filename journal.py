@@ -0,0 +1,119 @@
+"""
+Append-only journal of collection mutations
+
+Each add, modify or delete on a collection with a journal attached is
+appended as one compact JSON array per line, e.g.
+["modify","evmiles97_00001","evmiles97","Code is compiling"]. Records are
+flushed and fsync'ed every sync_every appends, so persisting a change
+costs O(changes) instead of rewriting the whole CSV file. A journal is
+replayed on top of its base CSV file at load time and folded back into
+it by compaction.
+
+Compaction moves the journal aside to <journal>.compacting and starts a
+new one while the collection is locked, then deletes the moved file once
+the base file has been rewritten. A moved journal left by a compaction
+that did not finish is replayed before the current one.
+"""
+import json
+import os
+import shutil
+
+ROTATED_SUFFIX = '.compacting'
+
+
+class Journal():
+    '''
+    Append-only log of the mutations of one collection
+    '''
+
+    def __init__(self, filename, sync_every=100):
+        self.filename = filename
+        self.sync_every = sync_every
+        self._file = open(filename, 'a', encoding='utf-8')  # pylint: disable=R1732
+        self._pending = 0
+
+    def append(self, operation, *fields):
+        '''
+        Appends one mutation, syncing to disk every sync_every records
+        '''
+        self._file.write(json.dumps([operation, *fields], separators=(',', ':')) + '\n')
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        '''
+        Flushes pending records and forces them to disk
+        '''
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def truncate(self):
+        '''
+        Empties the journal, once its records are in the base file
+        '''
+        self._file.flush()
+        self._file.truncate(0)
+        self.sync()
+
+    def rotate(self, rotated_filename):
+        '''
+        Moves the records to rotated_filename and starts an empty journal
+
+        If rotated_filename was left by a compaction that failed, the
+        records are appended to it instead of replacing it.
+        '''
+        self.sync()
+        if os.path.exists(rotated_filename):
+            with open(self.filename, 'r', encoding='utf-8') as current, \
+                    open(rotated_filename, 'a', encoding='utf-8') as rotated:
+                shutil.copyfileobj(current, rotated)
+                rotated.flush()
+                os.fsync(rotated.fileno())
+            self.truncate()
+            return
+        self._file.close()
+        os.replace(self.filename, rotated_filename)
+        self._file = open(self.filename, 'a', encoding='utf-8')  # pylint: disable=R1732
+
+    def close(self):
+        '''
+        Syncs and closes the journal
+        '''
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def read(filename):
+    '''
+    Generator over the records of a journal file
+
+    Stops at the first incomplete record, which is what a crash in the
+    middle of an append leaves behind.
+    '''
+    try:
+        with open(filename, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+    except FileNotFoundError:
+        return
+
+
+def replay(filename, collection):
+    '''
+    Applies the records of a journal file to collection and returns how
+    many were applied
+
+    collection.JOURNAL_OPERATIONS maps each operation name to the method
+    that applies it.
+    '''
+    count = 0
+    for operation, *fields in read(filename):
+        getattr(collection, collection.JOURNAL_OPERATIONS[operation])(*fields)
+        count += 1
+    return count
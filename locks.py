@@ -0,0 +1,144 @@
+'''
+Locking for the opt-in concurrent mode of the collections
+
+A collection created with concurrent=True guards its public methods with
+an RWLock: any number of threads may read at once, while a mutation
+waits for the readers to finish and excludes everyone else. Collections
+used from a single thread get NULL_LOCK, whose guards do nothing.
+
+The locks are not reentrant, so a guarded method must only call the
+unguarded, underscore-prefixed helpers of its collection.
+'''
+import threading
+from functools import wraps
+
+
+class Guard():
+    '''
+    Context manager calling acquire on entry and release on exit
+    '''
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._release()
+
+
+class RWLock():
+    '''
+    Reader-writer lock
+
+    Waiting writers hold back new readers, so a steady stream of reads
+    cannot starve a mutation.
+    '''
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._read_guard = Guard(self.acquire_read, self.release_read)
+        self._write_guard = Guard(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        '''
+        Blocks until no writer holds or waits for the lock
+        '''
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        '''
+        Releases a read acquisition
+        '''
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        '''
+        Blocks until the lock is free of readers and writers
+        '''
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        '''
+        Releases a write acquisition
+        '''
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    def read(self):
+        '''
+        Returns a context manager holding the lock for reading
+        '''
+        return self._read_guard
+
+    def write(self):
+        '''
+        Returns a context manager holding the lock for writing
+        '''
+        return self._write_guard
+
+
+class NullLock():
+    '''
+    Stand-in for RWLock that does no locking
+    '''
+    _guard = Guard(lambda: None, lambda: None)
+
+    def read(self):
+        '''
+        Returns a context manager that does nothing
+        '''
+        return self._guard
+
+    write = read
+
+
+NULL_LOCK = NullLock()
+
+
+def new_lock(concurrent):
+    '''
+    Returns an RWLock if concurrent, NULL_LOCK otherwise
+    '''
+    return RWLock() if concurrent else NULL_LOCK
+
+
+def reading(method):
+    '''
+    Decorator running a collection method under the read side of its lock
+    '''
+    @wraps(method)
+    def guarded(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return guarded
+
+
+def writing(method):
+    '''
+    Decorator running a collection method under the write side of its lock
+    '''
+    @wraps(method)
+    def guarded(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return guarded
@@ -2,29 +2,128 @@
 main driver for a simple social network project
 """
 # pylint: disable=W0621,C0301
-import re
+import argparse
+import gzip
+import io
+import json
+import os
 import sys
-from csv import DictReader, DictWriter
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+from csv import reader as read_csv, writer as csv_writer
+from functools import partial
 
+import bulk
+import csv_shards
+import journal
+import sqlite_backend
 import user_status
 import users
+import validation
 
+USER_COLUMNS = ("USER_ID", "EMAIL", "NAME", "LASTNAME")
+STATUS_COLUMNS = ("STATUS_ID", "USER_ID", "STATUS_TEXT")
+USER_SCHEMA = validation.Schema(USER_COLUMNS)
+STATUS_SCHEMA = validation.Schema(STATUS_COLUMNS, no_whitespace=("USER_ID",))
+SNAPSHOT_SUFFIX = '.snap'
+JOURNAL_SUFFIX = '.log'
+USER_FIELDS = ("user_id", "email", "user_name", "user_last_name")
+STATUS_FIELDS = ("status_id", "user_id", "status_text")
+# batch operation -> (collection, method, fields)
+BATCH_OPERATIONS = {
+    'add_user': ('users', 'add_user', USER_FIELDS),
+    'update_user': ('users', 'modify_user', USER_FIELDS),
+    'delete_user': ('users', 'delete_user', USER_FIELDS[:1]),
+    'add_status': ('statuses', 'add_status', STATUS_FIELDS),
+    'update_status': ('statuses', 'modify_status', STATUS_FIELDS),
+    'delete_status': ('statuses', 'delete_status', STATUS_FIELDS[:1]),
+}
+WRITE_BUFFER = 1 << 20
 
 
-def init_user_collection():
+def init_user_collection(unique_emails=False, concurrent=False, backend="memory", **options):
     """
     Creates and returns a new instance of UserCollection
+
+    With unique_emails=True, the collection rejects users whose email
+    is already taken. With concurrent=True, it can be shared between
+    threads.
+
+    backend selects the store (see init_backend); the unique_emails and
+    concurrent options are only available in memory.
     """
-    return users.UserCollection()
+    if backend == "memory":
+        return users.UserCollection(unique_emails, concurrent)
+    if unique_emails or concurrent:
+        raise ValueError("unique_emails and concurrent need the memory backend")
+    return init_backend(backend, 0, options)
 
 
 
-def init_status_collection():
+def init_status_collection(concurrent=False, backend="memory", **options):
     """
     Creates and returns a new instance of UserStatusCollection
+
+    With concurrent=True, it can be shared between threads. backend
+    selects the store (see init_backend); concurrent is only available
+    in memory.
+    """
+    if backend == "memory":
+        return user_status.UserStatusCollection(concurrent)
+    if concurrent:
+        raise ValueError("concurrent needs the memory backend")
+    return init_backend(backend, 1, options)
+
+
+def init_backend(backend, kind, options):
+    """
+    Returns the user (kind 0) or status (kind 1) collection of a
+    database backend
+
+    - "sqlite": options may give path, the database file (default
+      ":memory:").
+    - "mongo": options give database, a pymongo Database, or uri and
+      name to connect to one. pymongo is only imported for this backend.
+    """
+    if backend == "sqlite":
+        classes = (sqlite_backend.SQLiteUserCollection, sqlite_backend.SQLiteStatusCollection)
+        return classes[kind](**options)
+    if backend == "mongo":
+        import mongo_backend  # pylint: disable=C0415
+        classes = (mongo_backend.MongoUserCollection, mongo_backend.MongoStatusCollection)
+        database = options.pop("database", None)
+        if database is None:
+            database = mongo_backend.connect(**options)
+        return classes[kind](database)
+    raise ValueError(f'backend must be "memory", "sqlite" or "mongo", not {backend!r}')
+
+
+
+def iter_checked_rows(file, schema):
     """
-    return user_status.UserStatusCollection()
+    Generator over the rows of an open CSV file as dicts of the schema
+    columns, checked by validation.iter_rows in the same pass
 
+    Raises KeyError if the header lacks one of the schema columns, and
+    ValueError for the first invalid row, before any row after it is
+    yielded.
+    """
+    header = next(read_csv(file), [])
+    report = validation.ValidationReport()
+    for values in validation.iter_rows(file, schema.compile(header), report, first_line=2):
+        if report.bad_rows:
+            break
+        yield dict(zip(schema.columns, values))
+    if report.bad_rows:
+        _, _, fields = report.errors[0]
+        row = dict(zip(header, fields))
+        if len(fields) < len(header) or any(not row[column] for column in schema.columns):
+            raise ValueError(f'Empty field in this row: {row}. ')
+        if len(fields) > len(header):
+            raise ValueError(f'Too many fields in this row: {fields}. ')
+        raise ValueError(f'User ID cannot contain space: {row}. ')
 
 
 def load_users(user_filename, user_collections):
@@ -42,11 +141,8 @@ def load_users(user_filename, user_collections):
     - Otherwise, it returns True.
     """
     try:
-        with open(user_filename, 'r', encoding="utf-8") as file:
-            csv_reader = DictReader(file)
-            for row in csv_reader:
-                if any(v is None or v == '' for v in row.values()):
-                    raise ValueError(f'Empty field in this row: {row}. ')
+        with open(user_filename, 'r', encoding="utf-8", newline='') as file:
+            for row in iter_checked_rows(file, USER_SCHEMA):
                 user_collections.add_user(
                     row["USER_ID"],
                     row["EMAIL"],
@@ -71,43 +167,64 @@ def load_users(user_filename, user_collections):
 
 
 
-def save_users(user_filename, user_collection):
+def write_csv(filename, header, rows, compress=False):
+    """
+    Writes header and rows, an iterable of tuples, to a CSV file
+
+    The rows are written with writerows into a temporary file in the same
+    directory through a WRITE_BUFFER sized buffer, synced to disk, then
+    moved over filename with os.replace. Readers see either the old or
+    the new complete file, never a half-written one. With compress=True
+    the file is gzip-compressed.
+    """
+    tmp_filename = f'{filename}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_filename, 'xb', buffering=WRITE_BUFFER) as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') if compress else nullcontext(raw) as stream:
+                text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+                writer = csv_writer(text, lineterminator='\n')
+                writer.writerow(header)
+                writer.writerows(rows)
+                text.flush()
+                text.detach()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def save_users(user_filename, user_collection, compress=False):
     """
     Saves all users in user_collection into
     a CSV file
 
     Requirements:
     - If there is an existing file, it will
-    overwrite it.
+    overwrite it atomically (see write_csv).
+    - With compress=True the file is gzip-compressed.
+    - Rows come from a snapshot of the collection, so writes can go on
+      while the file is written and do not show up in it.
     - Returns False if there are any errors
     (such as an invalid filename).
     - Otherwise, it returns True.
     """
     #filename = input('Where would you like to save your user data? Enter a filename: ')
     try:
-        with open(user_filename, "r+", encoding="utf-8") as file:
-            writer = DictWriter(
-                file,
-                fieldnames=["USER_ID", "EMAIL", "NAME", "LASTNAME"],
-            )
-            writer.writeheader()
-            for user in user_collection.database.values():
-                writer.writerow(
-                    {
-                        "USER_ID": user.user_id,
-                        "EMAIL": user.email,
-                        "NAME": user.user_name,
-                        "LASTNAME": user.user_last_name,
-                    }
-                )
+        write_csv(user_filename, USER_COLUMNS,
+                  ((user.user_id, user.email, user.user_name, user.user_last_name)
+                   for user in user_collection.snapshot().values()),
+                  compress)
         print("Successfully saved users.")
         return True
-    except FileNotFoundError as error:
+    except OSError as error:
         print(f'Detailed error message: {error}')
         return False
 
 
-def load_status_updates(status_filename, status_collections):
+def load_status_updates(status_filename, status_collections, user_collection=None):
     """
     Opens a CSV file with status data and adds it to an existing
     instance of UserStatusCollection
@@ -115,18 +232,19 @@ def load_status_updates(status_filename, status_collections):
     Requirements:
     - If a status_id already exists, it will ignore it and continue to
       the next.
+    - If user_collection is given, statuses whose USER_ID is not one of
+      its users are rejected and skipped.
     - Returns False if there are any errors(such as empty fields in the
       source CSV file)
     - Otherwise, it returns True.
     """
+    user_ids = None if user_collection is None else known_user_ids(user_collection)
     try:
-        with open(status_filename, "r", encoding="utf-8") as file:
-            reader = DictReader(file)
-            for row in reader:
-                if any(v is None or v == '' for v in row.values()):
-                    raise ValueError(f'Empty field in this row: {row}. ')
-                if re.search(r'\s', row['USER_ID']):
-                    raise ValueError(f'User ID cannot contain space: {row}. ')
+        with open(status_filename, "r", encoding="utf-8", newline='') as file:
+            for row in iter_checked_rows(file, STATUS_SCHEMA):
+                if user_ids is not None and row['USER_ID'] not in user_ids:
+                    print(f"Rejected status of unknown user: {row}")
+                    continue
                 status_collections.add_status(
                     row["STATUS_ID"],
                     row["USER_ID"],
@@ -148,6 +266,324 @@ def load_status_updates(status_filename, status_collections):
         return False
 
 
+def load_summary(loaded, skipped, start, report=None, orphans=0):
+    """
+    Returns the summary dict of a bulk load that began at perf_counter() start
+    """
+    elapsed = time.perf_counter() - start
+    return {
+        'loaded': loaded,
+        'skipped': skipped,
+        'orphans': orphans,
+        'invalid': report.bad_rows if report else 0,
+        'report': report,
+        'elapsed': elapsed,
+        'rows_per_second': (loaded + skipped) / elapsed if elapsed else 0.0,
+    }
+
+
+def load_in_batches(filename, schema, add_many, collection, batch_size, progress, skip_bad_rows):
+    """
+    Streams a CSV file into collection through add_many(rows, collection),
+    batch_size rows at a time, calling progress(loaded, skipped) after
+    every batch.
+
+    Rows are checked against schema in the same pass. The first invalid
+    row raises ValueError, once the valid rows before it have been
+    added, unless skip_bad_rows is set, in which case invalid rows are
+    left out and listed in the report of the summary.
+    Returns a summary dict with the number of rows loaded, skipped
+    (rejected by add_many) and invalid, how many of the skipped rows
+    belong to unknown users, the validation report, the elapsed time in
+    seconds and the rows per second.
+    """
+    start = time.perf_counter()
+    loaded = skipped = orphans = 0
+    report = validation.ValidationReport() if skip_bad_rows else None
+    with open(filename, 'r', encoding="utf-8", newline='') as file:
+        rows = validation.iter_rows(file, schema, report)
+        batch = []
+        while True:
+            error = None
+            try:
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        break
+            except ValueError as invalid:
+                error = invalid
+            if batch:
+                result = add_many(batch, collection)
+                loaded += result.count
+                skipped += len(result.rejected)
+                orphans += count_orphans(result)
+                if progress is not None:
+                    progress(loaded, skipped)
+            if error is not None:
+                raise error
+            if len(batch) < batch_size:
+                break
+            batch = []
+    return load_summary(loaded, skipped, start, report, orphans)
+
+
+def count_orphans(result):
+    """
+    Returns how many rows of a BulkResult were rejected for an unknown user
+    """
+    return sum(reason == bulk.UNKNOWN_USER for _, reason in result.rejected)
+
+
+def load_users_bulk(user_filename, user_collection, batch_size=10_000, progress=None,
+                    skip_bad_rows=False):
+    """
+    Quiet, streaming version of load_users for large files
+
+    Requirements:
+    - Rows are read as a generator, checked against USER_SCHEMA and added
+      in batches of batch_size through add_users_many.
+    - Nothing is printed per row; progress(loaded, skipped) is called
+      after each batch instead.
+    - Returns False if there are any errors (such as empty fields),
+      unless skip_bad_rows is set: bad rows are then left out and
+      listed in the summary report.
+    - Otherwise, it returns a summary dict: loaded, skipped, invalid,
+      report, elapsed and rows_per_second.
+    """
+    try:
+        return load_in_batches(user_filename, USER_SCHEMA, add_users_many, user_collection,
+                               batch_size, progress, skip_bad_rows)
+    except FileNotFoundError as error:
+        print(f"Encountered exception while loading account list: {error}")
+        return False
+    except KeyError as error:
+        print(
+            'Wrong input file format. It should contain the following columns: ' +
+            'USER_ID, EMAIL, NAME, LASTNAME. '
+        )
+        print(f'Detailed error message: {error}')
+        return False
+    except ValueError as error:
+        print(f'Detailed error message: {error}')
+        return False
+
+
+def load_status_updates_bulk(status_filename, status_collection, batch_size=10_000, progress=None,
+                             skip_bad_rows=False, user_collection=None):
+    """
+    Quiet, streaming version of load_status_updates for large files
+
+    Requirements:
+    - Rows are read as a generator, checked against STATUS_SCHEMA and
+      added in batches of batch_size through add_statuses_many.
+    - If user_collection is given, statuses of unknown users are
+      skipped and counted as orphans.
+    - Nothing is printed per row; progress(loaded, skipped) is called
+      after each batch instead.
+    - Returns False if there are any errors (such as empty fields),
+      unless skip_bad_rows is set: bad rows are then left out and
+      listed in the summary report.
+    - Otherwise, it returns a summary dict: loaded, skipped, invalid,
+      report, elapsed and rows_per_second.
+    """
+    try:
+        add_many = add_statuses_many
+        if user_collection is not None:
+            add_many = partial(add_statuses_many, user_ids=known_user_ids(user_collection))
+        return load_in_batches(status_filename, STATUS_SCHEMA, add_many, status_collection,
+                               batch_size, progress, skip_bad_rows)
+    except FileNotFoundError as error:
+        print(f"File not found! Encountered exception while loading account list: {error}")
+        return False
+    except KeyError as error:
+        print(
+            'Wrong input file format. It should contain the following columns: ' +
+            'STATUS_ID, USER_ID, STATUS_TEXT. '
+        )
+        print(f'Detailed error message: {error}')
+        return False
+    except ValueError as error:
+        print(f'Detailed error message: {error}')
+        return False
+
+
+def load_status_updates_parallel(status_filename, status_collection, workers=None, progress=None,
+                                 skip_bad_rows=False, user_collection=None):
+    """
+    Parallel version of load_status_updates_bulk for multi-million row files
+
+    Requirements:
+    - The file is split into byte ranges aligned to record boundaries
+      (quoted newlines included) which are parsed and checked against
+      STATUS_SCHEMA in a pool of workers processes, one per CPU by default.
+    - Shards are merged in file order, so the first occurrence of a
+      status_id wins, as with load_status_updates.
+    - Returns False if there are any errors (such as empty fields); rows
+      before the first bad row are kept, as with load_status_updates.
+      With skip_bad_rows, bad rows are left out and listed in the
+      summary report instead.
+    - If user_collection is given, statuses of unknown users are
+      skipped and counted as orphans.
+    - Otherwise, it returns the same summary dict as load_status_updates_bulk.
+    """
+    start = time.perf_counter()
+    loaded = skipped = orphans = 0
+    report = validation.ValidationReport() if skip_bad_rows else None
+    user_ids = None if user_collection is None else known_user_ids(user_collection)
+    try:
+        for rows, errors in csv_shards.parse(status_filename, STATUS_SCHEMA, workers,
+                                             stop_at_error=not skip_bad_rows):
+            result = add_statuses_many(rows, status_collection, user_ids)
+            loaded += result.count
+            skipped += len(result.rejected)
+            orphans += count_orphans(result)
+            if progress is not None:
+                progress(loaded, skipped)
+            if errors and report is None:
+                raise ValueError(validation.format_error(*errors[0]))
+            for error in errors:
+                report.add(*error)
+    except FileNotFoundError as error:
+        print(f"File not found! Encountered exception while loading account list: {error}")
+        return False
+    except KeyError as error:
+        print(
+            'Wrong input file format. It should contain the following columns: ' +
+            'STATUS_ID, USER_ID, STATUS_TEXT. '
+        )
+        print(f'Detailed error message: {error}')
+        return False
+    except ValueError as error:
+        print(f'Detailed error message: {error}')
+        return False
+    return load_summary(loaded, skipped, start, report, orphans)
+
+
+def validate_users(user_filename):
+    """
+    Checks every row of a user CSV file in one pass, without loading it
+
+    Requirements:
+    - Prints every invalid row with its line number.
+    - Returns None if the file cannot be read.
+    - Otherwise, it returns the ValidationReport.
+    """
+    return print_validation(user_filename, USER_SCHEMA)
+
+
+def validate_status_updates(status_filename):
+    """
+    Checks every row of a status CSV file in one pass, without loading it
+
+    Requirements:
+    - Prints every invalid row with its line number.
+    - Returns None if the file cannot be read.
+    - Otherwise, it returns the ValidationReport.
+    """
+    return print_validation(status_filename, STATUS_SCHEMA)
+
+
+def print_validation(filename, schema):
+    """
+    Validates filename against schema and prints the report
+    """
+    try:
+        report = validation.validate_file(filename, schema)
+    except FileNotFoundError as error:
+        print(f"File not found! Detailed error message: {error}")
+        return None
+    except KeyError as error:
+        print(f"Wrong input file format. Missing column: {error}")
+        return None
+    if report.bad_rows:
+        print(report)
+    print(f"Found {report.bad_rows} invalid rows in {filename}")
+    return report
+
+
+def known_user_ids(users_source):
+    """
+    Returns the set of user IDs of a UserCollection, or of the users in
+    a user CSV file when users_source is a filename
+    """
+    if isinstance(users_source, (str, os.PathLike)):
+        with open(users_source, 'r', encoding='utf-8', newline='') as file:
+            return {values[0] for values in
+                    validation.iter_rows(file, USER_SCHEMA, validation.ValidationReport())}
+    return set(users_source.snapshot())
+
+
+def iter_status_pairs(statuses_source):
+    """
+    Generator over the (status_id, user_id) of every status of a
+    UserStatusCollection, or of the rows of a status CSV file when
+    statuses_source is a filename, streamed without loading the file
+    """
+    if isinstance(statuses_source, (str, os.PathLike)):
+        with open(statuses_source, 'r', encoding='utf-8', newline='') as file:
+            for status_id, user_id, _ in validation.iter_rows(file, STATUS_SCHEMA,
+                                                              validation.ValidationReport()):
+                yield status_id, user_id
+    else:
+        for status in statuses_source.snapshot().values():
+            yield status.status_id, status.user_id
+
+
+def check_integrity(user_collection, status_collection):
+    """
+    Checks that every status belongs to a known user
+
+    Requirements:
+    - user_collection and status_collection are collections, or the
+      filenames of user and status CSV files, which are streamed. Rows
+      that fail validation are left out (see validate_status_updates).
+    - The user IDs are put in a hash set once, so each status costs one
+      set lookup.
+    - Returns False if a file cannot be read.
+    - Otherwise, it returns a dict: orphans, a list of (status_id,
+      user_id) whose user does not exist; duplicates, the status_ids seen
+      more than once (only possible in a file); and counts, a Counter of
+      statuses per user_id.
+    """
+    orphans = []
+    duplicates = []
+    counts = Counter()
+    seen = set()
+    try:
+        user_ids = known_user_ids(user_collection)
+        for status_id, user_id in iter_status_pairs(status_collection):
+            if status_id in seen:
+                duplicates.append(status_id)
+                continue
+            seen.add(status_id)
+            counts[user_id] += 1
+            if user_id not in user_ids:
+                orphans.append((status_id, user_id))
+    except FileNotFoundError as error:
+        print(f"File not found! Detailed error message: {error}")
+        return False
+    except KeyError as error:
+        print(f"Wrong input file format. Missing column: {error}")
+        return False
+    print(f"Checked {len(seen)} statuses of {len(counts)} users: "
+          f"{len(orphans)} orphans, {len(duplicates)} duplicates")
+    return {'orphans': orphans, 'duplicates': duplicates, 'counts': counts}
+
+
+def print_load_summary(summary):
+    """
+    Prints the summary returned by the bulk loaders
+    """
+    if summary:
+        print(f"Loaded {summary['loaded']} rows, skipped {summary['skipped']} "
+              f"in {summary['elapsed']:.2f}s ({summary['rows_per_second']:,.0f} rows/s)")
+        if summary['orphans']:
+            print(f"Rejected {summary['orphans']} statuses of unknown users")
+        if summary['invalid']:
+            print(f"Left out {summary['invalid']} invalid rows:")
+            print(summary['report'])
+
+
 def add_user(user_id, email, user_name, user_last_name, user_collection):
     """
     Creates a new instance of User and stores it in user_collection
@@ -185,23 +621,70 @@ def update_user(user_id, email, user_name, user_last_name, user_collection):
     return True
 
 
-def delete_user(user_id, user_collection):
+def delete_user(user_id, user_collection, cascade=False, status_collection=None):
     """
     Deletes a user from user_collection.
 
     Requirements:
+    - With cascade=True, every status of the user is also deleted from
+      status_collection, at a cost proportional to the number of the
+      user's statuses, and the number deleted is printed.
     - Returns False if there are any errors (such as user_id not found)
     - Otherwise, it returns True.
     """
     #user_id = input('User ID: ')
+    if cascade and status_collection is None:
+        print("A status collection is needed to delete the statuses of a user")
+        return False
     if not user_collection.delete_user(user_id):
         print("An error occurred while trying to delete user")
         return False
     print("User was successfully deleted")
+    if cascade:
+        count = status_collection.delete_statuses_by_user(user_id)
+        print(f"Deleted {count} statuses of the user")
     return True
 
 
 
+def add_users_many(rows, user_collection):
+    """
+    Adds many users to user_collection in one call
+
+    Requirements:
+    - rows is an iterable of (user_id, email, user_name, user_last_name)
+      tuples.
+    - Nothing is printed per row.
+    - Returns a BulkResult: the number of users added and a list of
+      (user_id, reason) pairs for the rejected rows.
+    """
+    return user_collection.add_users_many(rows)
+
+
+def update_users_many(rows, user_collection):
+    """
+    Updates many existing users in user_collection in one call
+
+    Requirements:
+    - rows is an iterable of (user_id, email, user_name, user_last_name)
+      tuples.
+    - Returns a BulkResult: the number of users updated and a list of
+      (user_id, reason) pairs for the rejected rows.
+    """
+    return user_collection.modify_users_many(rows)
+
+
+def delete_users_many(user_ids, user_collection):
+    """
+    Deletes many users from user_collection in one call
+
+    Requirements:
+    - Returns a BulkResult: the number of users deleted and a list of
+      (user_id, reason) pairs for the rejected ones.
+    """
+    return user_collection.delete_users_many(user_ids)
+
+
 def search_user(user_id, user_collection):
     """
     Searches for a user in user_collection(which is an instance of
@@ -223,6 +706,25 @@ def search_user(user_id, user_collection):
     return result
 
 
+def search_user_by_email(email, user_collection):
+    """
+    Searches for a user by email in user_collection
+
+    Requirements:
+    - If the user is found, returns the corresponding User instance.
+    - Otherwise, it returns None.
+    """
+    result = user_collection.search_user_by_email(email)
+    if result.user_id is None:
+        print("ERROR: User does not exist")
+        return None
+    print(f"User ID: {result.user_id}")
+    print(f"Email: {result.email}")
+    print(f"Name: {result.user_name}")
+    print(f"Last name: {result.user_last_name}")
+    return result
+
+
 def add_status(status_id, user_id, status_text, status_collection):
     """
     Creates a new instance of UserStatus and stores it in
@@ -241,6 +743,20 @@ def add_status(status_id, user_id, status_text, status_collection):
     return True
 
 
+def add_status_auto(user_id, status_text, status_collection):
+    """
+    Adds a new status for user_id under the next free status_id
+
+    Requirements:
+    - The status_id is allocated by status_collection as
+      <user_id>_<NNNNN>, one past the highest number used by the user.
+    - Returns the new status_id.
+    """
+    status_id = status_collection.add_status_auto(user_id, status_text).status_id
+    print(f"New status {status_id} was successfully added")
+    return status_id
+
+
 def delete_status(status_id, status_collection):
     """
     Deletes a status_id from user_collection.
@@ -257,6 +773,43 @@ def delete_status(status_id, status_collection):
     return True
 
 
+def add_statuses_many(rows, status_collection, user_ids=None):
+    """
+    Adds many statuses to status_collection in one call
+
+    Requirements:
+    - rows is an iterable of (status_id, user_id, status_text) tuples.
+    - If user_ids is given, rows whose user_id is not in it are rejected.
+    - Nothing is printed per row.
+    - Returns a BulkResult: the number of statuses added and a list of
+      (status_id, reason) pairs for the rejected rows.
+    """
+    return status_collection.add_statuses_many(rows, user_ids)
+
+
+def update_statuses_many(rows, status_collection):
+    """
+    Updates many existing statuses in status_collection in one call
+
+    Requirements:
+    - rows is an iterable of (status_id, user_id, status_text) tuples.
+    - Returns a BulkResult: the number of statuses updated and a list of
+      (status_id, reason) pairs for the rejected rows.
+    """
+    return status_collection.modify_statuses_many(rows)
+
+
+def delete_statuses_many(status_ids, status_collection):
+    """
+    Deletes many statuses from status_collection in one call
+
+    Requirements:
+    - Returns a BulkResult: the number of statuses deleted and a list of
+      (status_id, reason) pairs for the rejected ones.
+    """
+    return status_collection.delete_statuses_many(status_ids)
+
+
 def search_status(status_id, status_collection):
     """
     Searches for a status in status_collection
@@ -277,35 +830,49 @@ def search_status(status_id, status_collection):
     return result
 
 
+def search_statuses_by_user(user_id, status_collection):
+    """
+    Returns a list of all statuses posted by user_id in status_collection
+
+    Requirements:
+    - Returns an empty list if the user has no statuses.
+    """
+    results = status_collection.search_statuses_by_user(user_id)
+    print(f"Found {len(results)} statuses for user {user_id}")
+    return results
+
+
+def count_statuses_by_user(user_id, status_collection):
+    """
+    Returns the number of statuses posted by user_id in status_collection
+    """
+    count = status_collection.count_statuses_by_user(user_id)
+    print(f"User {user_id} has {count} statuses")
+    return count
+
 
-def save_status_updates(status_filename, status_collection):
+def save_status_updates(status_filename, status_collection, compress=False):
     """
     Saves all statuses in status_collection into a CSV file
 
     Requirements:
-    - If there is an existing file, it will overwrite it.
+    - If there is an existing file, it will overwrite it atomically (see
+      write_csv).
+    - With compress=True the file is gzip-compressed.
+    - Rows come from a snapshot of the collection, so writes can go on
+      while the file is written and do not show up in it.
     - Returns False if there are any errors(such an invalid filename).
     - Otherwise, it returns True.
     """
     #filename = input('Where would you like to save your user statuses? Enter a filename: ')
     try:
-        with open(status_filename, "r+", encoding="utf-8") as file:
-            writer = DictWriter(
-                file,
-                fieldnames=["STATUS_ID", "USER_ID", "STATUS_TEXT"],
-            )
-            writer.writeheader()
-            for status in status_collection.database.values():
-                writer.writerow(
-                    {
-                        "STATUS_ID": status.status_id,
-                        "USER_ID": status.user_id,
-                        "STATUS_TEXT": status.status_text,
-                    }
-                )
+        write_csv(status_filename, STATUS_COLUMNS,
+                  ((status.status_id, status.user_id, status.status_text)
+                   for status in status_collection.snapshot().values()),
+                  compress)
         print("Successfully saved status updates to database.")
         return True
-    except FileNotFoundError as error:
+    except OSError as error:
         print(f'File not found. Detailed error message: {error}')
         return False
 
@@ -324,22 +891,236 @@ def update_status(status_id, user_id, status_text, status_collection):
     print("Status was successfully updated")
     return True
 
+def save_snapshot(filename, collection):
+    """
+    Saves collection into the binary snapshot that load_collection uses
+    for a fast restart, filename + SNAPSHOT_SUFFIX
+
+    Requirements:
+    - Returns False if there are any errors (such as an invalid filename).
+    - Otherwise, it returns True.
+    """
+    try:
+        collection.save_snapshot(filename + SNAPSHOT_SUFFIX)
+    except OSError as error:
+        print(f'Detailed error message: {error}')
+        return False
+    print(f"Successfully saved snapshot {filename + SNAPSHOT_SUFFIX}.")
+    return True
+
+
+def load_collection(filename, collection_class, load, journaled=False):
+    """
+    Returns a new collection_class instance holding the data in filename
+
+    Requirements:
+    - If filename + SNAPSHOT_SUFFIX exists and is at least as recent as
+      filename, the collection is memory-mapped from the snapshot.
+    - Otherwise filename is read with load, one of the bulk loaders, and
+      its summary is printed.
+    - With journaled=True, the journal filename + JOURNAL_SUFFIX is
+      replayed and attached (see open_journal). The snapshot is not used
+      then, as it may hold changes that are also in the journal.
+    """
+    snapshot_filename = filename + SNAPSHOT_SUFFIX
+    try:
+        if not journaled and os.stat(snapshot_filename).st_mtime_ns >= os.stat(filename).st_mtime_ns:
+            collection = collection_class.load_snapshot(snapshot_filename)
+            print(f"Loaded {len(collection.database)} rows from snapshot {snapshot_filename}")
+            return collection
+    except (OSError, ValueError):
+        pass
+    collection = collection_class()
+    print_load_summary(load(filename, collection))
+    if journaled:
+        open_journal(filename + JOURNAL_SUFFIX, collection)
+    return collection
+
+
+def open_journal(journal_filename, collection, sync_every=100):
+    """
+    Replays journal_filename onto collection, freshly loaded from its
+    base file, after the journal moved aside by a compaction that did
+    not finish, if any, then attaches the journal so that every later add, modify
+    and delete is appended to it.
+
+    Requirements:
+    - Records are fsync'ed in batches of sync_every; call
+      collection.journal.sync() to persist pending changes at once,
+      which costs O(changes) rather than a full save.
+    - Returns the number of replayed records.
+    """
+    collection.journal = None
+    count = journal.replay(journal_filename + journal.ROTATED_SUFFIX, collection)
+    count += journal.replay(journal_filename, collection)
+    collection.journal = journal.Journal(journal_filename, sync_every)
+    print(f"Replayed {count} changes from {journal_filename}")
+    return count
+
+
+def compact_journal(filename, collection, save):
+    """
+    Folds the journal of collection back into its base file
+
+    Requirements:
+    - Under the collection's write lock, moves the journal aside and
+      starts a new one, so every change is either in the frozen copy
+      that gets saved or in the new journal.
+    - Rewrites filename from that copy with save (save_users or
+      save_status_updates), then deletes the moved journal. If the save
+      fails it is kept, and open_journal replays it first.
+    - Returns False if there are any errors (such as the save failing).
+    - Otherwise, it returns True.
+    """
+    rotated_filename = collection.journal.filename + journal.ROTATED_SUFFIX
+    frozen = collection.rotate_journal(rotated_filename)
+    if not save(filename, frozen):
+        return False
+    os.remove(rotated_filename)
+    return True
+
+
+def sync_journal(collection):
+    """
+    Saves the changes of collection by forcing its journal to disk
+
+    Requirements:
+    - Costs O(changes since the last sync) instead of a full save.
+    - Returns False if there are any errors (such as a full disk).
+    - Otherwise, it returns True.
+    """
+    try:
+        collection.journal.sync()
+    except OSError as error:
+        print(f'Detailed error message: {error}')
+        return False
+    print("Successfully saved changes to the journal.")
+    return True
+
+
+def read_operations(operations_filename):
+    """
+    Generator over the (line, operation, fields) of a batch file
+
+    A .jsonl or .json file holds one operation per line, either as an
+    array ["add_user", "ale314", "ale314@uw.edu", "Audrey", "Le"] or as
+    an object {"op": "delete_status", "status_id": "ale314_00001"}. Any
+    other file is read as CSV rows of the operation followed by its
+    fields. Blank lines are skipped.
+
+    Raises ValueError, with the line number, for a line that is not an
+    operation or holds a value that is not a string.
+    """
+    with open(operations_filename, 'r', encoding='utf-8', newline='') as file:
+        if operations_filename.endswith(('.jsonl', '.json')):
+            for line, text in enumerate(file, 1):
+                if not text.strip():
+                    continue
+                record = json.loads(text)
+                if isinstance(record, dict):
+                    operation = record.pop('op', None)
+                    if not isinstance(operation, str):
+                        raise ValueError(f'Line {line}: not an operation: {text.strip()}')
+                    fields = BATCH_OPERATIONS.get(operation, (None, None, ()))[2]
+                    record = [operation, *(record.get(field) for field in fields)]
+                if not isinstance(record, list) or not record:
+                    raise ValueError(f'Line {line}: not an operation: {text.strip()}')
+                # missing fields are None and reported by run_batch
+                if not all(isinstance(value, str) or value is None for value in record):
+                    raise ValueError(f'Line {line}: operation and fields must be strings: '
+                                     f'{text.strip()}')
+                yield line, record[0], record[1:]
+        else:
+            rows = read_csv(file)
+            line = 1
+            for row in rows:
+                start, line = line, rows.line_num + 1
+                if row:
+                    yield start, row[0], row[1:]
+
+
+def run_batch(operations_filename, user_collection, status_collection, progress_every=100_000):
+    """
+    Applies the operations of a batch file (see read_operations) to the
+    collections in order, without prompting
+
+    Requirements:
+    - Operations are add_user, update_user, delete_user, add_status,
+      update_status and delete_status, with the fields of the matching
+      menu option. Nothing is printed per operation; a progress line is
+      printed every progress_every operations instead.
+    - An operation the collection refuses (such as adding an existing
+      user) is counted as rejected and the batch goes on.
+    - Returns False if the file cannot be read or holds an unknown
+      operation or a wrong number of fields; the operations before it
+      stay applied.
+    - Otherwise, it returns a summary dict: applied and rejected counts
+      per operation, total, elapsed and operations_per_second.
+    """
+    collections = {'users': user_collection, 'statuses': status_collection}
+    methods = {operation: (getattr(collections[target], method), len(fields))
+               for operation, (target, method, fields) in BATCH_OPERATIONS.items()}
+    counts = {operation: {'applied': 0, 'rejected': 0} for operation in BATCH_OPERATIONS}
+    total = 0
+    start = time.perf_counter()
+    try:
+        for line, operation, fields in read_operations(operations_filename):
+            if operation not in methods:
+                raise ValueError(f'Line {line}: unknown operation {operation!r}')
+            method, field_count = methods[operation]
+            if len(fields) != field_count or None in fields:
+                raise ValueError(f'Line {line}: {operation} expects {field_count} fields, '
+                                 f'found {fields}')
+            counts[operation]['applied' if method(*fields) else 'rejected'] += 1
+            total += 1
+            if not total % progress_every:
+                print(f"Applied {total} operations")
+    except FileNotFoundError as error:
+        print(f"File not found! Detailed error message: {error}")
+        return False
+    except ValueError as error:
+        print(f'Detailed error message: {error}')
+        return False
+    elapsed = time.perf_counter() - start
+    return {
+        'operations': counts,
+        'total': total,
+        'elapsed': elapsed,
+        'operations_per_second': total / elapsed if elapsed else 0.0,
+    }
+
+
+def print_batch_summary(summary):
+    """
+    Prints the summary returned by run_batch
+    """
+    if summary:
+        for operation, count in summary['operations'].items():
+            if count['applied'] or count['rejected']:
+                print(f"{operation}: {count['applied']} applied, {count['rejected']} rejected")
+        print(f"Ran {summary['total']} operations in {summary['elapsed']:.2f}s "
+              f"({summary['operations_per_second']:,.0f} operations/s)")
+
+
 def quit_program():
     """
     Quits program
     """
     sys.exit()
 
-def main_menu():
+def main_menu(journaled=False):
     """
     creating menu
+
+    With journaled=True, every change is appended to the journals of the
+    two files: G and L save by syncing the journals, N folds them back
+    into the files, and Q syncs them before quitting.
     """
     user_filename = input("Enter a file to load users:")
     status_filename = input("Enter a file to load your user status:")
-    user_collection = init_user_collection()
-    load_users(user_filename, user_collection)
-    status_collection = init_status_collection()
-    load_status_updates(status_filename, status_collection)
+    user_collection = load_collection(user_filename, users.UserCollection, load_users_bulk, journaled)
+    status_collection = load_collection(status_filename, user_status.UserStatusCollection,
+                                        load_status_updates_bulk, journaled)
     menu_options = {
         'A': load_users,
         'B': load_status_updates,
@@ -353,6 +1134,8 @@ def main_menu():
         'J': search_status,
         'K': delete_status,
         'L': save_status_updates,
+        'M': save_snapshot,
+        'N': compact_journal,
         'Q': quit_program
     }
     while True:
@@ -369,12 +1152,17 @@ def main_menu():
                                 J: Search status
                                 K: Delete status
                                 L: Save status database to file
+                                M: Save snapshots for a fast restart
+                                N: Compact the journals into the files (--journal)
                                 Q: Quit
 
                                 Please enter your choice: """)
-        if user_selection.upper() in menu_options:
+        user_selection = user_selection.upper()
+        if user_selection in menu_options:
             match user_selection:
-                case 'A', 'G':
+                case 'G' | 'L' if journaled:
+                    sync_journal(user_collection if user_selection == 'G' else status_collection)
+                case 'A' | 'G':
                     menu_options[user_selection](user_filename, user_collection)
                 case 'C':
                     user_id = input('User ID: ')
@@ -393,30 +1181,82 @@ def main_menu():
                     menu_options[user_selection](user_id, user_collection)
                 case 'F':
                     user_id = input("Enter a user_id to delete: ")
-                    menu_options[user_selection](user_id, user_collection)
-                case 'B', 'L':
+                    menu_options[user_selection](user_id, user_collection, True, status_collection)
+                case 'B' | 'L':
                     menu_options[user_selection](status_filename, status_collection)
                 case 'H':
                     status_id = input('Status ID: ')
                     user_id = input('User ID: ')
                     status_text = input('Status text: ')
-                    menu_options[user_selection](user_id, status_id, status_text, status_collection)
+                    menu_options[user_selection](status_id, user_id, status_text, status_collection)
                 case 'I':
                     user_id = input('User ID: ')
                     status_id = input('Status ID: ')
                     status_text = input('Status text: ')
-                    menu_options[user_selection](user_id, status_id, status_text, status_collection)
+                    menu_options[user_selection](status_id, user_id, status_text, status_collection)
                 case 'J':
                     status_id = input("Enter a status_id to search: ")
                     menu_options[user_selection](status_id, status_collection)
                 case 'K':
                     status_id = input("Enter a status_id to delete status: ")
                     menu_options[user_selection](status_id, status_collection)
+                case 'M':
+                    menu_options[user_selection](user_filename, user_collection)
+                    menu_options[user_selection](status_filename, status_collection)
+                case 'N':
+                    if not journaled:
+                        print("Journals are off; start with --journal to keep them")
+                        continue
+                    menu_options[user_selection](user_filename, user_collection, save_users)
+                    menu_options[user_selection](status_filename, status_collection, save_status_updates)
                 case 'Q':
+                    if journaled:
+                        user_collection.journal.close()
+                        status_collection.journal.close()
                     menu_options[user_selection]()
         else:
             print("Invalid option")
 
 
+def run_cli(argv=None):
+    """
+    Command line entry point
+
+    Without --batch, starts the interactive menu. With --batch, loads
+    the user and status files, applies the operations of the batch file
+    and, with --save, writes the collections back to their files.
+
+    With --journal, changes are appended to <file>.log journals, which
+    are replayed at load; --save then compacts them into the files.
+    """
+    parser = argparse.ArgumentParser(description='Social network user and status database')
+    parser.add_argument('--batch', help='JSONL or CSV file of operations to apply')
+    parser.add_argument('--users', default='accounts.csv', help='user CSV file')
+    parser.add_argument('--statuses', default='status_updates.csv', help='status CSV file')
+    parser.add_argument('--save', action='store_true', help='save the collections after the batch')
+    parser.add_argument('--journal', action='store_true',
+                        help=f'keep a journal of changes next to each file (<file>{JOURNAL_SUFFIX})')
+    args = parser.parse_args(argv)
+    if args.batch is None:
+        main_menu(args.journal)
+        return True
+    user_collection = load_collection(args.users, users.UserCollection, load_users_bulk, args.journal)
+    status_collection = load_collection(args.statuses, user_status.UserStatusCollection,
+                                        load_status_updates_bulk, args.journal)
+    summary = run_batch(args.batch, user_collection, status_collection)
+    print_batch_summary(summary)
+    if args.journal:
+        saved = not (summary and args.save) or (
+            compact_journal(args.users, user_collection, save_users) and
+            compact_journal(args.statuses, status_collection, save_status_updates))
+        user_collection.journal.close()
+        status_collection.journal.close()
+        return bool(summary) and saved
+    if summary and args.save:
+        return save_users(args.users, user_collection) and \
+            save_status_updates(args.statuses, status_collection)
+    return bool(summary)
+
+
 if __name__ == '__main__':
-    main_menu()
+    sys.exit(0 if run_cli() else 1)
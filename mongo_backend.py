@@ -0,0 +1,291 @@
+'''
+MongoDB storage for the user and status collections
+
+MongoUserCollection and MongoStatusCollection have the methods of
+users.UserCollection and user_status.UserStatusCollection that main.py
+uses. Documents are keyed by user_id or status_id as _id. The *_many
+methods are the bulk-write path: inserts go through one unordered
+insert_many, whose duplicate key errors become rejections, and updates
+and deletes look up the existing keys with one $in query before a single
+bulk_write or delete_many.
+
+Any pymongo Database works, including a mongomock one for offline tests.
+'''
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import bulk
+from user_status import UserStatus
+from users import Users
+
+DUPLICATE_KEY = 11000
+
+
+def connect(uri='mongodb://localhost:27017', name='social_network'):
+    '''
+    Returns the database name of the server at uri
+    '''
+    return MongoClient(uri)[name]
+
+
+class MongoCollection():
+    '''
+    Base class holding one MongoDB collection and its key lookups
+    '''
+    NAME = None
+
+    def __init__(self, database):
+        self.table = database[self.NAME]
+
+    def _existing(self, keys):
+        '''
+        Returns the set of keys that are in the collection
+        '''
+        return {document['_id'] for document in
+                self.table.find({'_id': {'$in': list(keys)}}, {'_id': 1})}
+
+    def _insert_many(self, documents):
+        '''
+        Inserts documents, first occurrence of an _id winning, and
+        returns a BulkResult
+        '''
+        seen = set()
+        accepted = []
+        rejected = []
+        for document in documents:
+            if document['_id'] in seen:
+                rejected.append((document['_id'], bulk.ALREADY_EXISTS))
+                continue
+            seen.add(document['_id'])
+            accepted.append(document)
+        if not accepted:
+            return bulk.BulkResult(0, rejected)
+        try:
+            count = len(self.table.insert_many(accepted, ordered=False).inserted_ids)
+        except BulkWriteError as error:
+            count = error.details['nInserted']
+            for write_error in error.details['writeErrors']:
+                if write_error['code'] != DUPLICATE_KEY:
+                    raise
+                rejected.append((accepted[write_error['index']]['_id'], bulk.ALREADY_EXISTS))
+        return bulk.BulkResult(count, rejected)
+
+    def _update_many(self, updates):
+        '''
+        Applies (key, fields) updates to existing documents in one
+        bulk_write and returns a BulkResult
+        '''
+        updates = list(updates)
+        existing = self._existing(key for key, _ in updates)
+        rejected = [(key, bulk.DOES_NOT_EXIST) for key, _ in updates if key not in existing]
+        operations = [UpdateOne({'_id': key}, {'$set': fields})
+                      for key, fields in updates if key in existing]
+        if operations:
+            self.table.bulk_write(operations, ordered=True)
+        return bulk.BulkResult(len(operations), rejected)
+
+    def _delete_many(self, keys):
+        '''
+        Deletes many keys with one delete_many and returns a BulkResult
+        '''
+        keys = list(keys)
+        existing = self._existing(keys)
+        rejected = [(key, bulk.DOES_NOT_EXIST) for key in keys if key not in existing]
+        if existing:
+            self.table.delete_many({'_id': {'$in': list(existing)}})
+        return bulk.BulkResult(len(existing), rejected)
+
+
+def user_document(user_id, email, user_name, user_last_name):
+    '''
+    Returns the document stored for a user
+    '''
+    return {'_id': user_id, 'email': email, 'email_key': email.casefold(),
+            'user_name': user_name, 'user_last_name': user_last_name}
+
+
+def user_from(document):
+    '''
+    Builds a Users object from a stored document, or an empty one
+    '''
+    if document is None:
+        return Users(None, None, None, None)
+    return Users(document['_id'], document['email'], document['user_name'],
+                 document['user_last_name'])
+
+
+class MongoUserCollection(MongoCollection):
+    '''
+    Users stored in the users collection of a MongoDB database
+    '''
+    NAME = 'users'
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.table.create_index('email_key')
+
+    def add_user(self, user_id, email, user_name, user_last_name):
+        '''
+        Adds a new user to the collection
+        '''
+        try:
+            self.table.insert_one(user_document(user_id, email, user_name, user_last_name))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def add_users_many(self, rows):
+        '''
+        Adds many users with one insert_many and returns a BulkResult
+        '''
+        return self._insert_many(user_document(*row) for row in rows)
+
+    def modify_user(self, user_id, email, user_name, user_last_name):
+        '''
+        Modifies an existing user
+        '''
+        fields = user_document(user_id, email, user_name, user_last_name)
+        del fields['_id']
+        return self.table.update_one({'_id': user_id}, {'$set': fields}).matched_count == 1
+
+    def modify_users_many(self, rows):
+        '''
+        Modifies many existing users in one bulk_write and returns a BulkResult
+        '''
+        documents = (user_document(*row) for row in rows)
+        return self._update_many((document.pop('_id'), document) for document in documents)
+
+    def delete_user(self, user_id):
+        '''
+        Deletes an existing user
+        '''
+        return self.table.delete_one({'_id': user_id}).deleted_count == 1
+
+    def delete_users_many(self, user_ids):
+        '''
+        Deletes many existing users and returns a BulkResult
+        '''
+        return self._delete_many(user_ids)
+
+    def search_user(self, user_id):
+        '''
+        Searches for user data
+        '''
+        return user_from(self.table.find_one({'_id': user_id}))
+
+    def search_user_by_email(self, email):
+        '''
+        Searches for user data by email, ignoring case
+        '''
+        return user_from(self.table.find_one({'email_key': email.casefold()}))
+
+    def snapshot(self):
+        '''
+        Returns a dict of user_id -> user read with one find
+        '''
+        return {document['_id']: user_from(document) for document in self.table.find()}
+
+
+def status_from(document):
+    '''
+    Builds a UserStatus object from a stored document, or an empty one
+    '''
+    if document is None:
+        return UserStatus(None, None, None)
+    return UserStatus(document['_id'], document['user_id'], document['status_text'])
+
+
+class MongoStatusCollection(MongoCollection):
+    '''
+    Status messages stored in the statuses collection of a MongoDB database
+    '''
+    NAME = 'statuses'
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.table.create_index('user_id')
+
+    def add_status(self, status_id, user_id, status_text):
+        '''
+        Adds a new status message and returns it, or False if status_id
+        already exists
+        '''
+        try:
+            self.table.insert_one({'_id': status_id, 'user_id': user_id, 'status_text': status_text})
+        except DuplicateKeyError:
+            return False
+        return UserStatus(status_id, user_id, status_text)
+
+    def add_statuses_many(self, rows, user_ids=None):
+        '''
+        Adds many status messages with one insert_many
+
+        Returns a BulkResult; rows whose status_id already exists are
+        rejected, and so are rows whose user_id is not in user_ids, when
+        a set of them is given.
+        '''
+        rejected = []
+        documents = []
+        for status_id, user_id, status_text in rows:
+            if user_ids is not None and user_id not in user_ids:
+                rejected.append((status_id, bulk.UNKNOWN_USER))
+                continue
+            documents.append({'_id': status_id, 'user_id': user_id, 'status_text': status_text})
+        result = self._insert_many(documents)
+        return bulk.BulkResult(result.count, rejected + result.rejected)
+
+    def modify_status(self, status_id, user_id, status_text):
+        '''
+        Modifies an existing status message
+        '''
+        fields = {'user_id': user_id, 'status_text': status_text}
+        return self.table.update_one({'_id': status_id}, {'$set': fields}).matched_count == 1
+
+    def modify_statuses_many(self, rows):
+        '''
+        Modifies many status messages in one bulk_write and returns a BulkResult
+        '''
+        return self._update_many((status_id, {'user_id': user_id, 'status_text': status_text})
+                                 for status_id, user_id, status_text in rows)
+
+    def delete_status(self, status_id):
+        '''
+        Deletes an existing status message
+        '''
+        return self.table.delete_one({'_id': status_id}).deleted_count == 1
+
+    def delete_statuses_many(self, status_ids):
+        '''
+        Deletes many status messages and returns a BulkResult
+        '''
+        return self._delete_many(status_ids)
+
+    def delete_statuses_by_user(self, user_id):
+        '''
+        Deletes every status message of user_id and returns how many
+        '''
+        return self.table.delete_many({'user_id': user_id}).deleted_count
+
+    def search_status(self, status_id):
+        '''
+        Find and return a status message by its status_id
+        '''
+        return status_from(self.table.find_one({'_id': status_id}))
+
+    def search_statuses_by_user(self, user_id):
+        '''
+        Returns a list of every status message posted by user_id
+        '''
+        return [status_from(document) for document in self.table.find({'user_id': user_id})]
+
+    def count_statuses_by_user(self, user_id):
+        '''
+        Returns the number of status messages posted by user_id
+        '''
+        return self.table.count_documents({'user_id': user_id})
+
+    def snapshot(self):
+        '''
+        Returns a dict of status_id -> status message read with one find
+        '''
+        return {document['_id']: status_from(document) for document in self.table.find()}
@@ -0,0 +1,95 @@
+"""
+Stress test of the concurrent mode: read throughput of search_user as the
+number of reader threads grows, alone and next to a writer thread that
+keeps modifying users.
+
+Under CPython's GIL the readers do not run Python code in parallel, so
+the interesting figures are the cost of the lock against the unlocked
+collection and that readers keep their throughput while a writer runs.
+Run from the project root: python -m profiling.profiling_concurrency [seconds]
+"""
+import sys
+import threading
+import time
+
+import users
+
+USERS = 100_000
+THREAD_COUNTS = (1, 2, 4, 8)
+DEFAULT_SECONDS = 1.0
+
+
+def build_collection(concurrent):
+    """
+    Returns a collection of USERS users
+    """
+    collection = users.UserCollection(concurrent=concurrent)
+    collection.add_users_many((f"user{i}", f"user{i}@uw.edu", "Name", "Last")
+                              for i in range(USERS))
+    return collection
+
+
+def reader(collection, stop, counts):
+    """
+    Searches users until stop is set, then records how many it did
+    """
+    count = 0
+    while not stop.is_set():
+        for i in range(0, USERS, 97):
+            collection.search_user(f"user{i}")
+        count += len(range(0, USERS, 97))
+    counts.append(count)
+
+
+def writer(collection, stop, counts):
+    """
+    Modifies users until stop is set, then records how many it did
+    """
+    count = 0
+    while not stop.is_set():
+        user_id = f"user{count % USERS}"
+        collection.modify_user(user_id, f"{user_id}@gmail.com", "Other", "Name")
+        count += 1
+    counts.append(count)
+
+
+def run(collection, reader_count, with_writer, seconds):
+    """
+    Returns the reads and writes per second of reader_count readers and
+    an optional writer running for seconds
+    """
+    stop = threading.Event()
+    reads, writes = [], []
+    threads = [threading.Thread(target=reader, args=(collection, stop, reads))
+               for _ in range(reader_count)]
+    if with_writer:
+        threads.append(threading.Thread(target=writer, args=(collection, stop, writes)))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / seconds, sum(writes) / seconds
+
+
+def main_benchmark(seconds):
+    """
+    Prints the throughput table for the plain and concurrent collections
+    """
+    for concurrent in (False, True):
+        collection = build_collection(concurrent)
+        print(f"concurrent={concurrent}")
+        for reader_count in THREAD_COUNTS:
+            for with_writer in (False, True):
+                if with_writer and not concurrent:
+                    # the unlocked collection is not safe with a writer
+                    continue
+                reads, writes = run(collection, reader_count, with_writer, seconds)
+                label = " + writer" if with_writer else ""
+                print(f"  {reader_count} readers{label}: {reads:,.0f} reads/s"
+                      + (f", {writes:,.0f} writes/s" if with_writer else ""))
+
+
+if __name__ == '__main__':
+    main_benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SECONDS)
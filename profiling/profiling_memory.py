@@ -0,0 +1,94 @@
+"""
+Profiling the memory footprint of the in-memory collections.
+
+Compares the original __dict__ based record classes against the
+__slots__ based Users and UserStatus classes.
+Run from the project root: python -m profiling.profiling_memory [rows ...]
+"""
+import gc
+import sys
+import tracemalloc
+
+import user_status
+import users
+
+DEFAULT_SIZES = (10_000, 200_000, 2_000_000)
+
+
+class DictUsers:
+    """
+    The original Users layout, with a per-instance __dict__
+    """
+    # pylint: disable=R0903
+    def __init__(self, user_id, email, user_name, user_last_name):
+        self.user_id = user_id
+        self.email = email
+        self.user_name = user_name
+        self.user_last_name = user_last_name
+
+
+class DictUserStatus:
+    """
+    The original UserStatus layout, with a per-instance __dict__
+    """
+    # pylint: disable=R0903
+    def __init__(self, status_id, user_id, status_text):
+        self.status_id = status_id
+        self.user_id = user_id
+        self.status_text = status_text
+
+
+def measure(factory, rows):
+    """
+    Builds a status_id -> record dict of the given size and returns the
+    number of bytes allocated for it, strings included.
+    """
+    gc.collect()
+    tracemalloc.start()
+    database = {}
+    for i in range(rows):
+        user_id = f"user{i % 2000}"
+        status_id = f"{user_id}_{i:05d}"
+        database[status_id] = factory(status_id, user_id, f"Status text number {i}")
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del database
+    return size
+
+
+def measure_users(factory, rows):
+    """
+    Builds a user_id -> record dict of the given size and returns the
+    number of bytes allocated for it, strings included.
+    """
+    gc.collect()
+    tracemalloc.start()
+    database = {}
+    for i in range(rows):
+        user_id = f"user{i}"
+        database[user_id] = factory(user_id, f"{user_id}@uw.edu", "Eve", "Miles")
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del database
+    return size
+
+
+def main(sizes):
+    """
+    Prints a comparison table for every requested size
+    """
+    print(f"| {'Collection':<12} | {'Rows':>10} | {'__dict__':>10} | {'__slots__':>10} | {'Saved':>6} |")
+    print(f"|{'-' * 14}|{'-' * 12}|{'-' * 12}|{'-' * 12}|{'-' * 8}|")
+    for rows in sizes:
+        for name, func, old, new in (
+                ('users', measure_users, DictUsers, users.Users),
+                ('statuses', measure, DictUserStatus, user_status.UserStatus)):
+            old_size = func(old, rows)
+            new_size = func(new, rows)
+            saved = 100 * (old_size - new_size) / old_size
+            print(f"| {name:<12} | {rows:>10,} | {old_size / 2 ** 20:>8.1f}MB "
+                  f"| {new_size / 2 ** 20:>8.1f}MB | {saved:>5.1f}% |")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
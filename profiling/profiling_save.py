@@ -0,0 +1,75 @@
+"""
+Profiling save_status_updates: the original per-row DictWriter save
+against the atomic, buffered writerows save, plain and gzip-compressed.
+
+Run from the project root: python -m profiling.profiling_save [rows]
+"""
+import os
+import sys
+import tempfile
+from csv import DictWriter
+
+import main
+import user_status
+from profiling.timeit_decorator import timeit
+
+DEFAULT_ROWS = 1_000_000
+
+
+@timeit
+def benchmark_save_per_row(status_filename, status_collection):
+    """
+    The original save_status_updates: one writerow call per status into
+    the target file opened with "r+"
+    """
+    with open(status_filename, "r+", encoding="utf-8") as file:
+        writer = DictWriter(file, fieldnames=["STATUS_ID", "USER_ID", "STATUS_TEXT"])
+        writer.writeheader()
+        for status in status_collection.database.values():
+            writer.writerow(
+                {
+                    "STATUS_ID": status.status_id,
+                    "USER_ID": status.user_id,
+                    "STATUS_TEXT": status.status_text,
+                }
+            )
+
+
+@timeit
+def benchmark_save_atomic(status_filename, status_collection):
+    """
+    save_status_updates: writerows into a temporary file, then os.replace
+    """
+    main.save_status_updates(status_filename, status_collection)
+
+
+@timeit
+def benchmark_save_atomic_gzip(status_filename, status_collection):
+    """
+    save_status_updates with gzip compression
+    """
+    main.save_status_updates(status_filename, status_collection, compress=True)
+
+
+def main_benchmark(rows):
+    """
+    Saves a collection of rows statuses with each method
+    """
+    status_collection = user_status.UserStatusCollection()
+    status_collection.add_statuses_many(
+        (f"user{i % 20_000}_{i:07d}", f"user{i % 20_000}", f"Status text, number {i}")
+        for i in range(rows))
+    print(f"Saving {rows:,} statuses")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'status_updates.csv')
+        with open(filename, 'w', encoding='utf-8'):
+            pass
+        for benchmark, name in ((benchmark_save_per_row, filename),
+                                (benchmark_save_atomic, filename),
+                                (benchmark_save_atomic_gzip, filename + '.gz')):
+            benchmark(name, status_collection)
+            print(f"  {os.path.getsize(name) / 2 ** 20:.1f}MB")
+
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
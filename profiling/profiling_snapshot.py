@@ -0,0 +1,87 @@
+"""
+Profiling cold start: parsing status_updates.csv vs. mapping a snapshot.
+
+Writes a synthetic status file of the requested size to a temporary
+directory, then times the CSV bulk loader against load_snapshot.
+Run from the project root: python -m profiling.profiling_snapshot [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import main
+import user_status
+from profiling.timeit_decorator import timeit
+
+DEFAULT_ROWS = 2_000_000
+
+
+def write_statuses(filename, rows):
+    """
+    Writes a synthetic status file with rows statuses over 20k users
+    """
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as file:
+        file.write('STATUS_ID,USER_ID,STATUS_TEXT\n')
+        for i in range(rows):
+            user_id = f"user{i % 20_000}"
+            file.write(f'{user_id}_{i:07d},{user_id},"Status text, number {i}"\n')
+
+
+@timeit
+def benchmark_load_csv(filename):
+    """
+    Cold start through the CSV bulk loader
+    """
+    collection = user_status.UserStatusCollection()
+    main.load_status_updates_bulk(filename, collection)
+    return collection
+
+
+@timeit
+def benchmark_save_snapshot(collection, filename):
+    """
+    Writing the snapshot once
+    """
+    collection.save_snapshot(filename)
+
+
+@timeit
+def benchmark_load_snapshot(filename):
+    """
+    Cold start by memory-mapping the snapshot
+    """
+    return user_status.UserStatusCollection.load_snapshot(filename)
+
+
+@timeit
+def benchmark_search_statuses(collection, count):
+    """
+    First access of count statuses, each decoded from the snapshot
+    """
+    for i in range(0, len(collection.database), max(len(collection.database) // count, 1)):
+        collection.search_status(f"user{i % 20_000}_{i:07d}")
+
+
+def main_benchmark(rows):
+    """
+    Runs every benchmark on a file of rows statuses
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_filename = os.path.join(tmp_dir, 'status_updates.csv')
+        snapshot_filename = csv_filename + main.SNAPSHOT_SUFFIX
+        start = time.perf_counter()
+        write_statuses(csv_filename, rows)
+        print(f"Wrote {rows:,} statuses in {time.perf_counter() - start:.2f}s")
+        collection = benchmark_load_csv(csv_filename)
+        benchmark_save_snapshot(collection, snapshot_filename)
+        del collection
+        print(f"CSV: {os.path.getsize(csv_filename) / 2 ** 20:.1f}MB, "
+              f"snapshot: {os.path.getsize(snapshot_filename) / 2 ** 20:.1f}MB")
+        collection = benchmark_load_snapshot(snapshot_filename)
+        benchmark_search_statuses(collection, 10_000)
+        del collection
+
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
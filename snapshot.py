@@ -0,0 +1,200 @@
+"""
+Compact binary snapshots of the in-memory collections
+
+File layout (all integers little-endian):
+- header: MAGIC, field count (u32), record count (u64), offset of the
+  key table (u64), offset of the record index (u64)
+- records, sorted by key: every field but the key as a u32 byte length
+  followed by its UTF-8 bytes
+- key table: u64 byte length followed by the sorted, NUL separated
+  UTF-8 keys
+- record index: record count + 1 u64 offsets, record i spans
+  offsets[i]:offsets[i + 1]
+
+Loading maps the file into memory and only decodes the key table, so
+lookups are a binary search over the keys. Records are decoded each time
+they are read and are not kept, so reading every record, as a save
+does, leaves memory use where it was.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from operator import itemgetter
+
+MAGIC = b'SNSNAP02'
+HEADER = struct.Struct('<8sIQQQ')
+FIELD_LENGTH = struct.Struct('<I')
+BLOCK_LENGTH = struct.Struct('<Q')
+DELETED = object()
+
+
+def save(filename, field_count, rows):
+    '''
+    Writes rows, an iterable of tuples of field_count strings keyed by
+    their first field, to filename
+
+    The snapshot is written to a temporary file which then replaces
+    filename, so an interrupted save never leaves a partial snapshot.
+    '''
+    rows = sorted(rows, key=itemgetter(0))
+    offsets = array('Q')
+    pack_length = FIELD_LENGTH.pack
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'wb', buffering=1 << 20) as file:
+        file.write(bytes(HEADER.size))
+        pos = HEADER.size
+        for row in rows:
+            offsets.append(pos)
+            record = b''.join(pack_length(len(data)) + data
+                              for data in (field.encode('utf-8') for field in row[1:]))
+            file.write(record)
+            pos += len(record)
+        offsets.append(pos)
+        key_table = '\0'.join(row[0] for row in rows).encode('utf-8')
+        file.write(BLOCK_LENGTH.pack(len(key_table)))
+        file.write(key_table)
+        index_pos = pos + BLOCK_LENGTH.size + len(key_table)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        offsets.tofile(file)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, field_count, len(rows), pos, index_pos))
+    os.replace(tmp_filename, filename)
+
+
+def load(filename, factory):
+    '''
+    Maps filename into memory and returns a SnapshotRecords mapping whose
+    records are built with factory(key, *fields) on first access
+
+    Raises ValueError if filename is not a snapshot.
+    '''
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise ValueError(f'{filename} is not a snapshot file')
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, field_count, count, key_pos, index_pos = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        buffer.close()
+        raise ValueError(f'{filename} is not a snapshot file')
+    (key_length,) = BLOCK_LENGTH.unpack_from(buffer, key_pos)
+    key_start = key_pos + BLOCK_LENGTH.size
+    keys = buffer[key_start:key_start + key_length].decode('utf-8').split('\0') if count else []
+    offsets = memoryview(buffer)[index_pos:index_pos + 8 * (count + 1)].cast('Q')
+    if sys.byteorder != 'little':
+        offsets = array('Q', offsets.tobytes())
+        offsets.byteswap()
+    return SnapshotRecords(buffer, keys, offsets, field_count, factory)
+
+
+class SnapshotRecords(MutableMapping):
+    '''
+    Mapping of key -> record backed by a memory-mapped snapshot
+
+    Keys are iterated in sorted order, followed by keys added since the
+    snapshot was loaded. Only records added or replaced are kept, in an
+    in-memory overlay where deleted keys are marked with DELETED; records
+    read from the file are decoded on every access.
+    '''
+
+    def __init__(self, buffer, keys, offsets, field_count, factory):
+        self._buffer = buffer
+        self._keys = keys
+        self._offsets = offsets
+        self._field_count = field_count
+        self._factory = factory
+        self._overlay = {}
+        self._length = len(keys)
+
+    def _find(self, key):
+        '''
+        Returns the record number of key in the file, or None
+        '''
+        number = bisect_left(self._keys, key)
+        if number < len(self._keys) and self._keys[number] == key:
+            return number
+        return None
+
+    def _decode(self, number):
+        '''
+        Builds the record stored as record number number
+        '''
+        buffer = self._buffer
+        pos = self._offsets[number]
+        fields = [self._keys[number]]
+        for _ in range(self._field_count - 1):
+            (length,) = FIELD_LENGTH.unpack_from(buffer, pos)
+            pos += FIELD_LENGTH.size
+            fields.append(buffer[pos:pos + length].decode('utf-8'))
+            pos += length
+        return self._factory(*fields)
+
+    def __getitem__(self, key):
+        record = self._overlay.get(key)
+        if record is None:
+            number = self._find(key)
+            if number is None:
+                raise KeyError(key)
+            return self._decode(number)
+        if record is DELETED:
+            raise KeyError(key)
+        return record
+
+    def __setitem__(self, key, record):
+        if key not in self:
+            self._length += 1
+        self._overlay[key] = record
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._overlay[key] = DELETED
+        self._length -= 1
+
+    def __contains__(self, key):
+        record = self._overlay.get(key)
+        if record is None:
+            return self._find(key) is not None
+        return record is not DELETED
+
+    def __iter__(self):
+        overlay = self._overlay
+        for key in self._keys:
+            if overlay.get(key) is not DELETED:
+                yield key
+        for key, record in list(overlay.items()):
+            if record is not DELETED and self._find(key) is None:
+                yield key
+
+    def __len__(self):
+        return self._length
+
+    def copy(self):
+        '''
+        Returns a copy sharing the mapped file and the key table, with
+        its own overlay
+        '''
+        duplicate = SnapshotRecords(self._buffer, self._keys, self._offsets,
+                                    self._field_count, self._factory)
+        duplicate._overlay = self._overlay.copy()
+        duplicate._length = self._length
+        return duplicate
+
+    def values(self):
+        '''
+        Yields every record, decoding the ones that were not replaced
+        '''
+        overlay = self._overlay
+        for number, key in enumerate(self._keys):
+            record = overlay.get(key)
+            if record is None:
+                yield self._decode(number)
+            elif record is not DELETED:
+                yield record
+        for key, record in list(overlay.items()):
+            if record is not DELETED and self._find(key) is None:
+                yield record
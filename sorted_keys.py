@@ -0,0 +1,77 @@
+'''
+Sorted set of keys for keyset pagination and the prefix indexes of the
+collections
+
+Keys are kept in a list of sorted buckets of about BUCKET_SIZE keys, plus
+the list of the last key of every bucket. Finding a key is a binary
+search over the bucket ends and then within one bucket, and inserting or
+removing one only shifts the keys of its bucket, so the index stays
+cheap to maintain at millions of keys, unlike a single sorted list.
+'''
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+BUCKET_SIZE = 1000
+
+
+class SortedKeys():
+    '''
+    Sorted set of distinct keys
+    '''
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[start:start + BUCKET_SIZE]
+                         for start in range(0, len(keys), BUCKET_SIZE)]
+        self._ends = [bucket[-1] for bucket in self._buckets]
+        self._length = len(keys)
+
+    def __len__(self):
+        return self._length
+
+    def add(self, key):
+        '''
+        Adds a key that is not in the set
+        '''
+        self._length += 1
+        if not self._buckets:
+            self._buckets.append([key])
+            self._ends.append(key)
+            return
+        number = min(bisect_left(self._ends, key), len(self._ends) - 1)
+        bucket = self._buckets[number]
+        insort(bucket, key)
+        self._ends[number] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self._buckets[number:number + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._ends[number:number + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def remove(self, key):
+        '''
+        Removes a key of the set
+        '''
+        number = bisect_left(self._ends, key)
+        bucket = self._buckets[number]
+        del bucket[bisect_left(bucket, key)]
+        self._length -= 1
+        if bucket:
+            self._ends[number] = bucket[-1]
+        else:
+            del self._buckets[number]
+            del self._ends[number]
+
+    def after(self, key=None):
+        '''
+        Generator over the keys greater than key, or all keys if key is
+        None, in sorted order
+        '''
+        if key is None:
+            number = position = 0
+        else:
+            number = bisect_right(self._ends, key)
+            if number == len(self._ends):
+                return
+            position = bisect_right(self._buckets[number], key)
+        for bucket in islice(self._buckets, number, None):
+            yield from islice(bucket, position, None)
+            position = 0
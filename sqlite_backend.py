@@ -0,0 +1,319 @@
+'''
+SQLite storage for the user and status collections
+
+SQLiteUserCollection and SQLiteStatusCollection have the methods of
+users.UserCollection and user_status.UserStatusCollection that main.py
+uses, so the same loaders and menu functions run against a database
+file. The *_many methods are the bulk-write path: each batch looks up
+the keys that already exist with one query per chunk of keys, then
+writes the accepted rows with executemany in a single transaction.
+'''
+import sqlite3
+from itertools import islice
+
+import bulk
+from user_status import UserStatus
+from users import Users
+
+# keys per "IN (...)" lookup, below SQLite's limit on query parameters
+KEY_CHUNK = 500
+
+
+def chunks(keys, size=KEY_CHUNK):
+    '''
+    Generator over lists of at most size keys
+    '''
+    keys = iter(keys)
+    while chunk := list(islice(keys, size)):
+        yield chunk
+
+
+class SQLiteCollection():
+    '''
+    Base class holding the connection and the key lookups of one table
+    '''
+    TABLE = None
+    KEY = None
+    SCHEMA = ()
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        '''
+        Closes the connection
+        '''
+        self.connection.close()
+
+    def _existing(self, keys):
+        '''
+        Returns the set of keys that are in the table
+        '''
+        found = set()
+        for chunk in chunks(keys):
+            query = (f'SELECT {self.KEY} FROM {self.TABLE} '
+                     f'WHERE {self.KEY} IN ({",".join("?" * len(chunk))})')
+            found.update(key for (key,) in self.connection.execute(query, chunk))
+        return found
+
+    def _contains(self, key):
+        '''
+        Returns True if key is in the table
+        '''
+        query = f'SELECT 1 FROM {self.TABLE} WHERE {self.KEY} = ?'
+        return self.connection.execute(query, (key,)).fetchone() is not None
+
+    def _delete(self, key):
+        '''
+        Deletes key and returns True if it was in the table
+        '''
+        with self.connection:
+            cursor = self.connection.execute(f'DELETE FROM {self.TABLE} WHERE {self.KEY} = ?', (key,))
+        return cursor.rowcount == 1
+
+    def _delete_many(self, keys):
+        '''
+        Deletes many keys in one transaction and returns a BulkResult
+        '''
+        keys = list(keys)
+        existing = self._existing(keys)
+        rejected = [(key, bulk.DOES_NOT_EXIST) for key in keys if key not in existing]
+        with self.connection:
+            self.connection.executemany(f'DELETE FROM {self.TABLE} WHERE {self.KEY} = ?',
+                                        ((key,) for key in existing))
+        return bulk.BulkResult(len(existing), rejected)
+
+    def _split_new(self, rows):
+        '''
+        Splits rows keyed by their first field into the rows whose key is
+        not taken, first occurrence winning, and the rejections
+        '''
+        rows = list(rows)
+        taken = self._existing(row[0] for row in rows)
+        accepted = []
+        rejected = []
+        for row in rows:
+            if row[0] in taken:
+                rejected.append((row[0], bulk.ALREADY_EXISTS))
+                continue
+            taken.add(row[0])
+            accepted.append(row)
+        return accepted, rejected
+
+    def _split_existing(self, rows):
+        '''
+        Splits rows keyed by their first field into the rows whose key
+        exists and the rejections
+        '''
+        rows = list(rows)
+        existing = self._existing(row[0] for row in rows)
+        accepted = [row for row in rows if row[0] in existing]
+        rejected = [(row[0], bulk.DOES_NOT_EXIST) for row in rows if row[0] not in existing]
+        return accepted, rejected
+
+
+class SQLiteUserCollection(SQLiteCollection):
+    '''
+    Users stored in the users table of a SQLite database
+    '''
+    TABLE = 'users'
+    KEY = 'user_id'
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, email TEXT NOT NULL, '
+        'email_key TEXT NOT NULL, user_name TEXT NOT NULL, user_last_name TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS users_email_key ON users (email_key)',
+    )
+    INSERT = 'INSERT INTO users VALUES (?, ?, ?, ?, ?)'
+    UPDATE = 'UPDATE users SET email = ?, email_key = ?, user_name = ?, user_last_name = ? WHERE user_id = ?'
+    COLUMNS = 'user_id, email, user_name, user_last_name'
+
+    def add_user(self, user_id, email, user_name, user_last_name):
+        '''
+        Adds a new user to the collection
+        '''
+        try:
+            with self.connection:
+                self.connection.execute(self.INSERT, (user_id, email, email.casefold(),
+                                                      user_name, user_last_name))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def add_users_many(self, rows):
+        '''
+        Adds many users in one transaction
+
+        Returns a BulkResult; rows whose user_id already exists are rejected.
+        '''
+        accepted, rejected = self._split_new(rows)
+        with self.connection:
+            self.connection.executemany(self.INSERT, ((user_id, email, email.casefold(), name, last_name)
+                                                      for user_id, email, name, last_name in accepted))
+        return bulk.BulkResult(len(accepted), rejected)
+
+    def modify_user(self, user_id, email, user_name, user_last_name):
+        '''
+        Modifies an existing user
+        '''
+        with self.connection:
+            cursor = self.connection.execute(self.UPDATE, (email, email.casefold(), user_name,
+                                                           user_last_name, user_id))
+        return cursor.rowcount == 1
+
+    def modify_users_many(self, rows):
+        '''
+        Modifies many existing users in one transaction and returns a BulkResult
+        '''
+        accepted, rejected = self._split_existing(rows)
+        with self.connection:
+            self.connection.executemany(self.UPDATE, ((email, email.casefold(), name, last_name, user_id)
+                                                      for user_id, email, name, last_name in accepted))
+        return bulk.BulkResult(len(accepted), rejected)
+
+    def delete_user(self, user_id):
+        '''
+        Deletes an existing user
+        '''
+        return self._delete(user_id)
+
+    def delete_users_many(self, user_ids):
+        '''
+        Deletes many existing users in one transaction and returns a BulkResult
+        '''
+        return self._delete_many(user_ids)
+
+    def search_user(self, user_id):
+        '''
+        Searches for user data
+        '''
+        row = self.connection.execute(f'SELECT {self.COLUMNS} FROM users WHERE user_id = ?',
+                                      (user_id,)).fetchone()
+        return Users(*row) if row else Users(None, None, None, None)
+
+    def search_user_by_email(self, email):
+        '''
+        Searches for user data by email, ignoring case
+        '''
+        row = self.connection.execute(f'SELECT {self.COLUMNS} FROM users WHERE email_key = ? '
+                                      'ORDER BY rowid LIMIT 1', (email.casefold(),)).fetchone()
+        return Users(*row) if row else Users(None, None, None, None)
+
+    def snapshot(self):
+        '''
+        Returns a dict of user_id -> user read in one query
+        '''
+        return {row[0]: Users(*row)
+                for row in self.connection.execute(f'SELECT {self.COLUMNS} FROM users')}
+
+
+class SQLiteStatusCollection(SQLiteCollection):
+    '''
+    Status messages stored in the statuses table of a SQLite database
+    '''
+    TABLE = 'statuses'
+    KEY = 'status_id'
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS statuses (status_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, '
+        'status_text TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS statuses_user_id ON statuses (user_id)',
+    )
+    INSERT = 'INSERT INTO statuses VALUES (?, ?, ?)'
+    UPDATE = 'UPDATE statuses SET user_id = ?, status_text = ? WHERE status_id = ?'
+
+    def add_status(self, status_id, user_id, status_text):
+        '''
+        Adds a new status message and returns it, or False if status_id
+        already exists
+        '''
+        try:
+            with self.connection:
+                self.connection.execute(self.INSERT, (status_id, user_id, status_text))
+        except sqlite3.IntegrityError:
+            return False
+        return UserStatus(status_id, user_id, status_text)
+
+    def add_statuses_many(self, rows, user_ids=None):
+        '''
+        Adds many status messages in one transaction
+
+        Returns a BulkResult; rows whose status_id already exists are
+        rejected, and so are rows whose user_id is not in user_ids, when
+        a set of them is given.
+        '''
+        accepted, rejected = self._split_new(rows)
+        if user_ids is not None:
+            rejected.extend((row[0], bulk.UNKNOWN_USER) for row in accepted if row[1] not in user_ids)
+            accepted = [row for row in accepted if row[1] in user_ids]
+        with self.connection:
+            self.connection.executemany(self.INSERT, accepted)
+        return bulk.BulkResult(len(accepted), rejected)
+
+    def modify_status(self, status_id, user_id, status_text):
+        '''
+        Modifies an existing status message
+        '''
+        with self.connection:
+            cursor = self.connection.execute(self.UPDATE, (user_id, status_text, status_id))
+        return cursor.rowcount == 1
+
+    def modify_statuses_many(self, rows):
+        '''
+        Modifies many status messages in one transaction and returns a BulkResult
+        '''
+        accepted, rejected = self._split_existing(rows)
+        with self.connection:
+            self.connection.executemany(self.UPDATE, ((user_id, status_text, status_id)
+                                                      for status_id, user_id, status_text in accepted))
+        return bulk.BulkResult(len(accepted), rejected)
+
+    def delete_status(self, status_id):
+        '''
+        Deletes an existing status message
+        '''
+        return self._delete(status_id)
+
+    def delete_statuses_many(self, status_ids):
+        '''
+        Deletes many status messages in one transaction and returns a BulkResult
+        '''
+        return self._delete_many(status_ids)
+
+    def delete_statuses_by_user(self, user_id):
+        '''
+        Deletes every status message of user_id and returns how many
+        '''
+        with self.connection:
+            cursor = self.connection.execute('DELETE FROM statuses WHERE user_id = ?', (user_id,))
+        return cursor.rowcount
+
+    def search_status(self, status_id):
+        '''
+        Find and return a status message by its status_id
+        '''
+        row = self.connection.execute('SELECT * FROM statuses WHERE status_id = ?',
+                                      (status_id,)).fetchone()
+        return UserStatus(*row) if row else UserStatus(None, None, None)
+
+    def search_statuses_by_user(self, user_id):
+        '''
+        Returns a list of every status message posted by user_id
+        '''
+        return [UserStatus(*row) for row in
+                self.connection.execute('SELECT * FROM statuses WHERE user_id = ?', (user_id,))]
+
+    def count_statuses_by_user(self, user_id):
+        '''
+        Returns the number of status messages posted by user_id
+        '''
+        return self.connection.execute('SELECT COUNT(*) FROM statuses WHERE user_id = ?',
+                                       (user_id,)).fetchone()[0]
+
+    def snapshot(self):
+        '''
+        Returns a dict of status_id -> status message read in one query
+        '''
+        return {row[0]: UserStatus(*row) for row in self.connection.execute('SELECT * FROM statuses')}
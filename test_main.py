@@ -3,15 +3,26 @@ Unittests for main.py
 """
 # pylint: disable=C0116,C0301,W1503
 
+import gzip
 import unittest
 import io
+import os
+import tempfile
+import threading
+from csv import DictReader
+from functools import partial
 
 from unittest import TestCase
 from unittest.mock import patch, Mock, mock_open
 
+import bulk
+import csv_shards
+import journal
+import locks
 import main
 import users
 import user_status
+import validation
 
 
 class UsersTest(TestCase):
@@ -34,26 +45,18 @@ class UsersTest(TestCase):
         expected = type(users.UserCollection())
         self.assertEqual(type(main.init_user_collection()), expected)
 
+    def test_users_record_has_no_dict(self):
+        user = users.Users('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        self.assertFalse(hasattr(user, '__dict__'))
+        self.assertEqual(user.user_last_name, 'Le')
+
     def test_load_users(self):
         test_user_collection = users.UserCollection()
         self.assertTrue(main.load_users('accounts.csv', test_user_collection))
 
     def test_load_users_empty_string(self):
-        main.DictReader = Mock(return_value=iter([
-            {
-                'USER_ID': 'ale314',
-                'EMAIL': '',
-                'NAME': 'Audrey',
-                'LASTNAME': 'Le'
-            },
-            {
-                'USER_ID': 'bryce5',
-                'EMAIL': 'bryce.b@gmail.com',
-                'NAME': 'Bryce',
-                'LASTNAME': 'Brown'
-            },
-        ]))
-        with patch('main.open', mock_open()):
+        data = 'USER_ID,EMAIL,NAME,LASTNAME\nale314,,Audrey,Le\nbryce5,bryce.b@gmail.com,Bryce,Brown\n'
+        with patch('main.open', mock_open(read_data=data)):
             with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
                 outcome = main.load_users('file.csv', users.UserCollection())
                 print_out = [x.strip() for x in mock_stdout.getvalue().strip().splitlines()]
@@ -72,21 +75,8 @@ class UsersTest(TestCase):
                 self.assertEqual(print_out,
                                  ['Encountered exception while loading account list:'])
     def test_load_users_key_error(self):
-        main.DictReader = Mock(return_value=iter([
-            {
-                'USERNAME': 'ale314',
-                'EMAIL': 'ale314@uw.edu',
-                'NICKNAME': 'Audette',
-                'LASTNAME': 'Le'
-            },
-            {
-                'USERNAME': 'bryce5',
-                'EMAIL': 'bryce.b@gmail.com',
-                'NICKNAME': 'Brice',
-                'LASTNAME': 'Brown'
-            },
-        ]))
-        with patch('main.open', mock_open()):
+        data = 'USERNAME,EMAIL,NICKNAME,LASTNAME\nale314,ale314@uw.edu,Audette,Le\nbryce5,bryce.b@gmail.com,Brice,Brown\n'
+        with patch('main.open', mock_open(read_data=data)):
             with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
                 outcome = main.load_users('file.csv', users.UserCollection())
                 print_out = [x.strip() for x in mock_stdout.getvalue().strip().splitlines()]
@@ -113,6 +103,34 @@ class UsersTest(TestCase):
         test_user_collection.add_user('peterpan1', 'peter1@gmail.com', 'Peter', 'Pan')
         self.assertTrue(main.delete_user('peterpan1', test_user_collection))
 
+    def test_iter_users_pages(self):
+        test_user_collection = users.UserCollection()
+        for user_id in ('wendyd', 'ale314', 'peterpan1', 'bryce05'):
+            test_user_collection.add_user(user_id, f'{user_id}@uw.edu', 'Name', 'Last')
+        page = test_user_collection.iter_users(limit=2)
+        self.assertEqual([user.user_id for user in page], ['ale314', 'bryce05'])
+        test_user_collection.add_user('captain', 'captain@uw.edu', 'James', 'Hook')
+        test_user_collection.delete_user('peterpan1')
+        page = test_user_collection.iter_users(after=page[-1].user_id, limit=2)
+        self.assertEqual([user.user_id for user in page], ['captain', 'wendyd'])
+        self.assertEqual(test_user_collection.iter_users(after='wendyd'), [])
+
+    def test_delete_user_cascade(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet')
+        test_status_collection.add_status('bryce05_00001', 'bryce05', 'Gong xi fa cai!')
+        test_status_collection.add_status('ale314_00002', 'ale314', 'Hi')
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.delete_user('ale314', test_user_collection, cascade=True))
+            self.assertTrue(main.delete_user('ale314', test_user_collection, cascade=True,
+                                             status_collection=test_status_collection))
+            self.assertIn('Deleted 2 statuses of the user', mock_stdout.getvalue())
+        self.assertEqual(list(test_status_collection.database), ['bryce05_00001'])
+        self.assertEqual(test_status_collection.count_statuses_by_user('ale314'), 0)
+        self.assertEqual(test_status_collection.delete_statuses_by_user('ale314'), 0)
+
     def test_delete_user_fail(self):
         test_user_collection = users.UserCollection()
         test_user_collection.add_user('peterpan1', 'peter1@gmail.com', 'Peter', 'Pan')
@@ -128,9 +146,120 @@ class UsersTest(TestCase):
         test_user = main.search_user('gru88', test_user_collection)
         self.assertEqual(None, test_user)
 
+    def test_find_users_by_prefix(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        test_user_collection.add_user('alcon49', 'aconejo@conejo.com', 'alvaro', 'Conejo')
+        test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+        find = test_user_collection.find_users_by_prefix
+        self.assertEqual([user.user_id for user in find('user_name', 'A')], ['alcon49', 'ale314'])
+        self.assertEqual([user.user_id for user in find('user_name', 'al', limit=1)], ['alcon49'])
+        self.assertEqual([user.user_id for user in find('user_last_name', 'b')], ['bryce05'])
+        self.assertEqual(find('user_name', 'z'), [])
+        with self.assertRaises(ValueError):
+            find('email', 'a')
+
+    def test_prefix_index_follows_mutations(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        self.assertEqual(len(test_user_collection.find_users_by_prefix('user_name', 'au')), 1)
+        test_user_collection.modify_user('ale314', 'ale314@uw.edu', 'Eve', 'Le')
+        test_user_collection.add_users_many([('evmiles97', 'eve.miles@uw.edu', 'Eve', 'Miles')])
+        self.assertEqual(test_user_collection.find_users_by_prefix('user_name', 'au'), [])
+        self.assertEqual(len(test_user_collection.find_users_by_prefix('user_name', 'eve')), 2)
+        test_user_collection.delete_user('ale314')
+        self.assertEqual([user.user_id for user in test_user_collection.find_users_by_prefix('user_name', 'E')],
+                         ['evmiles97'])
+
+    def test_prefix_index_bulk_load_across_buckets(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        find = test_user_collection.find_users_by_prefix
+        self.assertEqual(len(find('user_name', 'a')), 1)
+        rows = [(f'user{number:05d}', f'user{number}@uw.edu', f'Name{number % 7}', 'Le')
+                for number in range(5000)]
+        self.assertEqual(test_user_collection.add_users_many(rows).count, 5000)
+        self.assertEqual(len(find('user_name', 'name3')), 714)
+        self.assertEqual([user.user_id for user in find('user_name', 'name0', limit=2)],
+                         ['user00000', 'user00007'])
+        test_user_collection.delete_users_many(user_id for user_id, *_ in rows[:2500])
+        self.assertEqual(len(find('user_name', 'name')), 2500)
+        self.assertEqual(len(find('user_last_name', 'le')), 2501)
+
+    def test_search_user_by_email(self):
+        test_user_collection = main.init_user_collection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        test_user_collection.add_user('audrey2', 'ALE314@uw.edu', 'Audrey', 'Le')
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertEqual(main.search_user_by_email('Ale314@UW.edu', test_user_collection).user_id, 'ale314')
+            self.assertIsNone(main.search_user_by_email('gru88@uw.edu', test_user_collection))
+        test_user_collection.modify_user('ale314', 'audrey@uw.edu', 'Audrey', 'Le')
+        self.assertEqual(test_user_collection.search_user_by_email('ale314@uw.edu').user_id, 'audrey2')
+        test_user_collection.delete_user('audrey2')
+        self.assertIsNone(test_user_collection.search_user_by_email('ale314@uw.edu').user_id)
+
+    def test_unique_emails(self):
+        test_user_collection = main.init_user_collection(unique_emails=True)
+        self.assertTrue(test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le'))
+        self.assertFalse(test_user_collection.add_user('audrey2', 'ALE314@uw.edu', 'Audrey', 'Le'))
+        self.assertTrue(test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown'))
+        self.assertFalse(test_user_collection.modify_user('bryce05', 'ale314@uw.edu', 'Bryce', 'Brown'))
+        self.assertTrue(test_user_collection.modify_user('ale314', 'Ale314@uw.edu', 'Audrey', 'Le'))
+        self.assertEqual(test_user_collection.add_users_many([
+            ('wendyd', 'wendy@uw.edu', 'Wendy', 'Darling'),
+            ('wendy2', 'wendy@uw.edu', 'Wendy', 'Darling'),
+            ('peterpan1', 'bryce05@gmail.com', 'Peter', 'Pan'),
+        ]), (1, [('wendy2', 'email already exists'), ('peterpan1', 'email already exists')]))
+        test_user_collection.delete_user('wendyd')
+        self.assertTrue(test_user_collection.add_user('wendy2', 'wendy@uw.edu', 'Wendy', 'Darling'))
+
+    def test_users_many(self):
+        test_user_collection = users.UserCollection(unique_emails=True)
+        result = main.add_users_many([('ale314', 'ale314@uw.edu', 'Audrey', 'Le'),
+                                      ('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown'),
+                                      ('ale314', 'audrey@uw.edu', 'Audrey', 'Le')], test_user_collection)
+        self.assertEqual(result.count, 2)
+        self.assertEqual(result.rejected, [('ale314', 'already exists')])
+        result = main.update_users_many([('ale314', 'audrey@uw.edu', 'Audrey', 'Le'),
+                                         ('bryce05', 'audrey@uw.edu', 'Bryce', 'Brown'),
+                                         ('gru88', 'gru@uw.edu', 'Gru', 'Minion')], test_user_collection)
+        self.assertEqual(result, (1, [('bryce05', 'email already exists'), ('gru88', 'does not exist')]))
+        self.assertEqual(test_user_collection.search_user('ale314').email, 'audrey@uw.edu')
+        result = main.delete_users_many(['ale314', 'gru88'], test_user_collection)
+        self.assertEqual(result, (1, [('gru88', 'does not exist')]))
+        self.assertEqual(list(test_user_collection.database), ['bryce05'])
+
     def test_save_users_success(self):
         test_user_collection = users.UserCollection()
-        self.assertTrue(main.save_users('accounts.csv', test_user_collection))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.assertTrue(main.save_users(os.path.join(tmp_dir, 'accounts.csv'), test_user_collection))
+
+    def test_save_users_replaces_file(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'accounts.csv')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('USER_ID,EMAIL,NAME,LASTNAME\n' + 'stale,row,with,data\n' * 10)
+            with patch("sys.stdout", new_callable=io.StringIO):
+                self.assertTrue(main.save_users(path, test_user_collection))
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(file.read(), 'USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+            self.assertEqual(os.listdir(tmp_dir), ['accounts.csv'])
+
+    def test_save_users_keeps_file_on_error(self):
+        def rows():
+            yield ('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+            raise OSError('disk full')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'accounts.csv')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('USER_ID,EMAIL,NAME,LASTNAME\n')
+            with self.assertRaises(OSError):
+                main.write_csv(path, main.USER_COLUMNS, rows())
+            self.assertEqual(os.listdir(tmp_dir), ['accounts.csv'])
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(file.read(), 'USER_ID,EMAIL,NAME,LASTNAME\n')
 
     def test_save_users_file_not_found(self):
         with patch('main.open', mock_open()) as mock_file:
@@ -150,6 +279,65 @@ class UserStatusTest(TestCase):
     def test_init_status_collection(self):
         expected = type(user_status.UserStatusCollection())
         self.assertEqual(type(main.init_status_collection()), expected)
+    def test_status_record_has_no_dict(self):
+        status = user_status.UserStatus('ale314_00001', 'ale314', 'Happy Tet')
+        self.assertFalse(hasattr(status, '__dict__'))
+        self.assertEqual(status.status_text, 'Happy Tet')
+
+    def test_next_status_id(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00007', 'ale314', 'Happy Tet')
+        test_status_collection.add_status('ale314_00002', 'ale314', 'Hi')
+        test_status_collection.add_status('ale314_intro', 'ale314', 'Hello')
+        self.assertEqual(test_status_collection.next_status_id('ale314'), 'ale314_00008')
+        self.assertEqual(test_status_collection.next_status_id('bryce05'), 'bryce05_00001')
+        test_status_collection.add_status('ale314_00020', 'ale314', 'Later')
+        test_status_collection.delete_status('ale314_00020')
+        # deleted numbers are never handed out again
+        self.assertEqual(test_status_collection.add_status_auto('ale314', 'Hey').status_id,
+                         'ale314_00021')
+
+    def test_add_status_auto_threads(self):
+        test_status_collection = user_status.UserStatusCollection()
+        def add_many():
+            for i in range(200):
+                test_status_collection.add_status_auto('ale314', f'status {i}')
+        threads = [threading.Thread(target=add_many) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(test_status_collection.count_statuses_by_user('ale314'), 800)
+        self.assertEqual(sorted(test_status_collection.database),
+                         [f'ale314_{i:05d}' for i in range(1, 801)])
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertEqual(main.add_status_auto('ale314', 'Hi', test_status_collection),
+                             'ale314_00801')
+
+    def test_iter_statuses_pages(self):
+        test_status_collection = user_status.UserStatusCollection()
+        for status_id in ('bryce05_00002', 'ale314_00002', 'bryce05_00001', 'ale314_00001'):
+            test_status_collection.add_status(status_id, status_id.split('_')[0], 'Hi')
+        self.assertEqual([status.status_id for status in test_status_collection.iter_statuses(limit=3)],
+                         ['ale314_00001', 'ale314_00002', 'bryce05_00001'])
+        test_status_collection.delete_status('bryce05_00001')
+        test_status_collection.add_status('ale314_00003', 'ale314', 'Hey')
+        page = test_status_collection.iter_statuses(after='ale314_00002')
+        self.assertEqual([status.status_id for status in page], ['ale314_00003', 'bryce05_00002'])
+        page = test_status_collection.iter_statuses(after='ale314_00001', limit=1, user_id='ale314')
+        self.assertEqual([status.status_id for status in page], ['ale314_00002'])
+        page = test_status_collection.iter_statuses(user_id='ale314', limit=None)
+        self.assertEqual(len(page), 3)
+        # the per-user index built above follows later writes
+        test_status_collection.add_status('ale314_00000', 'ale314', 'Hello')
+        test_status_collection.delete_status('ale314_00002')
+        test_status_collection.modify_status('ale314_00003', 'bryce05', 'Hey')
+        page = test_status_collection.iter_statuses(user_id='ale314', limit=None)
+        self.assertEqual([status.status_id for status in page], ['ale314_00000', 'ale314_00001'])
+        page = test_status_collection.iter_statuses(after='ale314_00003', user_id='bryce05')
+        self.assertEqual([status.status_id for status in page], ['bryce05_00002'])
+        self.assertEqual(test_status_collection.iter_statuses(user_id='nobody'), [])
+
     def test_load_status_updates_success(self):
         """
         This unit test is gimmicky because it generates a key error and can't read the status_text.
@@ -160,19 +348,8 @@ class UserStatusTest(TestCase):
         self.assertTrue(main.load_status_updates('status_updates.csv', test_status_collection))
 
     def test_load_status_updates_key_error(self):
-        main.DictReader = Mock(return_value=iter([
-            {
-                'STATUS_ID': 'ale314_00002',
-                'USER_ID': 'ale314',
-                'TEXT': 'Happy Year of the Rabbit!'
-            },
-            {
-                'STATUS_ID': 'bryce05_00002',
-                'USER_ID': 'bryce05',
-                'TEXT': 'Gong xi fa cai!'
-            },
-        ]))
-        with patch('main.open', mock_open()):
+        data = 'STATUS_ID,USER_ID,TEXT\nale314_00002,ale314,Happy Year of the Rabbit!\nbryce05_00002,bryce05,Gong xi fa cai!\n'
+        with patch('main.open', mock_open(read_data=data)):
             with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
                 main.load_status_updates('file.csv', user_status.UserStatusCollection())
                 print_out = [x.strip() for x in mock_stdout.getvalue().strip().splitlines()]
@@ -191,19 +368,8 @@ class UserStatusTest(TestCase):
                 self.assertEqual(print_out,
                                  ['File not found! Encountered exception while loading account list:'])
     def test_load_status_updates_empty_string(self):
-        main.DictReader = Mock(return_value=iter([
-            {
-                'USER_ID': 'ale314_00002',
-                'STATUS_ID': 'ale314',
-                'STATUS_TEXT': ''
-            },
-            {
-                'USER_ID': 'bryce05_00002',
-                'STATUS_ID': 'bryce05',
-                'STATUS_TEXT': 'Gong xi fa cai!'
-            },
-        ]))
-        with patch('main.open', mock_open()):
+        data = 'USER_ID,STATUS_ID,STATUS_TEXT\nale314_00002,ale314,\nbryce05_00002,bryce05,Gong xi fa cai!\n'
+        with patch('main.open', mock_open(read_data=data)):
             with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
                 outcome = main.load_status_updates('file.csv', users.UserCollection())
                 print_out = [x.strip() for x in mock_stdout.getvalue().strip().splitlines()]
@@ -242,9 +408,86 @@ class UserStatusTest(TestCase):
         test_status = main.search_status('wendyd', test_status_collection)
         self.assertEqual(None, test_status)
 
+    def test_search_statuses_by_user(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('peterpan1_00001', 'peterpan1', 'I am flying!')
+        test_status_collection.add_status('wendyd_00001', 'wendyd', 'I want to grow up')
+        test_status_collection.add_status('peterpan1_00002', 'peterpan1', 'Never grow up')
+        with patch("sys.stdout", new_callable=io.StringIO):
+            results = main.search_statuses_by_user('peterpan1', test_status_collection)
+            self.assertEqual([status.status_id for status in results], ['peterpan1_00001', 'peterpan1_00002'])
+            self.assertEqual(main.search_statuses_by_user('gru88', test_status_collection), [])
+            self.assertEqual(main.count_statuses_by_user('peterpan1', test_status_collection), 2)
+
+    def test_user_index_follows_mutations(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('peterpan1_00001', 'peterpan1', 'I am flying!')
+        self.assertEqual(test_status_collection.count_statuses_by_user('peterpan1'), 1)
+        test_status_collection.add_status('peterpan1_00002', 'peterpan1', 'Never grow up')
+        test_status_collection.modify_status('peterpan1_00001', 'wendyd', 'I want to grow up')
+        self.assertEqual(test_status_collection.count_statuses_by_user('peterpan1'), 1)
+        self.assertEqual(test_status_collection.count_statuses_by_user('wendyd'), 1)
+        test_status_collection.delete_status('peterpan1_00002')
+        self.assertEqual(test_status_collection.search_statuses_by_user('peterpan1'), [])
+        self.assertEqual(test_status_collection.search_statuses_by_user('wendyd')[0].status_text,
+                         'I want to grow up')
+
+    def test_search_status_text(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet! Happy new year')
+        test_status_collection.add_status('bryce05_00001', 'bryce05', 'Sunny in Seattle, happy')
+        test_status_collection.add_status('bryce05_00002', 'bryce05', 'Perfect weather for a hike')
+        search = test_status_collection.search_status_text
+        self.assertEqual([status.status_id for status in search('happy')], ['ale314_00001', 'bryce05_00001'])
+        self.assertEqual([status.status_id for status in search('HAPPY seattle')], ['bryce05_00001'])
+        self.assertEqual([status.status_id for status in search(['seattle', 'hike'], mode='any', limit=1)],
+                         ['bryce05_00001'])
+        self.assertEqual(search('rain'), [])
+        self.assertEqual(search('!!'), [])
+        with self.assertRaises(ValueError):
+            search('happy', mode='most')
+
+    def test_word_index_follows_mutations(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet')
+        self.assertEqual(len(test_status_collection.search_status_text('tet')), 1)
+        test_status_collection.modify_status('ale314_00001', 'ale314', 'Rainy day')
+        test_status_collection.add_status('ale314_00002', 'ale314', 'Another rainy day')
+        self.assertEqual(test_status_collection.search_status_text('tet'), [])
+        self.assertEqual(len(test_status_collection.search_status_text('rainy day')), 2)
+        test_status_collection.delete_status('ale314_00001')
+        self.assertEqual([status.status_id for status in test_status_collection.search_status_text('rainy')],
+                         ['ale314_00002'])
+
+    def test_statuses_many(self):
+        test_status_collection = user_status.UserStatusCollection()
+        result = main.add_statuses_many([('ale314_00001', 'ale314', 'Happy Tet'),
+                                         ('ale314_00001', 'ale314', 'Happy Tet again')], test_status_collection)
+        self.assertEqual(result, (1, [('ale314_00001', 'already exists')]))
+        result = main.update_statuses_many([('ale314_00001', 'bryce05', 'Gong xi fa cai!'),
+                                            ('gru88_00001', 'gru88', 'Bananas')], test_status_collection)
+        self.assertEqual(result, (1, [('gru88_00001', 'does not exist')]))
+        self.assertEqual(test_status_collection.count_statuses_by_user('bryce05'), 1)
+        result = main.delete_statuses_many(['ale314_00001', 'ale314_00001'], test_status_collection)
+        self.assertEqual(result, (1, [('ale314_00001', 'does not exist')]))
+        self.assertEqual(test_status_collection.database, {})
+
     def test_save_status_updates(self):
         test_user_collection = users.UserCollection()
-        self.assertTrue(main.save_status_updates('status_updates.csv', test_user_collection))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.assertTrue(main.save_status_updates(os.path.join(tmp_dir, 'status_updates.csv'),
+                                                     test_user_collection))
+
+    def test_save_status_updates_gzip(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet,\n"friends"')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'status_updates.csv.gz')
+            with patch("sys.stdout", new_callable=io.StringIO):
+                self.assertTrue(main.save_status_updates(path, test_status_collection, compress=True))
+            with gzip.open(path, 'rt', encoding='utf-8', newline='') as file:
+                self.assertEqual(list(validation.iter_rows(file, main.STATUS_SCHEMA)),
+                                 [('ale314_00001', 'ale314', 'Happy Tet,\n"friends"')])
 
     def test_save_status_updates_file_not_found(self):
         with patch('main.open', mock_open()) as mock_file:
@@ -267,5 +510,684 @@ class UserStatusTest(TestCase):
                                  ['Detailed error message:'])
 
 
+class TempFileTest(TestCase):
+    """
+    Base class for tests that work on files in a temporary directory
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_csv(self, text):
+        path = os.path.join(self.tmp_dir.name, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+
+class BulkLoadTest(TempFileTest):
+    """
+    Unittests for the streaming bulk loaders
+    """
+    def test_load_users_bulk(self):
+        path = self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\n'
+                              'ale314,ale314@uw.edu,Audrey,Le\n'
+                              'bryce05,bryce05@gmail.com,Bryce,Brown\n'
+                              'ale314,other@uw.edu,Audrey,Le\n')
+        test_user_collection = users.UserCollection()
+        progress = Mock()
+        summary = main.load_users_bulk(path, test_user_collection, batch_size=2, progress=progress)
+        self.assertEqual((summary['loaded'], summary['skipped']), (2, 1))
+        self.assertGreater(summary['rows_per_second'], 0)
+        self.assertEqual(progress.call_count, 2)
+        self.assertEqual(test_user_collection.search_user('ale314').email, 'ale314@uw.edu')
+
+    def test_load_status_updates_bulk(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'ale314_00001,ale314,"Happy Tet,\nfrom Seattle"\n'
+                              '\n'
+                              'bryce05_00001,bryce05,Gong xi fa cai!\n')
+        test_status_collection = user_status.UserStatusCollection()
+        summary = main.load_status_updates_bulk(path, test_status_collection)
+        self.assertEqual((summary['loaded'], summary['skipped']), (2, 0))
+        self.assertEqual(test_status_collection.search_status('ale314_00001').status_text,
+                         'Happy Tet,\nfrom Seattle')
+        self.assertEqual(test_status_collection.count_statuses_by_user('bryce05'), 1)
+
+    def test_load_status_updates_bulk_errors(self):
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.load_status_updates_bulk(
+                self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\nale314_00001,ale 314,Hi\n'),
+                user_status.UserStatusCollection()))
+            self.assertIn('Line 2: USER_ID cannot contain whitespace', mock_stdout.getvalue())
+            self.assertFalse(main.load_status_updates_bulk(
+                self.write_csv('STATUS_ID,USER_ID,TEXT\nale314_00001,ale314,Hi\n'),
+                user_status.UserStatusCollection()))
+            self.assertIn("Detailed error message: 'STATUS_TEXT'", mock_stdout.getvalue())
+            self.assertFalse(main.load_users_bulk(os.path.join(self.tmp_dir.name, 'missing.csv'),
+                                                  users.UserCollection()))
+            self.assertFalse(main.load_users_bulk(
+                self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\nale314,,Audrey,Le\n'),
+                users.UserCollection()))
+            self.assertIn('Line 2: EMAIL is empty', mock_stdout.getvalue())
+
+    def test_rows_before_a_bad_row_are_kept(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n' +
+                              ''.join(f'a_{number:05d},a,Hi\n' for number in range(1, 51)) +
+                              'b_00001,b b,Hi\n'
+                              'c_00001,c,Hey\n')
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            for load in (partial(main.load_status_updates_bulk, batch_size=100),
+                         partial(main.load_status_updates_bulk, batch_size=7),
+                         partial(main.load_status_updates_parallel, workers=2)):
+                test_status_collection = user_status.UserStatusCollection()
+                self.assertFalse(load(path, test_status_collection))
+                self.assertEqual(len(test_status_collection.database), 50)
+            self.assertIn('Line 52: USER_ID cannot contain whitespace', mock_stdout.getvalue())
+
+    def test_load_status_updates_bulk_skip_bad_rows(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'a_00001,a,"Hello\nthere"\n'
+                              'b_00001,b b,\n'
+                              'c_00001,c,Hey\n'
+                              'd_00001,d\n')
+        test_status_collection = user_status.UserStatusCollection()
+        summary = main.load_status_updates_bulk(path, test_status_collection, skip_bad_rows=True)
+        self.assertEqual((summary['loaded'], summary['invalid']), (2, 2))
+        self.assertEqual(summary['report'].errors,
+                         [(4, ['STATUS_TEXT is empty', 'USER_ID cannot contain whitespace'],
+                           ['b_00001', 'b b', '']),
+                          (6, ['expected 3 fields, found 2'], ['d_00001', 'd'])])
+        self.assertEqual(list(test_status_collection.database), ['a_00001', 'c_00001'])
+
+    def test_validate_status_updates(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'a_00001,a,Hello\n'
+                              ',b,Hi\n')
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            report = main.validate_status_updates(path)
+            self.assertEqual(report.bad_rows, 1)
+            self.assertIn("Line 3: STATUS_ID is empty: ['', 'b', 'Hi']", mock_stdout.getvalue())
+            self.assertIsNone(main.validate_users(path))
+            self.assertIn('Missing column', mock_stdout.getvalue())
+
+
+class IntegrityTest(TempFileTest):
+    """
+    Unittests for the referential integrity check and orphan rejection
+    """
+    def setUp(self):
+        super().setUp()
+        self.user_collection = users.UserCollection()
+        self.user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        self.user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+        self.status_path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                                          'ale314_00001,ale314,Happy Tet\n'
+                                          'ghost_00001,ghost,Boo\n'
+                                          'ale314_00001,ale314,Again\n'
+                                          'ale314_00002,ale314,Hi\n')
+
+    def test_check_integrity_file(self):
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            result = main.check_integrity(self.user_collection, self.status_path)
+            self.assertIn('Checked 3 statuses of 2 users: 1 orphans, 1 duplicates',
+                          mock_stdout.getvalue())
+        self.assertEqual(result['orphans'], [('ghost_00001', 'ghost')])
+        self.assertEqual(result['duplicates'], ['ale314_00001'])
+        self.assertEqual(result['counts'], {'ale314': 2, 'ghost': 1})
+
+    def test_check_integrity_collections(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('bryce05_00001', 'bryce05', 'Gong xi fa cai!')
+        test_status_collection.add_status('evmiles97_00001', 'evmiles97', 'Code is compiling')
+        with patch("sys.stdout", new_callable=io.StringIO):
+            result = main.check_integrity(self.user_collection, test_status_collection)
+            self.assertEqual(result['orphans'], [('evmiles97_00001', 'evmiles97')])
+            self.assertFalse(main.check_integrity('missing.csv', test_status_collection))
+
+    def test_load_status_updates_rejects_orphans(self):
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertTrue(main.load_status_updates(self.status_path, test_status_collection,
+                                                     self.user_collection))
+            self.assertIn('Rejected status of unknown user', mock_stdout.getvalue())
+        self.assertEqual(list(test_status_collection.database), ['ale314_00001', 'ale314_00002'])
+
+    def test_load_status_updates_stops_at_bad_row(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'ale314_00001,ale314,Hi\n'
+                              'ale314_00002,ale 314,Hello\n'
+                              'ale314_00003,ale314,Hey\n')
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.load_status_updates(path, test_status_collection))
+            self.assertIn("User ID cannot contain space: {'STATUS_ID': 'ale314_00002'",
+                          mock_stdout.getvalue())
+        self.assertEqual(list(test_status_collection.database), ['ale314_00001'])
+
+    def test_bulk_loaders_reject_orphans(self):
+        for load in (main.load_status_updates_bulk, partial(main.load_status_updates_parallel,
+                                                            workers=2)):
+            test_status_collection = user_status.UserStatusCollection()
+            summary = load(self.status_path, test_status_collection,
+                           user_collection=self.user_collection)
+            self.assertEqual((summary['loaded'], summary['skipped'], summary['orphans']), (2, 2, 1))
+            self.assertNotIn('ghost_00001', test_status_collection.database)
+
+
+class ParallelLoadTest(TempFileTest):
+    """
+    Unittests for the sharded parallel status loader
+    """
+    def test_record_boundaries_skip_quoted_newlines(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'a_00001,a,"one\ntwo"\n'
+                              'b_00001,b,"say ""hi""\n"\n')
+        header, data_start = csv_shards.read_header(path)
+        self.assertEqual(header, ['STATUS_ID', 'USER_ID', 'STATUS_TEXT'])
+        self.assertEqual(data_start, 30)
+        # offsets inside the first quoted field land on the end of that record
+        self.assertEqual(csv_shards.record_boundaries(path, data_start, [35, 50, 200]), [50, 74, 74])
+
+    def test_load_status_updates_parallel_matches_bulk(self):
+        lines = ['STATUS_ID,USER_ID,STATUS_TEXT']
+        for i in range(500):
+            text = f'"line {i}\nwith ""quotes"", and commas"' if i % 3 else f'plain {i}'
+            lines.append(f'status_{i % 400:05d},user{i % 7},{text}')
+        path = self.write_csv('\n'.join(lines) + '\n')
+        expected = user_status.UserStatusCollection()
+        main.load_status_updates_bulk(path, expected)
+        test_status_collection = user_status.UserStatusCollection()
+        summary = main.load_status_updates_parallel(path, test_status_collection, workers=2)
+        self.assertEqual((summary['loaded'], summary['skipped']), (400, 100))
+        self.assertEqual(list(test_status_collection.database), list(expected.database))
+        self.assertEqual([status.status_text for status in test_status_collection.database.values()],
+                         [status.status_text for status in expected.database.values()])
+
+    def test_load_status_updates_parallel_bad_row(self):
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'a_00001,a,Hello\n'
+                              'b_00001,b b,Hi\n'
+                              'c_00001,c,Hey\n')
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.load_status_updates_parallel(path, test_status_collection, workers=2))
+            self.assertIn('Line 3: USER_ID cannot contain whitespace', mock_stdout.getvalue())
+        self.assertEqual(list(test_status_collection.database), ['a_00001'])
+
+    def test_load_status_updates_parallel_skip_bad_rows(self):
+        lines = ['STATUS_ID,USER_ID,STATUS_TEXT']
+        for i in range(300):
+            user_id = f'user {i}' if i % 50 == 0 else f'user{i}'
+            lines.append(f'status_{i:05d},{user_id},"line {i}\nof text"')
+        path = self.write_csv('\n'.join(lines) + '\n')
+        test_status_collection = user_status.UserStatusCollection()
+        summary = main.load_status_updates_parallel(path, test_status_collection, workers=2,
+                                                    skip_bad_rows=True)
+        self.assertEqual((summary['loaded'], summary['invalid']), (294, 6))
+        # every record spans two lines after the header
+        self.assertEqual([line for line, _, _ in summary['report'].errors],
+                         [2 + 2 * i for i in range(0, 300, 50)])
+
+
+class SnapshotTest(TempFileTest):
+    """
+    Unittests for binary snapshots of the collections
+    """
+    def test_user_snapshot_round_trip(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Lê')
+        test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+        path = os.path.join(self.tmp_dir.name, 'users.snap')
+        test_user_collection.save_snapshot(path)
+        loaded = users.UserCollection.load_snapshot(path)
+        self.assertEqual(list(loaded.database), ['ale314', 'bryce05'])
+        self.assertEqual(loaded.search_user('ale314').user_last_name, 'Lê')
+        self.assertIsNone(loaded.search_user('gru88').user_id)
+        self.assertTrue(loaded.modify_user('bryce05', 'b@uw.edu', 'Bryce', 'Brown'))
+        self.assertTrue(loaded.delete_user('ale314'))
+        self.assertTrue(loaded.add_user('wendyd', 'wendy@uw.edu', 'Wendy', 'Darling'))
+        self.assertEqual([user.email for user in loaded.database.values()], ['b@uw.edu', 'wendy@uw.edu'])
+
+    def test_frozen_view_of_mapped_collection(self):
+        test_user_collection = users.UserCollection()
+        test_user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        path = os.path.join(self.tmp_dir.name, 'users.snap')
+        test_user_collection.save_snapshot(path)
+        loaded = users.UserCollection.load_snapshot(path)
+        view = loaded.snapshot()
+        loaded.modify_user('ale314', 'audrey@uw.edu', 'Audrey', 'Le')
+        loaded.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+        self.assertEqual([user.email for user in view.values()], ['ale314@uw.edu'])
+        self.assertEqual([user.email for user in loaded.database.values()],
+                         ['audrey@uw.edu', 'bryce05@gmail.com'])
+
+    def test_status_snapshot_is_decoded_lazily(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet,\n"friends"')
+        test_status_collection.add_status('ale314_00002', 'ale314', '')
+        path = os.path.join(self.tmp_dir.name, 'status.snap')
+        test_status_collection.save_snapshot(path)
+        loaded = user_status.UserStatusCollection.load_snapshot(path)
+        self.assertEqual(loaded.database._overlay, {})  # pylint: disable=W0212
+        self.assertEqual(loaded.search_status('ale314_00001').status_text, 'Happy Tet,\n"friends"')
+        self.assertIn('ale314_00002', loaded.database)
+        self.assertEqual(loaded.count_statuses_by_user('ale314'), 2)
+        self.assertEqual(len(list(loaded.snapshot().values())), 2)
+        self.assertEqual(loaded.database._overlay, {})  # pylint: disable=W0212
+        self.assertTrue(loaded.modify_status('ale314_00001', 'ale314', 'Hi'))
+        self.assertTrue(loaded.delete_status('ale314_00002'))
+        self.assertEqual(len(loaded.database), 1)
+        self.assertEqual(list(loaded.database._overlay), ['ale314_00001', 'ale314_00002'])  # pylint: disable=W0212
+        self.assertEqual([status.status_text for status in loaded.database.values()], ['Hi'])
+
+    def test_empty_and_invalid_snapshots(self):
+        path = os.path.join(self.tmp_dir.name, 'empty.snap')
+        users.UserCollection().save_snapshot(path)
+        self.assertEqual(len(users.UserCollection.load_snapshot(path).database), 0)
+        with self.assertRaises(ValueError):
+            users.UserCollection.load_snapshot(self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\n'))
+
+    def test_load_collection_prefers_fresh_snapshot(self):
+        path = self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            collection = main.load_collection(path, users.UserCollection, main.load_users_bulk)
+            self.assertIsInstance(collection.database, dict)
+            self.assertTrue(main.save_snapshot(path, collection))
+            collection = main.load_collection(path, users.UserCollection, main.load_users_bulk)
+            self.assertNotIsInstance(collection.database, dict)
+            self.assertEqual(collection.search_user('ale314').email, 'ale314@uw.edu')
+            os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+            collection = main.load_collection(path, users.UserCollection, main.load_users_bulk)
+            self.assertIsInstance(collection.database, dict)
+            self.assertFalse(main.save_snapshot(os.path.join(self.tmp_dir.name, 'no', 'dir'), collection))
+            self.assertIn('from snapshot', mock_stdout.getvalue())
+
+
+class JournalTest(TempFileTest):
+    """
+    Unittests for the append-only journal of mutations
+    """
+    def test_status_journal_replay(self):
+        log = os.path.join(self.tmp_dir.name, 'status.log')
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertEqual(main.open_journal(log, test_status_collection, sync_every=2), 0)
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet,\n"friends"')
+        test_status_collection.add_statuses_many([('ale314_00002', 'ale314', 'Hi'), ('ale314_00001', 'x', 'y')])
+        test_status_collection.modify_status('ale314_00002', 'bryce05', 'Hello')
+        test_status_collection.delete_status('ale314_00001')
+        test_status_collection.delete_status('ale314_00001')
+        test_status_collection.journal.close()
+        self.assertEqual(len(list(journal.read(log))), 4)
+        with open(log, 'a', encoding='utf-8') as file:
+            file.write('["delete","ale3')
+        replayed = user_status.UserStatusCollection()
+        self.assertEqual(journal.replay(log, replayed), 4)
+        self.assertEqual(list(replayed.database), ['ale314_00002'])
+        self.assertEqual(replayed.search_status('ale314_00002').user_id, 'bryce05')
+
+    def test_user_journal_compaction(self):
+        base = self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+        log = base + '.log'
+        test_user_collection = users.UserCollection()
+        with patch("sys.stdout", new_callable=io.StringIO):
+            main.load_users_bulk(base, test_user_collection)
+            main.open_journal(log, test_user_collection)
+            test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+            test_user_collection.modify_user('ale314', 'audrey@uw.edu', 'Audrey', 'Le')
+            test_user_collection.journal.sync()
+            self.assertGreater(os.path.getsize(log), 0)
+            restarted = users.UserCollection()
+            main.load_users_bulk(base, restarted)
+            self.assertEqual(main.open_journal(log, restarted), 2)
+            self.assertEqual(restarted.search_user('ale314').email, 'audrey@uw.edu')
+            self.assertTrue(main.compact_journal(base, test_user_collection, main.save_users))
+            self.assertEqual(os.path.getsize(log), 0)
+            restarted = users.UserCollection()
+            main.load_users_bulk(base, restarted)
+            self.assertEqual(main.open_journal(log, restarted), 0)
+            self.assertEqual(list(restarted.database), ['ale314', 'bryce05'])
+            self.assertFalse(main.compact_journal(os.path.join(self.tmp_dir.name, 'no', 'base.csv'),
+                                                  test_user_collection, main.save_users))
+        restarted.journal.close()
+        test_user_collection.journal.close()
+
+    def test_compaction_keeps_writes_made_during_the_save(self):
+        base = self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+        log = base + '.log'
+        test_user_collection = users.UserCollection(concurrent=True)
+
+        def save_while_writing(filename, frozen):
+            test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+            return main.save_users(filename, frozen)
+
+        with patch("sys.stdout", new_callable=io.StringIO):
+            main.load_users_bulk(base, test_user_collection)
+            main.open_journal(log, test_user_collection)
+            test_user_collection.modify_user('ale314', 'audrey@uw.edu', 'Audrey', 'Le')
+            self.assertTrue(main.compact_journal(base, test_user_collection, save_while_writing))
+            test_user_collection.journal.close()
+            self.assertFalse(os.path.exists(log + journal.ROTATED_SUFFIX))
+            restarted = users.UserCollection()
+            main.load_users_bulk(base, restarted)
+            self.assertEqual(main.open_journal(log, restarted), 1)
+        restarted.journal.close()
+        self.assertEqual(sorted(restarted.database), ['ale314', 'bryce05'])
+        self.assertEqual(restarted.search_user('ale314').email, 'audrey@uw.edu')
+
+    def test_failed_compaction_is_replayed_and_retried(self):
+        base = self.write_csv('USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+        log = base + '.log'
+        test_user_collection = users.UserCollection()
+        with patch("sys.stdout", new_callable=io.StringIO):
+            main.load_users_bulk(base, test_user_collection)
+            main.open_journal(log, test_user_collection)
+            test_user_collection.add_user('bryce05', 'bryce05@gmail.com', 'Bryce', 'Brown')
+            self.assertFalse(main.compact_journal(base, test_user_collection, lambda *args: False))
+            test_user_collection.delete_user('ale314')
+            test_user_collection.journal.sync()
+            restarted = users.UserCollection()
+            main.load_users_bulk(base, restarted)
+            self.assertEqual(main.open_journal(log, restarted), 2)
+            restarted.journal.close()
+            self.assertEqual(list(restarted.database), ['bryce05'])
+            self.assertFalse(main.compact_journal(base, test_user_collection, lambda *args: False))
+            self.assertEqual(len(list(journal.read(log + journal.ROTATED_SUFFIX))), 2)
+            self.assertTrue(main.compact_journal(base, test_user_collection, main.save_users))
+            self.assertFalse(os.path.exists(log + journal.ROTATED_SUFFIX))
+        test_user_collection.journal.close()
+        with open(base, encoding='utf-8') as file:
+            self.assertEqual([row['USER_ID'] for row in DictReader(file)], ['bryce05'])
+
+
+
+class BatchTest(TempFileTest):
+    """
+    Unittests for the batch command runner and the command line
+    """
+    def write_file(self, name, text):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def test_run_batch_jsonl(self):
+        path = self.write_file('ops.jsonl',
+                               '["add_user", "ale314", "ale314@uw.edu", "Audrey", "Le"]\n'
+                               '{"op": "add_status", "status_id": "ale314_00001", "user_id": "ale314",'
+                               ' "status_text": "Happy Tet"}\n'
+                               '\n'
+                               '["add_user", "ale314", "other@uw.edu", "Audrey", "Le"]\n'
+                               '["update_status", "ale314_00001", "ale314", "Happy New Year"]\n'
+                               '["delete_status", "gru88_00001"]\n')
+        test_user_collection = users.UserCollection()
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            summary = main.run_batch(path, test_user_collection, test_status_collection,
+                                     progress_every=2)
+            main.print_batch_summary(summary)
+            self.assertIn('Applied 4 operations', mock_stdout.getvalue())
+            self.assertIn('add_user: 1 applied, 1 rejected', mock_stdout.getvalue())
+        self.assertEqual(summary['total'], 5)
+        self.assertEqual(summary['operations']['delete_status'], {'applied': 0, 'rejected': 1})
+        self.assertEqual(test_status_collection.search_status('ale314_00001').status_text,
+                         'Happy New Year')
+
+    def test_run_batch_csv_errors(self):
+        path = self.write_file('ops.csv',
+                               'add_status,ale314_00001,ale314,"Happy Tet,\nfrom Seattle"\n'
+                               'delete_user,ale314,extra\n')
+        test_status_collection = user_status.UserStatusCollection()
+        with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            self.assertFalse(main.run_batch(path, users.UserCollection(), test_status_collection))
+            self.assertIn('Line 3: delete_user expects 1 fields', mock_stdout.getvalue())
+            self.assertFalse(main.run_batch(self.write_file('bad.jsonl', '["drop_table"]\n'),
+                                            users.UserCollection(), test_status_collection))
+            self.assertIn("Line 1: unknown operation 'drop_table'", mock_stdout.getvalue())
+        self.assertEqual(test_status_collection.search_status('ale314_00001').status_text,
+                         'Happy Tet,\nfrom Seattle')
+
+    def test_run_batch_json_types(self):
+        for text, expected in (('{"op": ["add_user"]}\n', 'Line 2: not an operation'),
+                               ('["delete_user", 314]\n', 'Line 2: operation and fields must be strings'),
+                               ('{"op": "delete_status", "status_id": {}}\n',
+                                'Line 2: operation and fields must be strings')):
+            path = self.write_file('ops.jsonl', '["delete_user", "ale314"]\n' + text)
+            with patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+                self.assertFalse(main.run_batch(path, users.UserCollection(),
+                                                user_status.UserStatusCollection()))
+                self.assertIn(expected, mock_stdout.getvalue())
+
+    def test_run_cli_batch_save(self):
+        users_path = self.write_file('accounts.csv', 'USER_ID,EMAIL,NAME,LASTNAME\n'
+                                                     'ale314,ale314@uw.edu,Audrey,Le\n')
+        statuses_path = self.write_file('status_updates.csv', 'STATUS_ID,USER_ID,STATUS_TEXT\n')
+        ops_path = self.write_file('ops.csv', 'add_status,ale314_00001,ale314,Hi\n'
+                                              'update_user,ale314,audrey@uw.edu,Audrey,Le\n')
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertTrue(main.run_cli(['--users', users_path, '--statuses', statuses_path,
+                                          '--batch', ops_path, '--save']))
+        with open(users_path, encoding='utf-8') as file:
+            self.assertIn('audrey@uw.edu', file.read())
+        with open(statuses_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'STATUS_ID,USER_ID,STATUS_TEXT\nale314_00001,ale314,Hi\n')
+
+    def test_run_cli_batch_journal(self):
+        users_path = self.write_file('accounts.csv', 'USER_ID,EMAIL,NAME,LASTNAME\n'
+                                                     'ale314,ale314@uw.edu,Audrey,Le\n')
+        statuses_path = self.write_file('status_updates.csv', 'STATUS_ID,USER_ID,STATUS_TEXT\n')
+        ops_path = self.write_file('ops.csv', 'add_status,ale314_00001,ale314,Hi\n')
+        more_ops_path = self.write_file('more.csv', 'update_status,ale314_00001,ale314,Hello\n')
+        arguments = ['--users', users_path, '--statuses', statuses_path, '--journal', '--batch']
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertTrue(main.run_cli(arguments + [ops_path]))
+            self.assertEqual(len(list(journal.read(statuses_path + main.JOURNAL_SUFFIX))), 1)
+            self.assertTrue(main.run_cli(arguments + [more_ops_path, '--save']))
+        self.assertEqual(os.path.getsize(statuses_path + main.JOURNAL_SUFFIX), 0)
+        with open(statuses_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'STATUS_ID,USER_ID,STATUS_TEXT\nale314_00001,ale314,Hello\n')
+
+    def test_main_menu_journal(self):
+        users_path = self.write_file('accounts.csv', 'USER_ID,EMAIL,NAME,LASTNAME\n')
+        statuses_path = self.write_file('status_updates.csv', 'STATUS_ID,USER_ID,STATUS_TEXT\n')
+        answers = [users_path, statuses_path, 'c', 'ale314', 'ale314@uw.edu', 'Audrey', 'Le', 'g', 'q']
+        with patch('builtins.input', side_effect=answers), \
+                patch("sys.stdout", new_callable=io.StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit):
+                main.main_menu(journaled=True)
+            self.assertIn('Successfully saved changes to the journal.', mock_stdout.getvalue())
+        self.assertEqual(list(journal.read(users_path + main.JOURNAL_SUFFIX)),
+                         [['add', 'ale314', 'ale314@uw.edu', 'Audrey', 'Le']])
+        answers = [users_path, statuses_path, 'h', 'ale314_00001', 'ale314', 'Hi', 'n', 'q']
+        with patch('builtins.input', side_effect=answers), \
+                patch("sys.stdout", new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                main.main_menu(journaled=True)
+        with open(users_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'USER_ID,EMAIL,NAME,LASTNAME\nale314,ale314@uw.edu,Audrey,Le\n')
+        with open(statuses_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'STATUS_ID,USER_ID,STATUS_TEXT\nale314_00001,ale314,Hi\n')
+        self.assertEqual(os.path.getsize(users_path + main.JOURNAL_SUFFIX), 0)
+
+    def test_main_menu_status_options(self):
+        users_path = self.write_file('accounts.csv', 'USER_ID,EMAIL,NAME,LASTNAME\n')
+        statuses_path = self.write_file('status_updates.csv', 'STATUS_ID,USER_ID,STATUS_TEXT\n')
+        answers = [users_path, statuses_path, 'h', 'ale314_00001', 'ale314', 'Hi', 'l', 'q']
+        with patch('builtins.input', side_effect=answers), \
+                patch("sys.stdout", new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                main.main_menu()
+        with open(statuses_path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'STATUS_ID,USER_ID,STATUS_TEXT\nale314_00001,ale314,Hi\n')
+
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class BackendScenario():
+    """
+    Runs the main.py API against the collections of one backend
+    """
+    backend = None
+
+    def collections(self):
+        return main.init_user_collection(backend=self.backend), \
+            main.init_status_collection(backend=self.backend)
+
+    def test_main_api(self):
+        user_collection, status_collection = self.collections()
+        path = self.write_csv('STATUS_ID,USER_ID,STATUS_TEXT\n'
+                              'ale314_00001,ale314,"Happy Tet,\nfrom Seattle"\n'
+                              'ale314_00002,ale314,Hi\n'
+                              'ale314_00001,ale314,Again\n'
+                              'ghost_00001,ghost,Boo\n')
+        with patch("sys.stdout", new_callable=io.StringIO):
+            self.assertTrue(main.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le', user_collection))
+            self.assertFalse(main.add_user('ale314', 'other@uw.edu', 'Audrey', 'Le', user_collection))
+            self.assertTrue(main.update_user('ale314', 'Audrey@UW.edu', 'Audrey', 'Le', user_collection))
+            self.assertEqual(main.search_user_by_email('audrey@uw.edu', user_collection).user_id, 'ale314')
+            summary = main.load_status_updates_bulk(path, status_collection, batch_size=2,
+                                                    user_collection=user_collection)
+            self.assertEqual((summary['loaded'], summary['skipped'], summary['orphans']), (2, 2, 1))
+            self.assertEqual(main.search_status('ale314_00001', status_collection).status_text,
+                             'Happy Tet,\nfrom Seattle')
+            self.assertEqual(main.count_statuses_by_user('ale314', status_collection), 2)
+            result = main.update_statuses_many([('ale314_00002', 'ale314', 'Hey'),
+                                                ('gru88_00001', 'gru88', 'Bananas')], status_collection)
+            self.assertEqual(result, (1, [('gru88_00001', bulk.DOES_NOT_EXIST)]))
+            self.assertEqual([status.status_text for status in
+                              main.search_statuses_by_user('ale314', status_collection)],
+                             ['Happy Tet,\nfrom Seattle', 'Hey'])
+            saved = os.path.join(self.tmp_dir.name, 'saved.csv')
+            self.assertTrue(main.save_status_updates(saved, status_collection))
+            self.assertTrue(main.delete_user('ale314', user_collection, cascade=True,
+                                             status_collection=status_collection))
+            self.assertIsNone(main.search_user('ale314', user_collection))
+            self.assertEqual(main.count_statuses_by_user('ale314', status_collection), 0)
+            result = main.add_users_many([('bryce05', 'b@gmail.com', 'Bryce', 'Brown'),
+                                          ('bryce05', 'c@gmail.com', 'Bryce', 'Brown')], user_collection)
+            self.assertEqual(result, (1, [('bryce05', bulk.ALREADY_EXISTS)]))
+            self.assertEqual(main.delete_users_many(['bryce05', 'gru88'], user_collection),
+                             (1, [('gru88', bulk.DOES_NOT_EXIST)]))
+        with open(saved, encoding='utf-8') as file:
+            self.assertEqual(len(list(validation.iter_rows(file, main.STATUS_SCHEMA))), 2)
+
+
+class MemoryBackendTest(BackendScenario, TempFileTest):
+    """
+    The main.py API on the in-memory collections
+    """
+    backend = 'memory'
+
+
+class SQLiteBackendTest(BackendScenario, TempFileTest):
+    """
+    The main.py API on the SQLite backend
+    """
+    backend = 'sqlite'
+
+    def test_file_is_shared(self):
+        path = os.path.join(self.tmp_dir.name, 'social.db')
+        user_collection = main.init_user_collection(backend='sqlite', path=path)
+        user_collection.add_user('ale314', 'ale314@uw.edu', 'Audrey', 'Le')
+        user_collection.close()
+        reopened = main.init_user_collection(backend='sqlite', path=path)
+        self.assertEqual(reopened.search_user('ale314').email, 'ale314@uw.edu')
+        reopened.close()
+        with self.assertRaises(ValueError):
+            main.init_user_collection(unique_emails=True, backend='sqlite')
+        with self.assertRaises(ValueError):
+            main.init_status_collection(backend='redis')
+
+
+@unittest.skipIf(mongomock is None, 'mongomock is not installed')
+class MongoBackendTest(BackendScenario, TempFileTest):
+    """
+    The main.py API on the MongoDB backend, against mongomock
+    """
+    backend = 'mongo'
+
+    def collections(self):
+        database = mongomock.MongoClient().social_network
+        return main.init_user_collection(backend='mongo', database=database), \
+            main.init_status_collection(backend='mongo', database=database)
+
+
+class ConcurrencyTest(TempFileTest):
+    """
+    Unittests for the opt-in concurrent mode of the collections
+    """
+    def test_rwlock_readers_share_writers_exclude(self):
+        lock = locks.RWLock()
+        both_reading = threading.Barrier(2, timeout=5)
+        def read():
+            with lock.read():
+                both_reading.wait()
+        reader = threading.Thread(target=read)
+        reader.start()
+        read()
+        reader.join()
+        events = []
+        def write():
+            lock.acquire_write()
+            events.append('write')
+        with lock.read():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(0.1)
+            # the writer waits for the reader
+            self.assertEqual(events, [])
+        writer.join(5)
+        self.assertEqual(events, ['write'])
+        lock.release_write()
+
+    def test_snapshot_is_frozen(self):
+        test_status_collection = user_status.UserStatusCollection()
+        test_status_collection.add_status('ale314_00001', 'ale314', 'Happy Tet')
+        test_status_collection.add_status('ale314_00002', 'ale314', 'Hi')
+        view = test_status_collection.snapshot()
+        record = view['ale314_00001']
+        test_status_collection.modify_status('ale314_00001', 'ale314', 'Happy New Year')
+        test_status_collection.delete_status('ale314_00002')
+        test_status_collection.add_status('bryce05_00001', 'bryce05', 'Gong xi fa cai!')
+        self.assertEqual(list(view), ['ale314_00001', 'ale314_00002'])
+        self.assertEqual(record.status_text, 'Happy Tet')
+        self.assertEqual(test_status_collection.search_status('ale314_00001').status_text,
+                         'Happy New Year')
+        self.assertEqual(list(test_status_collection.database), ['ale314_00001', 'bryce05_00001'])
+        with self.assertRaises(TypeError):
+            view['gru88_00001'] = record
+
+    def test_save_while_modifying(self):
+        test_user_collection = main.init_user_collection(concurrent=True)
+        test_user_collection.add_users_many((f'user{i}', f'user{i}@uw.edu', 'Name', 'Last')
+                                            for i in range(2000))
+        done = threading.Event()
+        def churn():
+            i = 0
+            while not done.is_set():
+                test_user_collection.add_user(f'new{i}', f'new{i}@uw.edu', 'New', 'User')
+                test_user_collection.delete_user(f'user{i % 2000}')
+                i += 1
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            with patch("sys.stdout", new_callable=io.StringIO):
+                for _ in range(5):
+                    self.assertTrue(main.save_users(os.path.join(self.tmp_dir.name, 'accounts.csv'),
+                                                    test_user_collection))
+        finally:
+            done.set()
+            writer.join()
+        self.assertIsInstance(main.init_status_collection(concurrent=True).lock, locks.RWLock)
+        self.assertIs(main.init_status_collection().lock, locks.NULL_LOCK)
+
+
 if __name__ == '__main__':
     unittest.main()
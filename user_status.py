@@ -2,12 +2,56 @@
 classes to manage the user status messages
 '''
 # pylint: disable=R0903
+import re
+import threading
+from collections import Counter
+from heapq import nsmallest
+from itertools import islice
+from types import MappingProxyType
+
+import bulk
+import locks
+import snapshot
+import sorted_keys
+
+WORD = re.compile(r'\w+')
+SEQUENCE_DIGITS = 5
+
+
+def tokenize(text):
+    '''
+    Returns the case-folded words of text
+    '''
+    return WORD.findall(text.casefold())
+
+
+def split_status_id(status_id):
+    '''
+    Returns the (user_id, sequence number) of a status_id following the
+    <user_id>_<NNNNN> convention, or None
+    '''
+    user_id, separator, sequence = status_id.rpartition('_')
+    if not separator or not sequence.isdigit():
+        return None
+    return user_id, int(sequence)
+
+
+def ranking_key(score):
+    '''
+    Sort key for (count, status_id) pairs: highest count first, ties
+    broken by status_id
+    '''
+    return -score[0], score[1]
 
 
 class UserStatus():
     '''
     class to hold status message data
+
+    Uses __slots__ instead of a per-instance __dict__ so that large
+    collections only pay for the three attribute references.
     '''
+    __slots__ = ('status_id', 'user_id', 'status_text')
 
     def __init__(self, status_id, user_id, status_text):
         self.status_id = status_id
@@ -18,11 +62,193 @@ class UserStatus():
 class UserStatusCollection():
     '''
     Collection of UserStatus messages
+
+    When journal is set to a journal.Journal, every successful mutation
+    is appended to it.
+
+    With concurrent=True the public methods are guarded by a
+    reader-writer lock, so the collection can be shared between threads;
+    code reading database directly should use snapshot() instead.
     '''
+    JOURNAL_OPERATIONS = {'add': 'add_status', 'modify': 'modify_status', 'delete': 'delete_status'}
 
-    def __init__(self):
+    def __init__(self, concurrent=False):
         self.database = {}
+        self.journal = None
+        self.lock = locks.new_lock(concurrent)
+        # user_id -> {status_id: None}, built on first use and kept in
+        # step with every mutation afterwards
+        self._by_user = None
+        # word -> {status_id: number of occurrences}, built on first use
+        self._by_word = None
+        # user_id -> highest sequence number used in its status_ids,
+        # built on first use; never lowered by deletes, so IDs are not reused
+        self._last_sequence = None
+        # sorted_keys.SortedKeys of every status_id, built on first use
+        self._sorted_ids = None
+        # user_id -> sorted_keys.SortedKeys of its status_ids, built per
+        # user the first time that user's messages are paged
+        self._sorted_by_user = {}
+        # True while database is shared with a view returned by snapshot()
+        self._shared = False
+        self._allocation_lock = threading.Lock()
+
+    def _log(self, operation, *fields):
+        '''
+        Appends a mutation to the journal, if there is one
+        '''
+        if self.journal is not None:
+            self.journal.append(operation, *fields)
+
+    def _user_index(self):
+        '''
+        Returns the user_id index, building it from the database if needed
+        '''
+        if self._by_user is None:
+            # built aside and published at once, as concurrent readers
+            # may build it at the same time
+            by_user = {}
+            for status in self.database.values():
+                by_user.setdefault(status.user_id, {})[status.status_id] = None
+            self._by_user = by_user
+        return self._by_user
+
+    def _word_index(self):
+        '''
+        Returns the full-text index, building it from the database if needed
+        '''
+        if self._by_word is None:
+            by_word = {}
+            for status in self.database.values():
+                self._index_words(by_word, status)
+            self._by_word = by_word
+        return self._by_word
+
+    def _key_index(self):
+        '''
+        Returns the sorted status_id index, building it if needed
+        '''
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted_keys.SortedKeys(self.database)
+        return self._sorted_ids
+
+    def _user_key_index(self, user_id):
+        '''
+        Returns the sorted status_id index of a user, building it if needed
+        '''
+        index = self._sorted_by_user.get(user_id)
+        if index is None:
+            index = sorted_keys.SortedKeys(self._user_index().get(user_id, ()))
+            if index:
+                self._sorted_by_user[user_id] = index
+        return index
+
+    def _sequence_index(self):
+        '''
+        Returns the highest sequence number per user, building it from
+        the database if needed
+        '''
+        if self._last_sequence is None:
+            self._last_sequence = {}
+            for status_id in self.database:
+                self._track_sequence(status_id)
+        return self._last_sequence
+
+    def _track_sequence(self, status_id):
+        '''
+        Raises the highest sequence number of the user of status_id
+        '''
+        parts = split_status_id(status_id)
+        if parts is not None:
+            user_id, sequence = parts
+            if sequence > self._last_sequence.get(user_id, 0):
+                self._last_sequence[user_id] = sequence
+
+    @staticmethod
+    def _index_words(by_word, status):
+        '''
+        Adds the words of a status to the full-text index by_word
+        '''
+        for word, count in Counter(tokenize(status.status_text)).items():
+            by_word.setdefault(word, {})[status.status_id] = count
+
+    def _index(self, status):
+        '''
+        Adds a status to the secondary indexes that have been built
+        '''
+        if self._by_user is not None:
+            self._by_user.setdefault(status.user_id, {})[status.status_id] = None
+        if status.user_id in self._sorted_by_user:
+            self._sorted_by_user[status.user_id].add(status.status_id)
+        if self._by_word is not None:
+            self._index_words(self._by_word, status)
+        if self._last_sequence is not None:
+            self._track_sequence(status.status_id)
+
+    def _unindex(self, status):
+        '''
+        Removes a status from the secondary indexes that have been built
+        '''
+        if self._by_user is not None:
+            status_ids = self._by_user[status.user_id]
+            del status_ids[status.status_id]
+            if not status_ids:
+                del self._by_user[status.user_id]
+        if status.user_id in self._sorted_by_user:
+            index = self._sorted_by_user[status.user_id]
+            index.remove(status.status_id)
+            if not index:
+                del self._sorted_by_user[status.user_id]
+        if self._by_word is not None:
+            for word in set(tokenize(status.status_text)):
+                postings = self._by_word[word]
+                del postings[status.status_id]
+                if not postings:
+                    del self._by_word[word]
+
+    def _writable(self):
+        '''
+        Returns database, first copying it if a snapshot shares it
+        '''
+        if self._shared:
+            self.database = self.database.copy()
+            self._shared = False
+        return self.database
+
+    def _insert(self, status_id, user_id, status_text):
+        """
+        Stores a new status message whose status_id is not taken
+        """
+        new_status = UserStatus(status_id, user_id, status_text)
+        self._writable()[status_id] = new_status
+        self._index(new_status)
+        if self._sorted_ids is not None:
+            self._sorted_ids.add(status_id)
+        self._log('add', status_id, user_id, status_text)
+        return new_status
+
+    def _update(self, status_id, user_id, status_text):
+        """
+        Assigns user_id and status_text to an existing status message
+
+        The message is replaced by a new record rather than changed in
+        place, so snapshots keep seeing the old one.
+        """
+        self._unindex(self.database[status_id])
+        status = self._writable()[status_id] = UserStatus(status_id, user_id, status_text)
+        self._index(status)
+        self._log('modify', status_id, user_id, status_text)
+
+    def _remove(self, status_id):
+        '''
+        Deletes an existing status message
+        '''
+        self._unindex(self._writable().pop(status_id))
+        if self._sorted_ids is not None:
+            self._sorted_ids.remove(status_id)
+        self._log('delete', status_id)
 
+    @locks.writing
     def add_status(self, status_id, user_id, status_text):
         """
         add a new status message to the collection
@@ -30,11 +256,69 @@ class UserStatusCollection():
         if status_id in self.database:
             # Rejects new status if status_id already exists
             return False
-        new_status = UserStatus(status_id, user_id, status_text)
-        self.database[status_id] = new_status
-        return new_status
+        return self._insert(status_id, user_id, status_text)
         # return True
 
+    @locks.writing
+    def add_statuses_many(self, rows, user_ids=None):
+        """
+        add many status messages in one call
+
+        rows is an iterable of (status_id, user_id, status_text) tuples.
+        Rows whose status_id already exists are rejected, and so are rows
+        whose user_id is not in user_ids, when a set of them is given.
+        Returns a BulkResult with the number of statuses added.
+        """
+        database = self.database
+        count = 0
+        rejected = []
+        for status_id, user_id, status_text in rows:
+            if status_id in database:
+                rejected.append((status_id, bulk.ALREADY_EXISTS))
+                continue
+            if user_ids is not None and user_id not in user_ids:
+                rejected.append((status_id, bulk.UNKNOWN_USER))
+                continue
+            self._insert(status_id, user_id, status_text)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.reading
+    def next_status_id(self, user_id):
+        '''
+        Allocates and returns the next free status_id of user_id, in the
+        <user_id>_<NNNNN> format
+
+        The number is reserved even if no status is added with it, so
+        concurrent callers never get the same status_id.
+        '''
+        with self._allocation_lock:
+            return self._allocate(user_id)
+
+    def _allocate(self, user_id):
+        '''
+        Reserves the next sequence number of user_id; the allocation lock
+        must be held
+        '''
+        last_sequence = self._sequence_index()
+        sequence = last_sequence.get(user_id, 0) + 1
+        last_sequence[user_id] = sequence
+        return f'{user_id}_{sequence:0{SEQUENCE_DIGITS}d}'
+
+    @locks.writing
+    def add_status_auto(self, user_id, status_text):
+        '''
+        Adds a status message under the next free status_id of user_id
+
+        Returns the new status message.
+        '''
+        with self._allocation_lock:
+            status_id = self._allocate(user_id)
+            while status_id in self.database:
+                status_id = self._allocate(user_id)
+            return self._insert(status_id, user_id, status_text)
+
+    @locks.writing
     def modify_status(self, status_id, user_id, status_text):
         """
         Modifies a status message
@@ -44,10 +328,28 @@ class UserStatusCollection():
         if status_id not in self.database:
             # Rejects update is the status_id does not exist
             return False
-        self.database[status_id].user_id = user_id
-        self.database[status_id].status_text = status_text
+        self._update(status_id, user_id, status_text)
         return True
 
+    @locks.writing
+    def modify_statuses_many(self, rows):
+        """
+        Modifies many status messages in one call
+
+        rows is an iterable of (status_id, user_id, status_text) tuples.
+        Returns a BulkResult with the number of statuses modified.
+        """
+        count = 0
+        rejected = []
+        for status_id, user_id, status_text in rows:
+            if status_id not in self.database:
+                rejected.append((status_id, bulk.DOES_NOT_EXIST))
+                continue
+            self._update(status_id, user_id, status_text)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.writing
     def delete_status(self, status_id):
         '''
         deletes the status message with id, status_id
@@ -55,9 +357,40 @@ class UserStatusCollection():
         if status_id not in self.database:
             # Fails if status does not exist
             return False
-        del self.database[status_id]
+        self._remove(status_id)
         return True
 
+    @locks.writing
+    def delete_statuses_many(self, status_ids):
+        '''
+        deletes many status messages in one call
+
+        Returns a BulkResult with the number of statuses deleted.
+        '''
+        count = 0
+        rejected = []
+        for status_id in status_ids:
+            if status_id not in self.database:
+                rejected.append((status_id, bulk.DOES_NOT_EXIST))
+                continue
+            self._remove(status_id)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.writing
+    def delete_statuses_by_user(self, user_id):
+        '''
+        deletes every status message posted by user_id
+
+        Uses the user_id index, so the cost is proportional to the number
+        of statuses of that user. Returns how many were deleted.
+        '''
+        status_ids = list(self._user_index().get(user_id, ()))
+        for status_id in status_ids:
+            self._remove(status_id)
+        return len(status_ids)
+
+    @locks.reading
     def search_status(self, status_id):
         '''
         Find and return a status message by its status_id
@@ -68,3 +401,126 @@ class UserStatusCollection():
             # Fails if the status does not exist
             return UserStatus(None, None, None)
         return self.database[status_id]
+
+    @locks.reading
+    def search_statuses_by_user(self, user_id):
+        '''
+        Returns a list of every status message posted by user_id
+
+        Uses the user_id index, so the cost is proportional to the
+        number of statuses of that user, not the size of the collection
+        '''
+        status_ids = self._user_index().get(user_id, ())
+        return [self.database[status_id] for status_id in status_ids]
+
+    @locks.reading
+    def count_statuses_by_user(self, user_id):
+        '''
+        Returns the number of status messages posted by user_id
+        '''
+        return len(self._user_index().get(user_id, ()))
+
+    @locks.reading
+    def search_status_text(self, terms, mode="all", limit=None):
+        '''
+        Returns the status messages containing the words in terms
+
+        terms is a string or an iterable of strings, matched as whole,
+        case-insensitive words. With mode "all" every word must appear,
+        with mode "any" at least one. Results are ranked by how often the
+        words appear in each status, at most limit of them if given.
+        '''
+        if isinstance(terms, str):
+            terms = [terms]
+        words = {word for term in terms for word in tokenize(term)}
+        if mode not in ("all", "any"):
+            raise ValueError(f'mode must be "all" or "any", not {mode!r}')
+        if not words:
+            return []
+        index = self._word_index()
+        postings = sorted((index.get(word, {}) for word in words), key=len)
+        if mode == "all":
+            matches = set(postings[0])
+            for posting in postings[1:]:
+                matches.intersection_update(posting)
+        else:
+            matches = set().union(*postings)
+        scores = ((sum(posting.get(status_id, 0) for posting in postings), status_id)
+                  for status_id in matches)
+        if limit is None:
+            ranked = sorted(scores, key=ranking_key)
+        else:
+            ranked = nsmallest(limit, scores, key=ranking_key)
+        return [self.database[status_id] for _, status_id in ranked]
+
+    @locks.reading
+    def iter_statuses(self, after=None, limit=100, user_id=None):
+        '''
+        Returns a page of at most limit status messages (all of them if
+        limit is None) in status_id order, starting after the status_id
+        after, or from the first message if after is None
+
+        Pass the status_id of the last message of a page as after to get
+        the next one. A page costs O(log n + limit) on the sorted
+        status_id index, which is built on first use. With user_id, only
+        the messages of that user are paged, on a sorted index of that
+        user's status_ids built the first time the user is paged.
+        '''
+        if user_id is None:
+            index = self._key_index()
+        else:
+            index = self._user_key_index(user_id)
+        status_ids = islice(index.after(after), limit)
+        return [self.database[status_id] for status_id in status_ids]
+
+    def _freeze(self):
+        '''
+        Returns a read-only view of database and marks it as shared
+        '''
+        self._shared = True
+        return MappingProxyType(self.database)
+
+    @locks.reading
+    def snapshot(self):
+        '''
+        Returns a read-only view of status_id -> status message frozen at
+        this point
+
+        The view shares the database until the next mutation, which
+        copies the dict of references (not the messages) and works on
+        the copy, so a long save can iterate the view while writes go on.
+        '''
+        return self._freeze()
+
+    @locks.writing
+    def rotate_journal(self, rotated_filename):
+        '''
+        Moves the journal to rotated_filename and starts an empty one
+
+        Returns a collection over a view frozen at the rotation, which
+        holds every change in the rotated journal and none of those in
+        the new one, so it can be saved while writes go on.
+        '''
+        self.journal.rotate(rotated_filename)
+        frozen = UserStatusCollection()
+        frozen.database = self._freeze()
+        return frozen
+
+    def save_snapshot(self, filename):
+        '''
+        Writes every status message to a binary snapshot file
+        '''
+        snapshot.save(filename, 3, ((status.status_id, status.user_id, status.status_text)
+                                    for status in self.snapshot().values()))
+
+    @classmethod
+    def load_snapshot(cls, filename):
+        '''
+        Returns a new collection backed by a memory-mapped snapshot file
+
+        Status messages are decoded from the file the first time they are
+        accessed.
+        '''
+        collection = cls()
+        collection.database = snapshot.load(filename, UserStatus)
+        return collection
@@ -2,12 +2,25 @@
 Classes for user information for the social network project
 '''
 # pylint: disable=R0903
+from itertools import islice, takewhile
+from types import MappingProxyType
+
+import bulk
+import locks
+import snapshot
+import sorted_keys
+
+PREFIX_FIELDS = ('user_name', 'user_last_name')
 
 
 class Users():
     '''
     Contains user information
+
+    Uses __slots__ instead of a per-instance __dict__ so that large
+    collections only pay for the four attribute references.
     '''
+    __slots__ = ('user_id', 'email', 'user_name', 'user_last_name')
 
     def __init__(self, user_id, email, user_name, user_last_name):
         self.user_id = user_id
@@ -19,42 +32,252 @@ class Users():
 class UserCollection():
     '''
     Contains a collection of Users objects
+
+    With unique_emails=True, adding or modifying a user is rejected when
+    another user already has the same email, ignoring case.
+
+    When journal is set to a journal.Journal, every successful mutation
+    is appended to it.
+
+    With concurrent=True the public methods are guarded by a
+    reader-writer lock, so the collection can be shared between threads;
+    code reading database directly should use snapshot() instead.
     '''
+    JOURNAL_OPERATIONS = {'add': 'add_user', 'modify': 'modify_user', 'delete': 'delete_user'}
 
-    def __init__(self):
+    def __init__(self, unique_emails=False, concurrent=False):
         self.database = {}
+        self.unique_emails = unique_emails
+        self.journal = None
+        self.lock = locks.new_lock(concurrent)
+        # case-folded email -> {user_id: None}, built on first use
+        self._by_email = None
+        # field -> sorted_keys.SortedKeys of (case-folded value, user_id),
+        # built on first use and kept in step with every mutation afterwards
+        self._by_prefix = {}
+        # sorted_keys.SortedKeys of every user_id, built on first use
+        self._sorted_ids = None
+        # True while database is shared with a view returned by snapshot()
+        self._shared = False
+
+    def _prefix_index(self, field):
+        '''
+        Returns the sorted index of field, building it if needed
+        '''
+        if field not in self._by_prefix:
+            self._by_prefix[field] = sorted_keys.SortedKeys(
+                (getattr(user, field).casefold(), user.user_id) for user in self.database.values())
+        return self._by_prefix[field]
+
+    def _key_index(self):
+        '''
+        Returns the sorted user_id index, building it if needed
+        '''
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted_keys.SortedKeys(self.database)
+        return self._sorted_ids
+
+    def _log(self, operation, *fields):
+        '''
+        Appends a mutation to the journal, if there is one
+        '''
+        if self.journal is not None:
+            self.journal.append(operation, *fields)
+
+    def _email_index(self):
+        '''
+        Returns the email index, building it from the database if needed
+        '''
+        if self._by_email is None:
+            # built aside and published at once, as concurrent readers
+            # may build it at the same time
+            by_email = {}
+            for user in self.database.values():
+                by_email.setdefault(user.email.casefold(), {})[user.user_id] = None
+            self._by_email = by_email
+        return self._by_email
+
+    def _email_taken(self, email, user_id):
+        '''
+        Returns True if unique emails are enforced and a user other than
+        user_id has email
+        '''
+        if not self.unique_emails:
+            return False
+        owners = self._email_index().get(email.casefold(), ())
+        return any(owner != user_id for owner in owners)
+
+    def _index(self, user):
+        '''
+        Adds a user to the secondary indexes that have been built
+        '''
+        if self._by_email is not None:
+            self._by_email.setdefault(user.email.casefold(), {})[user.user_id] = None
+        for field, index in self._by_prefix.items():
+            index.add((getattr(user, field).casefold(), user.user_id))
 
+    def _unindex(self, user):
+        '''
+        Removes a user from the secondary indexes that have been built
+        '''
+        if self._by_email is not None:
+            owners = self._by_email[user.email.casefold()]
+            del owners[user.user_id]
+            if not owners:
+                del self._by_email[user.email.casefold()]
+        for field, index in self._by_prefix.items():
+            index.remove((getattr(user, field).casefold(), user.user_id))
+
+    def _add_rejection(self, user_id, email):
+        '''
+        Returns why a new user would be rejected, or None
+        '''
+        if user_id in self.database:
+            return bulk.ALREADY_EXISTS
+        if self._email_taken(email, user_id):
+            return bulk.EMAIL_TAKEN
+        return None
+
+    def _modify_rejection(self, user_id, email):
+        '''
+        Returns why a user modification would be rejected, or None
+        '''
+        if user_id not in self.database:
+            return bulk.DOES_NOT_EXIST
+        if self._email_taken(email, user_id):
+            return bulk.EMAIL_TAKEN
+        return None
+
+    def _writable(self):
+        '''
+        Returns database, first copying it if a snapshot shares it
+        '''
+        if self._shared:
+            self.database = self.database.copy()
+            self._shared = False
+        return self.database
+
+    def _insert(self, user_id, email, user_name, user_last_name):
+        '''
+        Stores a new user, which must not be rejected
+        '''
+        new_user = Users(user_id, email, user_name, user_last_name)
+        self._writable()[user_id] = new_user
+        self._index(new_user)
+        if self._sorted_ids is not None:
+            self._sorted_ids.add(user_id)
+        self._log('add', user_id, email, user_name, user_last_name)
+
+    def _update(self, user_id, email, user_name, user_last_name):
+        '''
+        Modifies an existing user, which must not be rejected
+
+        The user is replaced by a new record rather than changed in
+        place, so snapshots keep seeing the old one.
+        '''
+        self._unindex(self.database[user_id])
+        user = self._writable()[user_id] = Users(user_id, email, user_name, user_last_name)
+        self._index(user)
+        self._log('modify', user_id, email, user_name, user_last_name)
+
+    def _remove(self, user_id):
+        '''
+        Deletes an existing user
+        '''
+        self._unindex(self._writable().pop(user_id))
+        if self._sorted_ids is not None:
+            self._sorted_ids.remove(user_id)
+        self._log('delete', user_id)
+
+    @locks.writing
     def add_user(self, user_id, email, user_name, user_last_name):
         '''
         Adds a new user to the collection
         '''
-        if user_id in self.database:
-            # Rejects new status if status_id already exists
+        if self._add_rejection(user_id, email) is not None:
+            # Rejects new user if user_id or, in unique mode, email already exists
             return False
-        new_user = Users(user_id, email, user_name, user_last_name)
-        self.database[user_id] = new_user
+        self._insert(user_id, email, user_name, user_last_name)
         return True
 
+    @locks.writing
+    def add_users_many(self, rows):
+        '''
+        Adds many users in one call
+
+        rows is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Rows whose user_id already exists, or in unique mode whose
+        email already exists, are rejected.
+        Returns a BulkResult with the number of users added.
+        '''
+        count = 0
+        rejected = []
+        for user_id, email, user_name, user_last_name in rows:
+            reason = self._add_rejection(user_id, email)
+            if reason is not None:
+                rejected.append((user_id, reason))
+                continue
+            self._insert(user_id, email, user_name, user_last_name)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.writing
     def modify_user(self, user_id, email, user_name, user_last_name):
         '''
         Modifies an existing user
         '''
-        if user_id not in self.database:
+        if self._modify_rejection(user_id, email) is not None:
             return False
-        self.database[user_id].email = email
-        self.database[user_id].user_name = user_name
-        self.database[user_id].user_last_name = user_last_name
+        self._update(user_id, email, user_name, user_last_name)
         return True
 
+    @locks.writing
+    def modify_users_many(self, rows):
+        '''
+        Modifies many existing users in one call
+
+        rows is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Returns a BulkResult with the number of users modified.
+        '''
+        count = 0
+        rejected = []
+        for user_id, email, user_name, user_last_name in rows:
+            reason = self._modify_rejection(user_id, email)
+            if reason is not None:
+                rejected.append((user_id, reason))
+                continue
+            self._update(user_id, email, user_name, user_last_name)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.writing
     def delete_user(self, user_id):
         '''
         Deletes an existing user
         '''
         if user_id not in self.database:
             return False
-        del self.database[user_id]
+        self._remove(user_id)
         return True
 
+    @locks.writing
+    def delete_users_many(self, user_ids):
+        '''
+        Deletes many existing users in one call
+
+        Returns a BulkResult with the number of users deleted.
+        '''
+        count = 0
+        rejected = []
+        for user_id in user_ids:
+            if user_id not in self.database:
+                rejected.append((user_id, bulk.DOES_NOT_EXIST))
+                continue
+            self._remove(user_id)
+            count += 1
+        return bulk.BulkResult(count, rejected)
+
+    @locks.reading
     def search_user(self, user_id):
         '''
         Searches for user data
@@ -62,3 +285,97 @@ class UserCollection():
         if user_id not in self.database:
             return Users(None, None, None, None)
         return self.database[user_id]
+
+    @locks.reading
+    def search_user_by_email(self, email):
+        '''
+        Searches for user data by email, ignoring case
+
+        Returns the first user added with that email, or an empty Users
+        object if there is none
+        '''
+        owners = self._email_index().get(email.casefold())
+        if not owners:
+            return Users(None, None, None, None)
+        return self.database[next(iter(owners))]
+
+    @locks.reading
+    def find_users_by_prefix(self, field, prefix, limit=None):
+        '''
+        Returns the users whose field starts with prefix, ignoring case
+
+        field is 'user_name' or 'user_last_name'. Results are ordered by
+        that field, at most limit of them if given. A lookup costs
+        O(log n + k) on the sorted index of the field.
+        '''
+        if field not in PREFIX_FIELDS:
+            raise ValueError(f'field must be one of {PREFIX_FIELDS}, not {field!r}')
+        prefix = prefix.casefold()
+        # (prefix,) sorts before every (value, user_id) with value >= prefix
+        matches = takewhile(lambda entry: entry[0].startswith(prefix),
+                            self._prefix_index(field).after((prefix,)))
+        return [self.database[user_id] for _, user_id in islice(matches, limit)]
+
+    @locks.reading
+    def iter_users(self, after=None, limit=100):
+        '''
+        Returns a page of at most limit users (all of them if limit is
+        None) in user_id order, starting after the user_id after, or from
+        the first user if after is None
+
+        Pass the user_id of the last user of a page as after to get the
+        next one. A page costs O(log n + limit) on the sorted user_id
+        index, which is built on first use.
+        '''
+        return [self.database[user_id]
+                for user_id in islice(self._key_index().after(after), limit)]
+
+    def _freeze(self):
+        '''
+        Returns a read-only view of database and marks it as shared
+        '''
+        self._shared = True
+        return MappingProxyType(self.database)
+
+    @locks.reading
+    def snapshot(self):
+        '''
+        Returns a read-only view of user_id -> user frozen at this point
+
+        The view shares the database until the next mutation, which
+        copies the dict of references (not the users) and works on the
+        copy, so a long save can iterate the view while writes go on.
+        '''
+        return self._freeze()
+
+    @locks.writing
+    def rotate_journal(self, rotated_filename):
+        '''
+        Moves the journal to rotated_filename and starts an empty one
+
+        Returns a collection over a view frozen at the rotation, which
+        holds every change in the rotated journal and none of those in
+        the new one, so it can be saved while writes go on.
+        '''
+        self.journal.rotate(rotated_filename)
+        frozen = UserCollection()
+        frozen.database = self._freeze()
+        return frozen
+
+    def save_snapshot(self, filename):
+        '''
+        Writes every user to a binary snapshot file
+        '''
+        snapshot.save(filename, 4, ((user.user_id, user.email, user.user_name, user.user_last_name)
+                                    for user in self.snapshot().values()))
+
+    @classmethod
+    def load_snapshot(cls, filename):
+        '''
+        Returns a new collection backed by a memory-mapped snapshot file
+
+        Users are decoded from the file the first time they are accessed.
+        '''
+        collection = cls()
+        collection.database = snapshot.load(filename, Users)
+        return collection
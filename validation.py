@@ -0,0 +1,137 @@
+"""
+Single-pass, compiled validation of CSV rows for the loaders
+
+A Schema is compiled against the header of a file into a RowValidator,
+which works on column positions and precompiled patterns instead of
+building and scanning a dict per row. Every violation of a row is
+reported at once, with the line the row starts on.
+"""
+import re
+from csv import reader as read_csv
+from operator import itemgetter
+
+WHITESPACE = re.compile(r'\s')
+
+
+class Schema():
+    '''
+    Columns a CSV file must have, all of them required to be non-empty,
+    and the ones that must not contain whitespace
+    '''
+
+    def __init__(self, columns, no_whitespace=()):
+        self.columns = tuple(columns)
+        self.no_whitespace = tuple(no_whitespace)
+
+    def compile(self, header):
+        '''
+        Returns a RowValidator for files with this header
+
+        Raises KeyError if the header lacks one of the columns.
+        '''
+        for column in self.columns:
+            if column not in header:
+                raise KeyError(column)
+        return RowValidator(self, header)
+
+
+class RowValidator():
+    '''
+    Schema compiled against the header of one file
+    '''
+
+    def __init__(self, schema, header):
+        self.columns = schema.columns
+        self.width = len(header)
+        self.pick = itemgetter(*(header.index(column) for column in self.columns))
+        self.spaceless = [(self.columns.index(column), column) for column in schema.no_whitespace]
+
+    def check(self, row):
+        '''
+        Returns the values of the schema columns in row, in schema order,
+        and the list of violations found in the row
+        '''
+        if len(row) != self.width:
+            return None, [f'expected {self.width} fields, found {len(row)}']
+        values = self.pick(row)
+        errors = []
+        if '' in values:
+            errors = [f'{column} is empty' for column, value in zip(self.columns, values) if not value]
+        for position, column in self.spaceless:
+            if WHITESPACE.search(values[position]):
+                errors.append(f'{column} cannot contain whitespace')
+        return values, errors
+
+
+class ValidationReport():
+    '''
+    Every invalid row found while reading a file, as (line, errors, row)
+    '''
+
+    def __init__(self):
+        self.errors = []
+
+    def add(self, line, errors, row):
+        '''
+        Records the violations of the row starting on line
+        '''
+        self.errors.append((line, errors, row))
+
+    @property
+    def bad_rows(self):
+        '''
+        Number of invalid rows
+        '''
+        return len(self.errors)
+
+    def __str__(self):
+        return '\n'.join(format_error(line, errors, row) for line, errors, row in self.errors)
+
+
+def format_error(line, errors, row):
+    '''
+    Formats the violations of one row for messages and reports
+    '''
+    return f'Line {line}: {"; ".join(errors)}: {row}'
+
+
+def iter_rows(file, schema, report=None, first_line=1):
+    '''
+    Generator over the valid rows of an open CSV file, as tuples of the
+    schema column values. The file starts with the header unless a
+    validator is given as schema, and on line first_line.
+
+    Invalid rows raise ValueError, or are skipped and added to report
+    when one is given. Blank lines are ignored.
+    '''
+    rows = read_csv(file)
+    if isinstance(schema, Schema):
+        validator = schema.compile(next(rows, []))
+    else:
+        validator = schema
+    line = first_line + rows.line_num
+    for row in rows:
+        start, line = line, first_line + rows.line_num
+        if not row:
+            continue
+        values, errors = validator.check(row)
+        if errors:
+            if report is None:
+                raise ValueError(format_error(start, errors, row))
+            report.add(start, errors, row)
+            continue
+        yield values
+
+
+def validate_file(filename, schema):
+    '''
+    Checks every row of a CSV file in one pass and returns a
+    ValidationReport of the invalid ones
+
+    Raises KeyError if the header lacks one of the schema columns.
+    '''
+    report = ValidationReport()
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        for _ in iter_rows(file, schema, report):
+            pass
+    return report